@@ -0,0 +1,9 @@
+"""
+Performance benchmarks for the game server.
+
+    python -m benchmarks run [--quick] [--filter TEXT] [-o results.json]
+    python -m benchmarks compare old.json new.json [--threshold 0.10]
+    python -m benchmarks load [--lobbies 20] [--url http://127.0.0.1:5000]
+    python -m benchmarks tournament BOT BOT ... -o results.jsonl [--sizes 6,8] [--players 2,3]
+    python -m benchmarks ratings results.jsonl
+"""
@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+
+from . import engine, load, report, tournament
+
+
+def _ints(text: str):
+    return [int(x) for x in text.split(",") if x]
+
+
+def cmd_run(args) -> int:
+    sizes = args.sizes or engine.default_sizes()
+    budget = 0.05 if args.quick else args.budget
+    results = engine.run(sizes, args.players, budget=budget, seed=args.seed, name_filter=args.filter,
+                         progress=lambda tag: print(f"  {tag}", file=sys.stderr))
+    if args.output:
+        report.write(results, args.output)
+        print(f"{len(results)} results -> {args.output}", file=sys.stderr)
+    else:
+        json.dump({"meta": report.metadata(), "results": results}, sys.stdout, indent=1, sort_keys=True)
+        print()
+    return 0
+
+
+def cmd_compare(args) -> int:
+    with open(args.old, encoding="utf-8") as f:
+        old = json.load(f)["results"]
+    with open(args.new, encoding="utf-8") as f:
+        new = json.load(f)["results"]
+    rows, regressions = report.compare(old, new, args.threshold)
+
+    width = max((len(r[0]) for r in rows), default=10)
+    for name, a, b, change in rows:
+        mark = "  REGRESSION" if name in regressions else ""
+        print(f"{name:<{width}}  {a:>12.1f}  {b:>12.1f}  {change:+7.1%}{mark}")
+    print(f"\n{len(rows)} compared, {len(regressions)} slower than -{args.threshold:.0%}")
+    return 1 if regressions else 0
+
+
+def cmd_load(args) -> int:
+    sc = load.Scenario(lobbies=args.lobbies, players=args.players, format=args.format,
+                       duration=args.duration, poll_interval=args.interval, workers=args.workers,
+                       seed=args.seed)
+    target = load.HttpTarget(args.url) if args.url else load.InProcessTarget()
+    res = load.run(sc, target, progress=lambda msg: print(f"  {msg}", file=sys.stderr))
+    res["meta"] = report.metadata()
+    print(load.format_report(res), file=sys.stderr)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(res, f, indent=1, sort_keys=True)
+    return 0
+
+
+def cmd_tournament(args) -> int:
+    bots = [tournament.BotSpec.parse(text) for text in args.bots]
+    configs = [tournament.Config(size, players, cascade)
+               for size in args.sizes for players in args.players for cascade in args.cascade]
+    results = tournament.run(bots, configs, args.output, rounds=args.rounds, seed=args.seed,
+                             workers=args.workers, opening=args.opening,
+                             progress=lambda msg: print(f"  {msg}", file=sys.stderr))
+    return _print_ratings(results, args)
+
+
+def cmd_ratings(args) -> int:
+    _, results = tournament.load_results(args.results)
+    return _print_ratings(results, args)
+
+
+def _print_ratings(results, args) -> int:
+    table = tournament.ratings(results, samples=args.bootstrap, seed=args.seed)
+    print(tournament.format_ratings(table))
+    if args.ratings:
+        with open(args.ratings, "w", encoding="utf-8") as f:
+            json.dump({"meta": report.metadata(), "ratings": table}, f, indent=1, sort_keys=True)
+    return 0
+
+
+def _cascade(text: str):
+    values = {"on": True, "off": False}
+    return [values[x] for x in text.split(",") if x]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="run the engine benchmarks")
+    run.add_argument("-o", "--output", help="write JSON here instead of stdout")
+    run.add_argument("--sizes", type=_ints, help="board sizes, e.g. 6,8,16 (default: every format + 24,32)")
+    run.add_argument("--players", type=_ints, default=list(engine.PLAYER_COUNTS), help="player counts, e.g. 2,5")
+    run.add_argument("--budget", type=float, default=0.25, help="seconds per playout benchmark")
+    run.add_argument("--quick", action="store_true", help="short budget, for smoke runs")
+    run.add_argument("--filter", help="only cases whose tag contains this, e.g. 16x16/p2")
+    run.add_argument("--seed", type=int, default=0)
+    run.set_defaults(func=cmd_run)
+
+    cmp = sub.add_parser("compare", help="compare two result files")
+    cmp.add_argument("old")
+    cmp.add_argument("new")
+    cmp.add_argument("--threshold", type=float, default=0.10,
+                     help="flag cases whose ops/sec dropped by more than this fraction")
+    cmp.set_defaults(func=cmd_compare)
+
+    ld = sub.add_parser("load", help="HTTP load test with simulated lobbies and players")
+    ld.add_argument("--lobbies", type=int, default=20)
+    ld.add_argument("--players", type=int, default=3, help="players per lobby, host included")
+    ld.add_argument("--format", default="8x8")
+    ld.add_argument("--duration", type=float, default=30.0, help="seconds of traffic after setup")
+    ld.add_argument("--interval", type=float, default=1.0, help="poll interval per player, seconds")
+    ld.add_argument("--workers", type=int, default=32, help="client threads")
+    ld.add_argument("--url", help="run against this server (e.g. http://127.0.0.1:5000) instead of in-process")
+    ld.add_argument("-o", "--output", help="also write the full JSON report here")
+    ld.add_argument("--seed", type=int, default=0)
+    ld.set_defaults(func=cmd_load)
+
+    tr = sub.add_parser("tournament", help="bot self-play tournament with Elo ratings")
+    tr.add_argument("bots", nargs="+",
+                    help="[name=]kind[:param=value,...], e.g. mcts:iterations=400 ab2=alphabeta:depth=2 greedy random")
+    tr.add_argument("-o", "--output", required=True, help="JSONL results file; an existing one is resumed")
+    tr.add_argument("--sizes", type=_ints, default=[8], help="board sizes, e.g. 6,8")
+    tr.add_argument("--players", type=_ints, default=[2], help="players per game, e.g. 2,3")
+    tr.add_argument("--cascade", type=_cascade, default=[True], help="on, off or on,off")
+    tr.add_argument("--rounds", type=int, default=10, help="games per bot group and seating")
+    tr.add_argument("--workers", type=int, help="worker processes (default: CPU count, 0 = in-process)")
+    tr.add_argument("--seed", type=int, default=0)
+    tr.add_argument("--opening", type=int, default=tournament.OPENING_PLIES,
+                    help="random plies each round's games start from")
+    tr.add_argument("--bootstrap", type=int, default=200, help="resamples for the rating intervals")
+    tr.add_argument("--ratings", help="also write the ratings as JSON here")
+    tr.set_defaults(func=cmd_tournament)
+
+    rt = sub.add_parser("ratings", help="ratings of a tournament results file")
+    rt.add_argument("results")
+    rt.add_argument("--bootstrap", type=int, default=200)
+    rt.add_argument("--seed", type=int, default=0)
+    rt.add_argument("--ratings", help="also write the ratings as JSON here")
+    rt.set_defaults(func=cmd_ratings)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
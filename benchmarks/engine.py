@@ -0,0 +1,165 @@
+"""
+GameEngine micro-benchmarks.
+
+Every (size, players, cascade) combination gets random playouts, timed per
+make_move call and per whole game, plus get_legal_moves/get_state timings on
+positions sampled from those games. Worst-case cases time a single move on a
+prepared board that makes the cascade walk the whole board.
+"""
+from __future__ import annotations
+
+import os
+import random
+import sys
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "server"))
+
+from game_engine import GameEngine
+from lobby_store import FORMATS
+
+from .report import summarize
+
+EXTRA_SIZES = (24, 32)
+PLAYER_COUNTS = (2, 3, 4, 5)
+
+
+def default_sizes() -> List[int]:
+    """Every lobby format plus a couple of larger boards."""
+    sizes = [int(f.split("x")[0]) for f in FORMATS]
+    return sorted(set(sizes) | set(EXTRA_SIZES))
+
+
+def _players(n: int) -> List[str]:
+    return [f"p{i}" for i in range(1, n + 1)]
+
+
+def _timed(fn: Callable[[], object], budget: float, min_samples: int) -> List[int]:
+    samples = []
+    deadline = time.perf_counter() + budget
+    while len(samples) < min_samples or time.perf_counter() < deadline:
+        t0 = time.perf_counter_ns()
+        fn()
+        samples.append(time.perf_counter_ns() - t0)
+    return samples
+
+
+def playout(game: GameEngine, rng: random.Random, move_times: Optional[List[int]] = None) -> int:
+    """Play random legal moves until the game ends; returns the number of moves."""
+    moves = 0
+    while not game.winner:
+        r, c = rng.choice(game.get_legal_moves(game.current_player_num))
+        t0 = time.perf_counter_ns()
+        game.make_move(r, c, game.current_player_id)
+        if move_times is not None:
+            move_times.append(time.perf_counter_ns() - t0)
+        moves += 1
+    return moves
+
+
+def snake_position(size: int, players: int) -> GameEngine:
+    """
+    Worst case for the cascade: player 1 fills the board except for a one
+    cell wide snake of opponent pieces running row by row (rows 1, 3, 5, ...
+    joined at alternating ends). Each snake cell can only be captured once the
+    one before it is, so playing the empty corner (0, 0) flips about half the
+    board one cell per cascade step. Opponents take turns owning snake rows.
+    """
+    cells = bytearray([1]) * (size * size)
+    cells[0] = 0
+    opponents = list(range(2, players + 1))
+    for k, row in enumerate(range(1, size, 2)):
+        owner = opponents[k % len(opponents)]
+        cells[row * size:(row + 1) * size] = bytes([owner]) * size
+        if row + 2 < size:
+            # connector in the next row, on the side the snake turns at
+            col = size - 1 if k % 2 == 0 else 0
+            cells[(row + 1) * size + col] = owner
+    return GameEngine.from_cells(size, _players(players), bytes(cells), 0, None, 0)
+
+
+def engine_cases(size: int, players: int, cascade: bool, budget: float,
+                 seed: int) -> Dict[str, dict]:
+    tag = f"{size}x{size}/p{players}/cascade-{'on' if cascade else 'off'}"
+    rng = random.Random(f"{seed}/{tag}")
+    ids = _players(players)
+    res: Dict[str, dict] = {}
+
+    move_times: List[int] = []
+    game_times: List[int] = []
+    positions: List[GameEngine] = []
+    deadline = time.perf_counter() + budget
+    while len(game_times) < 3 or time.perf_counter() < deadline:
+        game = GameEngine(size, ids)
+        game.cascade_enabled = cascade
+        # Keep a few mid-game positions for the read-only benchmarks
+        stop = rng.randrange(size * size // 4, size * size * 3 // 4)
+        t0 = time.perf_counter_ns()
+        for _ in range(stop):
+            if game.winner:
+                break
+            r, c = rng.choice(game.get_legal_moves(game.current_player_num))
+            t1 = time.perf_counter_ns()
+            game.make_move(r, c, game.current_player_id)
+            move_times.append(time.perf_counter_ns() - t1)
+        if len(positions) < 16:
+            pause = time.perf_counter_ns()
+            positions.append(game.copy())
+            t0 += time.perf_counter_ns() - pause
+        playout(game, rng, move_times)
+        game_times.append(time.perf_counter_ns() - t0)
+
+    res[f"make_move/{tag}"] = summarize(move_times)
+    res[f"playout/{tag}"] = summarize(game_times)
+
+    def round_robin(call: Callable[[GameEngine], object]) -> Callable[[], object]:
+        it = iter(())
+
+        def step():
+            nonlocal it
+            g = next(it, None)
+            if g is None:
+                it = iter(positions)
+                g = next(it)
+            return call(g)
+        return step
+
+    res[f"get_legal_moves/{tag}"] = summarize(_timed(
+        round_robin(lambda g: g.get_legal_moves(g.current_player_num)), budget / 4, 50))
+    res[f"get_state/{tag}"] = summarize(_timed(round_robin(lambda g: g.get_state()), budget / 4, 50))
+    res[f"get_state_packed/{tag}"] = summarize(_timed(
+        round_robin(lambda g: g.get_state(board_format="packed")), budget / 4, 50))
+
+    worst = snake_position(size, players)
+    worst.cascade_enabled = cascade
+    flips = len(worst.copy().apply((0, 0)).flips)
+
+    # Only apply() is timed; undo() puts the board back for the next sample
+    samples = []
+    deadline = time.perf_counter() + budget / 4
+    while len(samples) < 20 or time.perf_counter() < deadline:
+        t0 = time.perf_counter_ns()
+        delta = worst.apply((0, 0))
+        samples.append(time.perf_counter_ns() - t0)
+        worst.undo(delta)
+
+    entry = summarize(samples)
+    entry["flips"] = flips
+    res[f"worst_cascade/{tag}"] = entry
+    return res
+
+
+def run(sizes: Iterable[int], players: Iterable[int] = PLAYER_COUNTS, budget: float = 0.25,
+        seed: int = 0, name_filter: Optional[str] = None, progress=None) -> Dict[str, dict]:
+    results: Dict[str, dict] = {}
+    for size in sizes:
+        for n in players:
+            for cascade in (True, False):
+                tag = f"{size}x{size}/p{n}/cascade-{'on' if cascade else 'off'}"
+                if name_filter and name_filter not in tag:
+                    continue
+                if progress:
+                    progress(tag)
+                results.update(engine_cases(size, n, cascade, budget, seed))
+    return results
@@ -0,0 +1,343 @@
+"""
+HTTP load test: many lobbies at once, every player a simulated browser tab.
+
+Setup creates the lobbies (create, joins, start) concurrently. Then each
+player polls /api/game/<code> (packed board, ?since= and If-None-Match, like
+game.html) and /api/lobbies/<code> once per poll interval and moves when it
+is their turn. Ticks are scheduled on a thread pool; when the pool can't keep
+up, ticks start late, and that lag is reported next to per-endpoint latency.
+
+In-process runs (the default) drive create_app() through Flask test clients
+and also report store and lobby lock contention from the store's own lock
+timers (the histograms behind /metrics).
+With --url the same traffic goes to a running server over HTTP.
+"""
+from __future__ import annotations
+
+import base64
+import heapq
+import http.client
+import itertools
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "server"))
+
+from metrics import LOCK_BUCKETS
+
+from .report import percentiles, throughput
+
+
+@dataclass
+class Scenario:
+    lobbies: int = 20
+    players: int = 3             # per lobby, host included
+    format: str = "8x8"
+    duration: float = 30.0       # seconds of steady-state traffic after setup
+    poll_interval: float = 1.0
+    workers: int = 32
+    seed: int = 0
+
+
+# ---- targets ----
+
+class InProcessTarget:
+    """The real Flask app, called through one test client per thread."""
+
+    def __init__(self, app=None):
+        if app is None:
+            from app import create_app
+            app = create_app()
+        self.app = app
+        self.store = app.extensions.get("lobby_store")
+        self._local = threading.local()
+
+    def request(self, method: str, path: str, body: Optional[dict] = None,
+                headers: Optional[dict] = None) -> Tuple[int, Optional[dict], dict]:
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        res = client.open(path, method=method, json=body, headers=headers)
+        data = res.get_json(silent=True) if res.status_code != 304 else None
+        return res.status_code, data, dict(res.headers)
+
+
+class HttpTarget:
+    """A server already running at base_url; one keep-alive connection per thread."""
+
+    store = None
+
+    def __init__(self, base_url: str):
+        parts = urlsplit(base_url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self._local = threading.local()
+
+    def _conn(self) -> http.client.HTTPConnection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+        return conn
+
+    def request(self, method: str, path: str, body: Optional[dict] = None,
+                headers: Optional[dict] = None) -> Tuple[int, Optional[dict], dict]:
+        headers = dict(headers or {})
+        payload = None
+        if body is not None:
+            payload = json.dumps(body).encode()
+            headers["Content-Type"] = "application/json"
+        for attempt in (0, 1):
+            conn = self._conn()
+            try:
+                conn.request(method, path, body=payload, headers=headers)
+                res = conn.getresponse()
+                raw = res.read()
+                break
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                self._local.conn = None
+                if attempt:
+                    raise
+        data = json.loads(raw) if raw and res.status != 304 else None
+        return res.status, data, dict(res.getheaders())
+
+
+# ---- lock contention ----
+
+def lock_snapshot(store) -> Dict[str, tuple]:
+    """
+    Current wait/hold histograms of the store's lock timers (metrics.LockTimer).
+    Every lock LobbyStore makes reports into them, lobbies created mid-run too.
+    """
+    return {t.name: (t.wait.snapshot(), t.hold.snapshot()) for t in store.lock_timers}
+
+
+def _bucket_quantile(bounds, counts: List[int], q: float) -> Optional[float]:
+    """Upper bound (us) of the bucket holding the q-quantile; None if empty or past the last bound."""
+    n = sum(counts)
+    if not n:
+        return None
+    seen = 0
+    for bound, c in zip(bounds, counts):
+        seen += c
+        if seen > q * n:
+            return round(bound * 1e6, 3)
+    return None
+
+
+def lock_report(before: Dict[str, tuple], after: Dict[str, tuple]) -> Dict[str, dict]:
+    """What the locks did between two lock_snapshot() calls."""
+    res = {}
+    for name, ((wait, wait_sum), (hold, hold_sum)) in after.items():
+        (wait0, wait_sum0), (hold0, hold_sum0) = before.get(name, (([0] * len(wait), 0.0), ([0] * len(hold), 0.0)))
+        wait = [a - b for a, b in zip(wait, wait0)]
+        hold = [a - b for a, b in zip(hold, hold0)]
+        res[name] = {
+            "acquisitions": sum(hold),
+            "wait_ms_total": round((wait_sum - wait_sum0) * 1e3, 3),
+            "hold_ms_total": round((hold_sum - hold_sum0) * 1e3, 3),
+        }
+        for q in (0.5, 0.95, 0.99):
+            res[name][f"wait_p{round(q * 100)}_us"] = _bucket_quantile(LOCK_BUCKETS, wait, q)
+            res[name][f"hold_p{round(q * 100)}_us"] = _bucket_quantile(LOCK_BUCKETS, hold, q)
+    return res
+
+
+# ---- simulated players ----
+
+class Recorder:
+    def __init__(self):
+        self.samples: Dict[str, List[int]] = {}
+        self.errors: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def call(self, target, label: str, method: str, path: str, body: Optional[dict] = None,
+             headers: Optional[dict] = None, ok=(200,)) -> Tuple[int, Optional[dict], dict]:
+        t0 = time.perf_counter_ns()
+        try:
+            status, data, res_headers = target.request(method, path, body, headers)
+        except (OSError, http.client.HTTPException):
+            status, data, res_headers = 0, None, {}
+        took = time.perf_counter_ns() - t0
+        with self._lock:
+            self.samples.setdefault(label, []).append(took)
+            if status not in ok:
+                self.errors[label] = self.errors.get(label, 0) + 1
+        return status, data, res_headers
+
+    def report(self, wall_seconds: float) -> Dict[str, dict]:
+        return {label: throughput(s, wall_seconds, self.errors.get(label, 0))
+                for label, s in sorted(self.samples.items())}
+
+
+def decode_board(data: str, size: int, fmt: str) -> bytearray:
+    raw = base64.b64decode(data)
+    n = size * size
+    if fmt == "packed" and len(raw) != n:
+        digits = format(int.from_bytes(raw, "big"), "o").rjust(n, "0")
+        return bytearray(int(d) for d in digits)
+    return bytearray(raw)
+
+
+class Player:
+    def __init__(self, code: str, player_id: str, size: int, rng: random.Random):
+        self.code = code
+        self.player_id = player_id
+        self.size = size
+        self.rng = rng
+        self.board: Optional[bytearray] = None
+        self.version: Optional[int] = None
+        self.etag: Optional[str] = None
+        self.my_turn = False
+        self.game_over = False
+
+    def tick(self, target, rec: Recorder) -> int:
+        """One poll cycle; returns the number of moves made."""
+        self._poll_game(target, rec)
+        rec.call(target, "GET /api/lobbies/<code>", "GET",
+                 f"/api/lobbies/{self.code}?player_id={self.player_id}")
+        if not self.my_turn or self.game_over:
+            return 0
+        return self._move(target, rec)
+
+    def _poll_game(self, target, rec: Recorder) -> None:
+        path = f"/api/game/{self.code}?player_id={self.player_id}&board=packed"
+        if self.board is not None and self.version is not None:
+            path += f"&since={self.version}"
+        headers = {"If-None-Match": self.etag} if self.etag else None
+        status, data, res_headers = rec.call(target, "GET /api/game/<code>", "GET", path,
+                                             headers=headers, ok=(200, 304))
+        if status != 200 or not data:
+            return
+        self.etag = res_headers.get("ETag")
+        if "board" in data:
+            self.board = decode_board(data["board"], self.size, data.get("board_format", "packed"))
+        elif self.board is not None:
+            for m in data.get("moves", []):
+                self.board[m["r"] * self.size + m["c"]] = m["p"]
+                for r, c in m["flips"]:
+                    self.board[r * self.size + c] = m["p"]
+        self.version = data.get("version")
+        self.my_turn = data.get("current_player_id") == self.player_id
+        self.game_over = bool(data.get("game_over"))
+
+    def _move(self, target, rec: Recorder) -> int:
+        empty = [i for i, v in enumerate(self.board or ()) if v == 0]
+        # Early-game adjacency rules can reject a cell; a real player would try another
+        for cell in self.rng.sample(empty, min(5, len(empty))):
+            r, c = divmod(cell, self.size)
+            status, _, _ = rec.call(target, "POST /api/game/<code>/move", "POST",
+                                    f"/api/game/{self.code}/move",
+                                    {"player_id": self.player_id, "r": r, "c": c}, ok=(200, 400))
+            if status == 200:
+                self.my_turn = False
+                return 1
+        return 0
+
+
+def setup_lobby(target, rec: Recorder, sc: Scenario, i: int, size: int) -> List[Player]:
+    rng = random.Random(f"{sc.seed}/{i}")
+    status, data, _ = rec.call(target, "POST /api/lobbies", "POST", "/api/lobbies",
+                               {"nick": f"host{i}", "format": sc.format})
+    if status != 200:
+        return []
+    code = data["code"]
+    players = [Player(code, data["player_id"], size, rng)]
+    for k in range(1, sc.players):
+        status, joined, _ = rec.call(target, "POST /api/lobbies/<code>/join", "POST",
+                                     f"/api/lobbies/{code}/join", {"nick": f"p{i}-{k}"})
+        if status == 200:
+            players.append(Player(code, joined["player_id"], size, rng))
+    rec.call(target, "POST /api/lobbies/<code>/start", "POST", f"/api/lobbies/{code}/start",
+             {"player_id": players[0].player_id})
+    return players
+
+
+def run(sc: Scenario, target=None, progress=None) -> dict:
+    target = target or InProcessTarget()
+    size = int(sc.format.split("x")[0])
+    say = progress or (lambda msg: None)
+
+    setup = Recorder()
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(sc.workers) as pool:
+        lobbies = list(pool.map(lambda i: setup_lobby(target, setup, sc, i, size), range(sc.lobbies)))
+    setup_wall = time.perf_counter() - t0
+    players = [p for lobby in lobbies for p in lobby]
+    say(f"setup: {len(lobbies)} lobbies, {len(players)} players in {setup_wall:.1f}s")
+
+    locks = lock_snapshot(target.store) if target.store is not None else None
+
+    rec = Recorder()
+    lag: List[int] = []
+    moves = itertools.count()
+    missed = itertools.count()
+    interval_ns = int(sc.poll_interval * 1e9)
+    rng = random.Random(sc.seed)
+    start = time.perf_counter_ns()
+    end = start + int(sc.duration * 1e9)
+    # (due, n, player): each player ticks once per interval, first ticks spread out
+    heap = [(start + int(rng.random() * interval_ns), n, p) for n, p in enumerate(players)]
+    heapq.heapify(heap)
+    wake = threading.Condition()
+
+    def tick(due: int, n: int, player: Player) -> None:
+        lag.append(time.perf_counter_ns() - due)
+        for _ in range(player.tick(target, rec)):
+            next(moves)
+        nxt = due + interval_ns
+        now = time.perf_counter_ns()
+        if nxt < now - interval_ns:
+            # Far behind: drop the missed ticks instead of bursting them
+            next(missed)
+            nxt = now
+        with wake:
+            heapq.heappush(heap, (nxt, n, player))
+            wake.notify()
+
+    with ThreadPoolExecutor(sc.workers) as pool:
+        with wake:
+            while True:
+                now = time.perf_counter_ns()
+                if now >= end:
+                    break
+                if heap and heap[0][0] <= now:
+                    pool.submit(tick, *heapq.heappop(heap))
+                    continue
+                due = heap[0][0] if heap else end
+                wake.wait((min(due, end) - now) / 1e9)
+        say("draining")
+    wall = (time.perf_counter_ns() - start) / 1e9
+
+    games_over = len({p.code for p in players if p.game_over})
+    return {
+        "scenario": asdict(sc),
+        "setup": {"wall_s": round(setup_wall, 3), "endpoints": setup.report(setup_wall)},
+        "wall_s": round(wall, 3),
+        "endpoints": rec.report(wall),
+        "moves": next(moves),
+        "games_finished": games_over,
+        "schedule_lag_ms": dict(percentiles(lag, unit=1e6), missed_ticks=next(missed)),
+        "locks": lock_report(locks, lock_snapshot(target.store)) if locks else None,
+    }
+
+
+def format_report(res: dict) -> str:
+    lines = [f"{'endpoint':<34} {'n':>7} {'err':>5} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"]
+    for label, e in res["endpoints"].items():
+        lines.append(f"{label:<34} {e['n']:>7} {e['errors']:>5} {e['rps']:>8} "
+                     f"{e['p50_ms']:>8} {e['p95_ms']:>8} {e['p99_ms']:>8}")
+    lag = res["schedule_lag_ms"]
+    lines.append(f"\nmoves {res['moves']}, finished games {res['games_finished']}, "
+                 f"tick lag p50/p99 {lag['p50']}/{lag['p99']} ms, missed ticks {lag['missed_ticks']}")
+    for name, s in (res["locks"] or {}).items():
+        lines.append(f"{name} lock: {s['acquisitions']} acquisitions, wait {s['wait_ms_total']} ms total, "
+                     f"wait p99 <= {s['wait_p99_us']} us, hold p99 <= {s['hold_p99_us']} us")
+    return "\n".join(lines)
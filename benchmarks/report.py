@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import json
+import platform
+import subprocess
+import sys
+import time
+from typing import Dict, List, Tuple
+
+
+def percentiles(samples_ns: List[int], unit: float = 1000) -> dict:
+    """p50/p95/p99/max of timed samples, in `unit` ns (default: microseconds)."""
+    s = sorted(samples_ns)
+    n = len(s)
+    if not n:
+        return {"p50": None, "p95": None, "p99": None, "max": None}
+
+    def pct(q: float) -> float:
+        return round(s[min(n - 1, int(q * n))] / unit, 3)
+
+    return {"p50": pct(0.50), "p95": pct(0.95), "p99": pct(0.99), "max": round(s[-1] / unit, 3)}
+
+
+def summarize(samples_ns: List[int], ops_per_sample: int = 1) -> dict:
+    """ops/sec and latency percentiles (microseconds per sample) of timed samples."""
+    total = sum(samples_ns)
+    n = len(samples_ns)
+    res = {
+        "n": n * ops_per_sample,
+        "ops_per_sec": round(n * ops_per_sample / (total / 1e9), 1) if total else None,
+    }
+    res.update({f"{k}_us": v for k, v in percentiles(samples_ns).items()})
+    return res
+
+
+def throughput(samples_ns: List[int], wall_seconds: float, errors: int = 0) -> dict:
+    """Requests/sec over a wall-clock window and latency percentiles in milliseconds."""
+    res = {
+        "n": len(samples_ns),
+        "errors": errors,
+        "rps": round(len(samples_ns) / wall_seconds, 1) if wall_seconds else None,
+    }
+    res.update({f"{k}_ms": v for k, v in percentiles(samples_ns, unit=1e6).items()})
+    return res
+
+
+def metadata() -> dict:
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                             text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        rev = None
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "git_rev": rev,
+    }
+
+
+def write(results: Dict[str, dict], path: str) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"meta": metadata(), "results": results}, f, indent=1, sort_keys=True)
+
+
+def compare(old: Dict[str, dict], new: Dict[str, dict], threshold: float) -> Tuple[List[tuple], List[str]]:
+    """
+    Rows (case, old ops/s, new ops/s, change) for cases present in both runs,
+    and the names of cases whose throughput dropped by more than `threshold`.
+    """
+    rows, regressions = [], []
+    for name in sorted(old.keys() & new.keys()):
+        a, b = old[name].get("ops_per_sec"), new[name].get("ops_per_sec")
+        if not a or not b:
+            continue
+        change = b / a - 1
+        rows.append((name, a, b, change))
+        if change < -threshold:
+            regressions.append(name)
+    return rows, regressions
@@ -0,0 +1,394 @@
+"""
+Self-play tournaments between server bots, with Elo ratings.
+
+Every configuration (board size x player count x cascade rule) plays each
+group of `players` bots, in every seat rotation, `rounds` times. Games run in
+a process pool and each result is appended to a JSONL file as soon as it is
+in, so an interrupted run resumes by skipping the games already in the file.
+
+Each game's seed comes from the tournament seed and the game's key, not from
+scheduling, so a run gives the same games whatever the worker count or resume
+points -- as long as the bots have fixed budgets (MCTS iterations, alpha-beta
+depth). Bots with a time budget ("time=") play differently on every run.
+
+Every round starts a group's games from its own random opening (`opening`
+plies, the same for all seat rotations), so deterministic bots don't just
+replay one game per seating `rounds` times.
+
+Ratings are a Bradley-Terry (Elo scale) fit of pairwise results: in a game,
+seat A beats seat B if A ends with more cells, equal counts are a draw. The
+confidence intervals come from bootstrap resampling of whole games, taken in
+schedule order and with repeated games (same seats, same moves) counted once.
+"""
+from __future__ import annotations
+
+import hashlib
+import itertools
+import json
+import math
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "server"))
+
+from bots import AlphaBetaBot, Bot, MCTSBot, _greedy_move, candidate_moves
+from game_engine import GameEngine
+
+# Elo of a bot of average strength
+ELO_BASE = 1500.0
+# Random plies every game starts from (see schedule)
+OPENING_PLIES = 2
+
+
+class RandomBot(Bot):
+    """Uniformly random legal move; the floor of every rating list."""
+
+    kind = "random"
+
+    def __init__(self, seed: Optional[int] = None):
+        self._rng = random.Random(seed)
+
+    def choose_move(self, engine: GameEngine) -> Optional[Tuple[int, int]]:
+        return engine.random_legal_move(self._rng)
+
+
+class GreedyBot(Bot):
+    """Move with the most flips, no lookahead."""
+
+    kind = "greedy"
+
+    def choose_move(self, engine: GameEngine) -> Optional[Tuple[int, int]]:
+        moves = candidate_moves(engine)
+        return divmod(_greedy_move(engine, moves), engine.size) if moves else None
+
+
+# kind -> parameter -> (constructor argument, type)
+_PARAMS = {
+    "mcts": {"iterations": ("iterations", int), "time": ("time_budget", float),
+             "exploration": ("exploration", float), "rollout": ("rollout_depth", int)},
+    "alphabeta": {"depth": ("max_depth", int), "time": ("time_budget", float)},
+    "greedy": {},
+    "random": {},
+}
+# Budgets used when a spec gives none, so that games are reproducible
+_DEFAULTS = {"mcts": {"iterations": 200}, "alphabeta": {"depth": 2}}
+
+
+@dataclass(frozen=True)
+class BotSpec:
+    """A bot as written on the command line: "[name=]kind[:param=value,...]"."""
+
+    name: str
+    kind: str
+    params: Tuple[Tuple[str, str], ...]
+
+    @classmethod
+    def parse(cls, text: str) -> "BotSpec":
+        name, sep, rest = text.partition("=")
+        if not sep or ":" in name:
+            name, rest = text, text
+        kind, _, args = rest.partition(":")
+        if kind not in _PARAMS:
+            raise ValueError(f"Unknown bot kind: {kind} (expected one of {', '.join(_PARAMS)})")
+        params = []
+        for item in filter(None, args.split(",")):
+            key, _, value = item.partition("=")
+            if key not in _PARAMS[kind]:
+                raise ValueError(f"Unknown parameter for {kind}: {key}")
+            _PARAMS[kind][key][1](value)  # type check now rather than in a worker
+            params.append((key, value))
+        return cls(name, kind, tuple(params))
+
+    def make(self, seed: int) -> Bot:
+        given = dict(self.params)
+        if "time" not in given:
+            given = {**_DEFAULTS.get(self.kind, {}), **given}
+        kwargs = {}
+        for key, value in given.items():
+            arg, typ = _PARAMS[self.kind][key]
+            kwargs[arg] = typ(value)
+        if self.kind == "random":
+            return RandomBot(seed)
+        if self.kind == "greedy":
+            return GreedyBot()
+        # Without "time" the budget is the only limit
+        kwargs.setdefault("time_budget", math.inf)
+        if self.kind == "mcts":
+            return MCTSBot(seed=seed, **kwargs)
+        return AlphaBetaBot(seed=seed, **kwargs)
+
+
+@dataclass
+class Config:
+    size: int
+    players: int
+    cascade: bool
+
+    @property
+    def tag(self) -> str:
+        return f"{self.size}x{self.size}/p{self.players}/cascade-{'on' if self.cascade else 'off'}"
+
+
+def _opening(cfg: Config, plies: int, rng: random.Random) -> List[Tuple[int, int]]:
+    game = GameEngine(cfg.size, [str(i) for i in range(cfg.players)])
+    game.cascade_enabled = cfg.cascade
+    moves = []
+    while len(moves) < plies and not game.winner:
+        r, c = rng.choice(game.get_legal_moves(game.current_player_num))
+        game.make_move(r, c, game.current_player_id)
+        moves.append((r, c))
+    return moves
+
+
+def schedule(bots: List[BotSpec], configs: Iterable[Config], rounds: int, seed: int,
+             opening: int = OPENING_PLIES) -> List[dict]:
+    """Every game of the tournament, as job dicts for play_game, in a fixed order."""
+    jobs = []
+    for cfg in configs:
+        if len(bots) < cfg.players:
+            raise ValueError(f"{cfg.tag} needs at least {cfg.players} bots")
+        for rnd in range(rounds):
+            for group in itertools.combinations(bots, cfg.players):
+                names = ",".join(b.name for b in group)
+                moves = _opening(cfg, opening, random.Random(f"{seed}/{cfg.tag}/r{rnd}/{names}"))
+                for rot in range(cfg.players):
+                    seats = group[rot:] + group[:rot]
+                    key = f"{cfg.tag}/r{rnd}/" + ",".join(b.name for b in seats)
+                    jobs.append({
+                        "key": key,
+                        "config": cfg.tag,
+                        "size": cfg.size,
+                        "cascade": cfg.cascade,
+                        "seats": [(b.name, b.kind, b.params) for b in seats],
+                        "opening": moves,
+                        "seed": random.Random(f"{seed}/{key}").getrandbits(32),
+                    })
+    return jobs
+
+
+def play_game(job: dict) -> dict:
+    """Play one scheduled game to the end (runs in a pool worker)."""
+    seats = [BotSpec(*s) for s in job["seats"]]
+    rng = random.Random(job["seed"])
+    game = GameEngine(job["size"], [str(i) for i in range(len(seats))])
+    game.cascade_enabled = job["cascade"]
+    bots = [spec.make(rng.getrandbits(32)) for spec in seats]
+    for r, c in job.get("opening", ()):
+        game.make_move(r, c, game.current_player_id)
+
+    started = time.perf_counter()
+    while not game.winner:
+        move = bots[game.turn_idx].choose_move(game)
+        if move is None or not game.make_move(*move, game.current_player_id)["ok"]:
+            raise RuntimeError(f"{seats[game.turn_idx].name} made an illegal move {move} in {job['key']}")
+    scores = game.get_state(include_board=False)["scores"]
+    return {
+        "key": job["key"],
+        "config": job["config"],
+        "seats": [s.name for s in seats],
+        "scores": [scores[pid] for pid in game.players],
+        "winner": None if game.winner == "draw" else int(game.winner),
+        "moves": len(game.history),
+        # Fingerprint of the move sequence, to spot games played twice
+        "trace": hashlib.blake2b(bytes(str([d.cell for d in game.history]), "ascii"),
+                                 digest_size=8).hexdigest(),
+        "seconds": round(time.perf_counter() - started, 4),
+    }
+
+
+def load_results(path: str) -> Tuple[Optional[dict], List[dict]]:
+    """
+    Header and game results of a results file. A torn last line (the run was
+    killed mid-write) is cut off so the file can be appended to again.
+    """
+    if not os.path.exists(path):
+        return None, []
+    header, results = None, []
+    with open(path, "r+b") as f:
+        good = 0
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                break
+            if not line.endswith(b"\n"):
+                break
+            good += len(line)
+            if "header" in rec:
+                header = rec["header"]
+            else:
+                results.append(rec)
+        f.truncate(good)
+    return header, results
+
+
+def run(bots: List[BotSpec], configs: List[Config], output: str, rounds: int = 1, seed: int = 0,
+        workers: Optional[int] = None, progress: Optional[Callable[[str], None]] = None,
+        opening: int = OPENING_PLIES) -> List[dict]:
+    """
+    Play every scheduled game not yet in `output`, appending results as they
+    finish. workers=0 plays in this process. Returns all results in the file.
+    """
+    names = [b.name for b in bots]
+    if len(set(names)) != len(names):
+        raise ValueError("Bot names must be unique (use name=kind:...)")
+    jobs = schedule(bots, configs, rounds, seed, opening)
+
+    header, results = load_results(output)
+    if header is not None and header.get("seed") != seed:
+        raise ValueError(f"{output} was played with seed {header.get('seed')}, not {seed}")
+    if header is not None and header.get("opening", 0) != opening:
+        raise ValueError(f"{output} was played with {header.get('opening', 0)}-ply openings, not {opening}")
+    done = {r["key"] for r in results}
+    todo = [job for job in jobs if job["key"] not in done]
+    if progress and done:
+        progress(f"resuming: {len(jobs) - len(todo)} of {len(jobs)} games already played")
+
+    started = time.perf_counter()
+    last_report = started
+
+    def record(res: dict, f) -> None:
+        nonlocal last_report
+        f.write(json.dumps(res, separators=(",", ":")) + "\n")
+        f.flush()
+        results.append(res)
+        now = time.perf_counter()
+        finished = len(results) - len(done)
+        if progress and (now - last_report >= 1.0 or finished == len(todo)):
+            last_report = now
+            rate = finished / (now - started)
+            eta = (len(todo) - finished) / rate if rate else 0.0
+            progress(f"{finished}/{len(todo)} games  {rate:.2f} games/s  eta {eta:.0f}s")
+
+    with open(output, "a", encoding="utf-8") as f:
+        if header is None:
+            f.write(json.dumps({"header": {"seed": seed, "opening": opening, "bots": names,
+                                           "configs": [c.tag for c in configs]}}) + "\n")
+        if workers == 0:
+            for job in todo:
+                record(play_game(job), f)
+        elif todo:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [pool.submit(play_game, job) for job in todo]
+                for fut in as_completed(futures):
+                    record(fut.result(), f)
+    return results
+
+
+# -------- ratings --------
+
+def _pairwise(results: List[dict]) -> Tuple[Dict[str, float], Dict[Tuple[str, str], int]]:
+    """Points per bot (win 1, draw 1/2) and games per unordered pair, over every seat pair."""
+    points: Dict[str, float] = {}
+    games: Dict[Tuple[str, str], int] = {}
+    for res in results:
+        seats, scores = res["seats"], res["scores"]
+        for i, j in itertools.combinations(range(len(seats)), 2):
+            a, b = seats[i], seats[j]
+            if a == b:
+                continue
+            pair = (a, b) if a < b else (b, a)
+            games[pair] = games.get(pair, 0) + 1
+            if scores[i] == scores[j]:
+                points[a] = points.get(a, 0.0) + 0.5
+                points[b] = points.get(b, 0.0) + 0.5
+            else:
+                winner = a if scores[i] > scores[j] else b
+                points[winner] = points.get(winner, 0.0) + 1.0
+    return points, games
+
+
+def fit_elo(results: List[dict], names: List[str], iterations: int = 200) -> Dict[str, float]:
+    """
+    Bradley-Terry strengths by minorization-maximization, on the Elo scale
+    with the average bot at ELO_BASE. Every bot also gets one virtual draw
+    against an average opponent, which keeps all-win or all-loss records finite.
+    """
+    points, games = _pairwise(results)
+    gamma = {n: 1.0 for n in names}
+    for _ in range(iterations):
+        new = {}
+        for n in names:
+            denom = 2.0 / (gamma[n] + 1.0)  # the virtual draw (opponent strength 1)
+            for (a, b), k in games.items():
+                if a == n:
+                    denom += k / (gamma[n] + gamma[b])
+                elif b == n:
+                    denom += k / (gamma[n] + gamma[a])
+            new[n] = (points.get(n, 0.0) + 1.0) / denom
+        # Rescale to geometric mean 1 (ratings are only defined up to a shift)
+        mean = math.exp(sum(math.log(g) for g in new.values()) / len(new))
+        gamma = {n: g / mean for n, g in new.items()}
+    return {n: ELO_BASE + 400.0 * math.log10(g) for n, g in gamma.items()}
+
+
+def _schedule_order(res: dict) -> Tuple[str, int]:
+    # key = "<config tag>/r<round>/<seats>"
+    _, rnd, seats = res["key"].rsplit("/", 2)
+    return seats, int(rnd[1:])
+
+
+def ratings(results: List[dict], samples: int = 200, seed: int = 0) -> Dict[str, List[dict]]:
+    """
+    Per configuration, the bots best first, each {"bot", "elo", "lo", "hi",
+    "games", "score"}: lo/hi are a 95% bootstrap interval of the Elo.
+    Results are put in schedule order first (files are in completion order,
+    which depends on the workers) and games repeated move for move by the
+    same seats are counted once, so the intervals only depend on the games.
+    """
+    by_config: Dict[str, List[dict]] = {}
+    seen = set()
+    for res in sorted(results, key=lambda r: (r["config"], _schedule_order(r))):
+        trace = res.get("trace")
+        if trace is not None:
+            if (res["config"], tuple(res["seats"]), trace) in seen:
+                continue
+            seen.add((res["config"], tuple(res["seats"]), trace))
+        by_config.setdefault(res["config"], []).append(res)
+
+    table = {}
+    for config, games in sorted(by_config.items()):
+        names = sorted({n for g in games for n in g["seats"]})
+        elo = fit_elo(games, names)
+        rng = random.Random(f"{seed}/{config}")
+        boot: Dict[str, List[float]] = {n: [] for n in names}
+        for _ in range(samples):
+            sample = [games[rng.randrange(len(games))] for _ in games]
+            for n, value in fit_elo(sample, names, iterations=50).items():
+                boot[n].append(value)
+
+        points, _ = _pairwise(games)
+        pairs = {n: 0 for n in names}
+        for g in games:
+            for n in g["seats"]:
+                pairs[n] += len(g["seats"]) - 1
+        rows = []
+        for n in names:
+            values = sorted(boot[n])
+            rows.append({
+                "bot": n,
+                "elo": round(elo[n], 1),
+                "lo": round(values[int(0.025 * (len(values) - 1))], 1) if values else None,
+                "hi": round(values[int(0.975 * (len(values) - 1))], 1) if values else None,
+                "games": sum(1 for g in games if n in g["seats"]),
+                "score": round(points.get(n, 0.0) / pairs[n], 3) if pairs[n] else None,
+            })
+        rows.sort(key=lambda r: -r["elo"])
+        table[config] = rows
+    return table
+
+
+def format_ratings(table: Dict[str, List[dict]]) -> str:
+    lines = []
+    for config, rows in table.items():
+        lines.append(config)
+        width = max(len(r["bot"]) for r in rows)
+        for r in rows:
+            lines.append(f"  {r['bot']:<{width}}  {r['elo']:7.1f}  [{r['lo']:7.1f}, {r['hi']:7.1f}]"
+                         f"  games {r['games']:>5}  score {r['score']:.3f}")
+    return "\n".join(lines)
@@ -1,34 +1,117 @@
 from __future__ import annotations
 
+import json
 import os
 import threading
 import time
-from flask import Flask, jsonify, render_template, request, abort, send_from_directory
+from concurrent.futures import ProcessPoolExecutor
+from flask import Flask, Response, g, jsonify, render_template, request, abort, send_from_directory, stream_with_context
+from werkzeug.http import parse_options_header
 
+from game_engine import BOARD_FORMATS
+from journal import Journal
 from lobby_store import LobbyStore
+from metrics import HttpMetrics, render as render_metrics
+from opening_book import BookShelf
+from storage import SQLiteBackend
 
+# Журнал и снапшоты лобби (переживают перезапуск сервера); MG_DATA_DIR переопределяет
+DEFAULT_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data")
+# Дебютные книги ботов (python server/opening_book.py -o ...); MG_BOOK_DIR переопределяет
+DEFAULT_BOOK_DIR = os.path.join(DEFAULT_DATA_DIR, "books")
 
-def create_app() -> Flask:
+# Как часто SSE-поток шлёт keepalive-комментарий (и пингует игрока)
+SSE_KEEPALIVE_SECONDS = 15.0
+# Максимальное ожидание long-poll запроса
+LONG_POLL_SECONDS = 25.0
+
+# Максимальный размер страницы списка лобби
+MAX_LOBBY_PAGE = 100
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+def _sse(event_id, kind: str, data: dict) -> str:
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {kind}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+def _board_format():
+    """
+    Компактная доска по запросу: ?board=packed|bytes или параметр в Accept,
+    например "Accept: application/json; board=packed". None — обычные списки.
+    """
+    fmt = request.args.get("board")
+    if not fmt:
+        for item in (request.headers.get("Accept") or "").split(","):
+            fmt = parse_options_header(item)[1].get("board")
+            if fmt:
+                break
+    return fmt if fmt in BOARD_FORMATS else None
+
+
+def _last_event_id(default: int = 0) -> int:
+    raw = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    try:
+        return max(0, int(raw)) if raw else default
+    except ValueError:
+        return default
+
+
+def create_app(data_dir: str | None = None, db_path: str | None = None,
+               engine_profile: bool = False) -> Flask:
+    """
+    data_dir: где хранить журнал лобби; None — всё только в памяти.
+    db_path: общая SQLite-база лобби для нескольких процессов-воркеров
+    (например, gunicorn -w 4 app:app с MG_SQLITE=...); журнал тогда не нужен.
+    engine_profile: считать счётчики движка (каскады, проверки захвата) во всех играх.
+    """
     app = Flask(
         __name__,
         template_folder="templates",
         static_folder="static",
     )
 
+    # Боты считают ходы в отдельных процессах, а не в потоках запросов Flask
+    bot_pool = ProcessPoolExecutor(max_workers=os.cpu_count() or 1)
+
     # Увеличили timeout до 120 секунд, чтобы у игроков было больше времени присоединиться
-    store = LobbyStore(max_players=5, player_timeout_seconds=120)
+    backend = SQLiteBackend(db_path) if db_path else None
+    journal = Journal(os.path.join(data_dir, "journal")) if data_dir and not backend else None
+    store = LobbyStore(max_players=5, player_timeout_seconds=120, bot_pool=bot_pool,
+                       journal=journal, backend=backend, engine_profile=engine_profile,
+                       books=BookShelf(os.environ.get("MG_BOOK_DIR", DEFAULT_BOOK_DIR)))
+    # Доступ к хранилищу для тестов и нагрузочного стенда (benchmarks/load.py)
+    app.extensions["lobby_store"] = store
 
     def _cleanup_loop() -> None:
         while True:
             time.sleep(10)  # Увеличили интервал очистки
             store.cleanup()
+            store.maybe_snapshot()
 
     t = threading.Thread(target=_cleanup_loop, daemon=True)
     t.start()
 
+    # Время ответа по маршрутам для /metrics (для SSE — только до начала потока)
+    http_metrics = HttpMetrics()
+
+    @app.before_request
+    def _start_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        started = g.pop("request_started", None)
+        if started is not None:
+            rule = request.url_rule.rule if request.url_rule else "<unmatched>"
+            http_metrics.observe(rule, request.method, response.status_code, time.perf_counter() - started)
+        return response
+
     @app.get("/")
     def index():
-        return render_template("index.html", formats=store.formats)
+        return render_template("index.html", formats=store.formats, arena_formats=store.arena_formats,
+                               arena_max_players=store.arena_max_players)
 
     @app.get("/singleplayer")
     def singleplayer_page():
@@ -38,10 +121,14 @@ def create_app() -> Flask:
     def lobby_page(code: str):
         return render_template("lobby.html", code=code)
 
+    def _is_arena(code: str) -> bool:
+        lobby = store.get_lobby(code)
+        return lobby is not None and lobby.game_format in store.arena_formats
+
     @app.get("/game/<code>")
     def game_page(code: str):
-        # Multiplayer game client
-        return render_template("game.html", code=code)
+        # Multiplayer game client; на арене он запрашивает только видимую часть доски
+        return render_template("game.html", code=code, arena=_is_arena(code))
 
     @app.get("/game/<code>/debug")
     def game_debug_page(code: str):
@@ -50,15 +137,44 @@ def create_app() -> Flask:
         Использует ту же страницу game.html, но устанавливает флаг mg_debug_local=1
         через инъекцию в JS через Jinja2-переменную.
         """
-        return render_template("game.html", code=code, debug_local=True)
+        return render_template("game.html", code=code, debug_local=True, arena=_is_arena(code))
 
     # -------- API --------
 
     @app.get("/api/lobbies")
     def api_list_lobbies():
-        lobbies = store.list_public()
-        app.logger.info(f"[ℹ️] List lobbies: {len(lobbies)} открытых лобби")
-        return jsonify(lobbies)
+        # ?format=8x8&limit=20&cursor=... ; курсор следующей страницы — в X-Next-Cursor
+        game_format = (request.args.get("format") or "").strip() or None
+        limit = request.args.get("limit", type=int)
+        if limit is not None:
+            limit = max(1, min(limit, MAX_LOBBY_PAGE))
+        cursor = (request.args.get("cursor") or "").strip() or None
+
+        body, next_cursor = store.list_public_json(game_format, limit, cursor)
+        resp = Response(body, mimetype="application/json")
+        if next_cursor:
+            resp.headers["X-Next-Cursor"] = next_cursor
+        return resp
+
+    @app.get("/api/lobbies/events")
+    def api_lobby_list_events():
+        # Главная страница: событие "changed" — пора перечитать /api/lobbies
+        channel = store.lobby_list_events
+        last_id = channel.last_id
+
+        def stream():
+            nonlocal last_id
+            yield "retry: 3000\n\n"
+            while True:
+                events, _ = channel.wait(last_id, SSE_KEEPALIVE_SECONDS)
+                if not events:
+                    yield ": keepalive\n\n"
+                    continue
+                last_id = events[-1].id
+                # Достаточно одного события на пачку изменений
+                yield _sse(last_id, "changed", {})
+
+        return Response(stream_with_context(stream()), mimetype="text/event-stream", headers=SSE_HEADERS)
 
     @app.post("/api/lobbies")
     def api_create_lobby():
@@ -67,7 +183,7 @@ def create_app() -> Flask:
         game_format = (data.get("format") or "").strip()
         if not nick:
             return jsonify({"error": "Nick is required"}), 400
-        if game_format not in store.formats:
+        if game_format not in store.formats and game_format not in store.arena_formats:
             return jsonify({"error": "Unknown format"}), 400
 
         lobby, player = store.create_lobby(host_nick=nick, game_format=game_format)
@@ -92,6 +208,65 @@ def create_app() -> Flask:
 
         return jsonify(store.get_public_state(code))
 
+    @app.get("/api/lobbies/<code>/events")
+    def api_lobby_events(code: str):
+        """
+        Server-Sent Events по лобби: join/leave/start (с состоянием лобби),
+        move (дельта хода + версия), game_over, closed. После reset клиент
+        должен заново загрузить полное состояние.
+        """
+        player_id = (request.args.get("player_id") or "").strip() or None
+        lobby = store.get_lobby(code)
+        if not lobby:
+            return jsonify({"error": "Lobby not found"}), 404
+        # Новое подключение (без Last-Event-ID) получает только новые события:
+        # текущее состояние клиент и так загружает обычным запросом
+        start_id = _last_event_id(default=lobby.events.last_id)
+
+        def stream():
+            last_id = start_id
+            yield "retry: 3000\n\n"
+            while True:
+                if player_id:
+                    store.ping(code, player_id)
+                res = store.wait_events(code, last_id, SSE_KEEPALIVE_SECONDS)
+                if res is None:
+                    yield _sse(None, "closed", {})
+                    return
+                events, reset, closed = res
+                if reset:
+                    yield _sse(None, "reset", {})
+                for e in events:
+                    yield _sse(e.id, e.kind, e.data)
+                if events:
+                    last_id = events[-1].id
+                elif reset:
+                    last_id = 0
+                if closed:
+                    return
+                if not events and not reset:
+                    yield ": keepalive\n\n"
+
+        return Response(stream_with_context(stream()), mimetype="text/event-stream", headers=SSE_HEADERS)
+
+    @app.get("/api/lobbies/<code>/events/poll")
+    def api_lobby_events_poll(code: str):
+        # Long-poll для клиентов без EventSource: тот же поток событий, JSON-пачками
+        player_id = (request.args.get("player_id") or "").strip() or None
+        if player_id:
+            store.ping(code, player_id)
+        timeout = min(request.args.get("timeout", LONG_POLL_SECONDS, type=float), LONG_POLL_SECONDS)
+        res = store.wait_events(code, _last_event_id(), max(0.0, timeout))
+        if res is None:
+            return jsonify({"error": "Lobby not found"}), 404
+        events, reset, closed = res
+        return jsonify({
+            "ok": True,
+            "events": [{"id": e.id, "event": e.kind, "data": e.data} for e in events],
+            "reset": reset,
+            "closed": closed,
+        })
+
     @app.post("/api/lobbies/<code>/join")
     def api_join_lobby(code: str):
         data = request.get_json(silent=True) or {}
@@ -133,6 +308,21 @@ def create_app() -> Flask:
             app.logger.warning(f"[❌] Не удалось стартовать: {res.get('error')}")
             return jsonify(res), 400
         app.logger.info(f"[✅] Игра {code} стартовала!")
+        store.request_bot_turn(code)
+        return jsonify(res)
+
+    @app.post("/api/lobbies/<code>/bots")
+    def api_add_bot(code: str):
+        data = request.get_json(silent=True) or {}
+        player_id = (data.get("player_id") or "").strip()
+        if not player_id:
+            return jsonify({"error": "player_id is required"}), 400
+
+        kind = (data.get("kind") or "mcts").strip()
+        res = store.add_bot(code=code, player_id=player_id, kind=kind)
+        if res["ok"] is False:
+            return jsonify(res), 400
+        app.logger.info(f"[🤖] {res['nick']} добавлен в лобби {code}")
         return jsonify(res)
     
     # -------- Game API --------
@@ -142,11 +332,106 @@ def create_app() -> Flask:
         player_id = (request.args.get("player_id") or "").strip() or None
         if player_id:
             store.ping(code, player_id)
-            
-        state = store.get_game_state(code)
-        if not state:
+
+        etag = store.get_game_etag(code)
+        if etag is None:
+            return jsonify({"error": "Game not found"}), 404
+        board_format = _board_format()
+        if board_format:
+            etag = f"{etag}-{board_format}"
+        headers = {"Cache-Control": "no-cache", "Vary": "Accept"}
+        # Ничего не изменилось с прошлого опроса — тело не нужно
+        if request.if_none_match.contains(etag):
+            return "", 304, dict(headers, ETag=f'"{etag}"')
+
+        # ?since=<version>: только ходы после этой версии вместо всей доски.
+        # Тело кэшируется в лобби до следующего хода — кодируем один раз на версию
+        since = request.args.get("since", type=int)
+        res = store.get_game_state_json(code, since=since, board_format=board_format)
+        if not res:
+            return jsonify({"error": "Game not found"}), 404
+        body, etag = res
+        if board_format:
+            etag = f"{etag}-{board_format}"
+        resp = Response(body, mimetype="application/json", headers=headers)
+        resp.set_etag(etag)
+        return resp
+
+    @app.get("/api/game/<code>/view")
+    def api_game_view(code: str):
+        # Видимая часть большой доски: ?r=&c=&rows=&cols= — блоки по chunk_size
+        # клеток, с ?since=<version> только изменившиеся после этой версии
+        player_id = (request.args.get("player_id") or "").strip() or None
+        if player_id:
+            store.ping(code, player_id)
+        res = store.get_game_view(
+            code,
+            r=request.args.get("r", 0, type=int),
+            c=request.args.get("c", 0, type=int),
+            rows=request.args.get("rows", type=int),
+            cols=request.args.get("cols", type=int),
+            since=request.args.get("since", type=int),
+            board_format=_board_format(),
+        )
+        if res is None:
+            return jsonify({"error": "Game not found"}), 404
+        resp = jsonify(res)
+        resp.headers["Cache-Control"] = "no-cache"
+        resp.headers["Vary"] = "Accept"
+        return resp
+
+    @app.get("/api/stats")
+    def api_stats():
+        return jsonify(store.stats())
+
+    @app.get("/metrics")
+    def metrics():
+        # Prometheus text format: задержки по маршрутам, блокировки, время ходов
+        return Response(render_metrics(store, http_metrics), mimetype="text/plain; version=0.0.4")
+
+    @app.post("/api/lobbies/<code>/profile")
+    def api_set_profiling(code: str):
+        # Профилирование ходов одного лобби без перезапуска (только хост — оно замедляет игру):
+        # {"player_id": ..., "enabled": true, "every": 5}
+        data = request.get_json(silent=True) or {}
+        player_id = (data.get("player_id") or "").strip()
+        if not player_id:
+            return jsonify({"error": "player_id is required"}), 400
+        every = data.get("every", 1)
+        if not isinstance(every, int) or every < 1:
+            return jsonify({"error": "every must be a positive integer"}), 400
+        res = store.set_profiling(code, player_id, bool(data.get("enabled", True)), every)
+        if res["ok"] is False:
+            return jsonify(res), 404 if res["error"] == "Lobby not found" else 403
+        return jsonify(res)
+
+    @app.get("/api/lobbies/<code>/profile")
+    def api_get_profile(code: str):
+        # ?sort=cumulative|tottime|calls&limit=30
+        sort = request.args.get("sort", "cumulative")
+        limit = max(1, min(request.args.get("limit", 30, type=int), 200))
+        res = store.get_profile(code, sort=sort, limit=limit)
+        if res is None:
+            return jsonify({"error": "Lobby not found"}), 404
+        if res["ok"] is False:
+            return jsonify(res), 400
+        return jsonify(res)
+
+    @app.get("/api/game/<code>/replay")
+    def api_game_replay(code: str):
+        # Позиция завершённой игры после первых ?move=i ходов (для разбора и перемотки)
+        move_index = request.args.get("move", type=int)
+        if move_index is None:
+            return jsonify({"error": "move is required"}), 400
+        res = store.get_replay_position(code, move_index, board_format=_board_format())
+        if res is None:
             return jsonify({"error": "Game not found"}), 404
-        return jsonify(state)
+        if res["ok"] is False:
+            return jsonify(res), 400
+        resp = jsonify(res)
+        # Завершённая игра уже не меняется
+        resp.headers["Cache-Control"] = "private, max-age=300"
+        return resp
 
     @app.post("/api/game/<code>/move")
     def api_game_move(code: str):
@@ -161,13 +446,27 @@ def create_app() -> Flask:
         res = store.make_move(code, player_id, row, col)
         if res["ok"] is False:
             return jsonify(res), 400
-        
+
+        # Ход бота считается в пуле процессов; ответ игроку уходит сразу
+        store.request_bot_turn(code)
         return jsonify(res)
 
     return app
 
 
-app = create_app()
+def _default_data_dir() -> str | None:
+    if __name__ != "__main__":
+        # Импорт (gunicorn, тесты): журнал только если MG_DATA_DIR задан явно
+        return os.environ.get("MG_DATA_DIR")
+    # Под debug-перезагрузчиком модуль исполняет и процесс-наблюдатель, который
+    # не обслуживает запросы: журнал должен открыть только рабочий процесс
+    if os.environ.get("WERKZEUG_RUN_MAIN") != "true":
+        return None
+    return os.environ.get("MG_DATA_DIR", DEFAULT_DATA_DIR)
+
+
+app = create_app(data_dir=_default_data_dir(), db_path=os.environ.get("MG_SQLITE"),
+                 engine_profile=os.environ.get("MG_ENGINE_PROFILE") == "1")
 
 
 if __name__ == "__main__":
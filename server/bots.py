@@ -0,0 +1,493 @@
+from __future__ import annotations
+import math
+import os
+import random
+import threading
+import time
+from concurrent.futures import Executor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from game_engine import GameEngine
+
+# Scores are from the bot's (root player's) point of view.
+WIN_SCORE = 100000
+
+# Transposition table entry flags
+EXACT, LOWER, UPPER = 0, 1, 2
+
+
+class _SearchTimeout(Exception):
+    pass
+
+
+def candidate_moves(engine: GameEngine) -> List[int]:
+    """
+    Legal cells (flat indices) worth searching for the player to move: cells next
+    to at least one piece. Far-away placements capture nothing and only matter
+    when nothing else is available.
+    """
+    legal = engine._legal_mask(engine.current_player_num)
+    empty_nbrs = engine._nbr_counts[0]
+    nbr_lists = engine._nbr_lists
+    moves = []
+    all_moves = []
+    while legal:
+        low = legal & -legal
+        cell = low.bit_length() - 1
+        legal ^= low
+        all_moves.append(cell)
+        if empty_nbrs[cell] < len(nbr_lists[cell]):
+            moves.append(cell)
+    return moves or all_moves
+
+
+class Bot:
+    """Base for server-side bots: choose_move() blocks, submit() returns at once."""
+
+    kind: str = ""  # name used in LobbyStore.add_bot and the journal
+    time_budget: float = 1.0
+    # Opening book (opening_book.BookShelf); positions in it are answered without searching
+    book = None
+
+    def book_move(self, engine: GameEngine) -> Optional[Tuple[int, int]]:
+        return self.book.lookup(engine) if self.book is not None else None
+
+    def choose_move(self, engine: GameEngine) -> Optional[Tuple[int, int]]:
+        raise NotImplementedError
+
+    def submit(self, engine: GameEngine, callback: Callable[[Optional[Tuple[int, int]]], None]) -> None:
+        """Search in the background and call callback(move) when done."""
+        threading.Thread(target=lambda: callback(self.choose_move(engine)), daemon=True).start()
+
+
+class TranspositionTable:
+    """
+    Fixed-size table indexed by the low bits of the Zobrist key.
+    Replacement: an entry from an older search is always replaced, otherwise
+    the deeper search wins (ties go to the newer entry).
+    """
+
+    def __init__(self, size_log2: int = 18):
+        self._mask = (1 << size_log2) - 1
+        self._slots: List[Optional[tuple]] = [None] * (1 << size_log2)
+        self.generation = 0
+
+    def new_search(self) -> None:
+        self.generation += 1
+
+    def clear(self) -> None:
+        self._slots = [None] * len(self._slots)
+
+    def get(self, key: int) -> Optional[tuple]:
+        """(depth, flag, value, move) stored for this key, or None."""
+        entry = self._slots[key & self._mask]
+        if entry is None or entry[0] != key:
+            return None
+        return entry[1:5]
+
+    def put(self, key: int, depth: int, flag: int, value: int, move: Optional[int]) -> None:
+        idx = key & self._mask
+        old = self._slots[idx]
+        if old is None or old[5] != self.generation or depth >= old[1]:
+            self._slots[idx] = (key, depth, flag, value, move, self.generation)
+
+
+class AlphaBetaBot(Bot):
+    """
+    Iterative-deepening alpha-beta over GameEngine rules.
+
+    With 3-5 players the search is "paranoid": every opponent is assumed to play
+    against the bot. Positions are Zobrist-hashed (cells + side to move) into a
+    bounded transposition table; moves are ordered by TT move, flip count and
+    the history heuristic. choose_move() returns within time_budget seconds.
+    """
+
+    kind = "alphabeta"
+
+    def __init__(self, time_budget: float = 1.0, max_depth: int = 32,
+                 tt_size_log2: int = 18, seed: Optional[int] = None, book=None):
+        self.time_budget = time_budget
+        self.book = book
+        self.max_depth = max_depth
+        self.tt = TranspositionTable(tt_size_log2)
+        self._rng = random.Random(seed)
+        self._zobrist: Dict[Tuple[int, int], tuple] = {}
+        self._history: Dict[int, int] = {}
+        self._root = 0
+        self._deadline = 0.0
+        self.nodes = 0
+        self.depth_reached = 0
+
+    def choose_move(self, engine: GameEngine) -> Optional[Tuple[int, int]]:
+        if engine.winner:
+            return None
+        move = self.book_move(engine)
+        if move is not None:
+            return move
+        moves = candidate_moves(engine)
+        if not moves:
+            return None
+        n = engine.size
+        if len(moves) == 1:
+            return divmod(moves[0], n)
+
+        if engine.current_player_num != self._root:
+            # Scores in the table are relative to the root player
+            self._root = engine.current_player_num
+            self.tt.clear()
+        self.tt.new_search()
+        self._history.clear()
+        self._deadline = time.monotonic() + self.time_budget
+        self.nodes = 0
+        self.depth_reached = 0
+
+        key = self._hash(engine)
+        best = moves[0]
+        for depth in range(1, self.max_depth + 1):
+            try:
+                move, value = self._search_root(engine, key, depth)
+            except _SearchTimeout:
+                break
+            best = move
+            self.depth_reached = depth
+            # Decided, or searched until the board is full
+            if abs(value) >= WIN_SCORE // 2 or depth >= engine._totals[0]:
+                break
+        return divmod(best, n)
+
+    # -------- search --------
+
+    def _search_root(self, engine: GameEngine, key: int, depth: int) -> Tuple[int, int]:
+        alpha, beta = -WIN_SCORE * 2, WIN_SCORE * 2
+        best_move, best_value = None, -WIN_SCORE * 2
+        n = engine.size
+        for move, child_key in self._ordered_moves(engine, key):
+            delta = engine.apply(divmod(move, n))
+            try:
+                value = self._alphabeta(engine, child_key, depth - 1, alpha, beta)
+            finally:
+                engine.undo(delta)
+            if value > best_value:
+                best_move, best_value = move, value
+            alpha = max(alpha, value)
+        self.tt.put(key, depth, EXACT, best_value, best_move)
+        return best_move, best_value
+
+    def _alphabeta(self, engine: GameEngine, key: int, depth: int, alpha: int, beta: int) -> int:
+        self.nodes += 1
+        if time.monotonic() > self._deadline:
+            raise _SearchTimeout()
+
+        if engine.winner:
+            return self._terminal_score(engine, depth)
+        if depth == 0:
+            return self._evaluate(engine)
+
+        entry = self.tt.get(key)
+        tt_move = None
+        if entry is not None:
+            e_depth, flag, value, tt_move = entry
+            if e_depth >= depth:
+                if flag == EXACT:
+                    return value
+                if flag == LOWER:
+                    alpha = max(alpha, value)
+                elif flag == UPPER:
+                    beta = min(beta, value)
+                if alpha >= beta:
+                    return value
+
+        a0, b0 = alpha, beta
+        n = engine.size
+        maximizing = engine.current_player_num == self._root
+        best_move = None
+        best_value = -WIN_SCORE * 2 if maximizing else WIN_SCORE * 2
+        for move, child_key in self._ordered_moves(engine, key, tt_move):
+            delta = engine.apply(divmod(move, n))
+            try:
+                value = self._alphabeta(engine, child_key, depth - 1, alpha, beta)
+            finally:
+                engine.undo(delta)
+            if maximizing:
+                if value > best_value:
+                    best_move, best_value = move, value
+                alpha = max(alpha, value)
+            else:
+                if value < best_value:
+                    best_move, best_value = move, value
+                beta = min(beta, value)
+            if alpha >= beta:
+                self._history[move] = self._history.get(move, 0) + depth * depth
+                break
+
+        if best_value <= a0:
+            flag = UPPER
+        elif best_value >= b0:
+            flag = LOWER
+        else:
+            flag = EXACT
+        self.tt.put(key, depth, flag, best_value, best_move)
+        return best_value
+
+    def _ordered_moves(self, engine: GameEngine, key: int, tt_move: Optional[int] = None) -> List[Tuple[int, int]]:
+        """(move, child key) pairs, best-looking first. Each move is tried once to count its flips."""
+        zcell, zturn = self._zobrist_for(engine)
+        p_num = engine.current_player_num
+        n = engine.size
+        turn_key = zturn[engine.turn_idx]
+        history = self._history
+
+        scored = []
+        for move in candidate_moves(engine):
+            delta = engine.apply(divmod(move, n))
+            child_key = key ^ turn_key ^ zturn[engine.turn_idx] ^ zcell[move][p_num]
+            for f, old in zip(delta.flips, delta.flipped_from):
+                child_key ^= zcell[f][old] ^ zcell[f][p_num]
+            engine.undo(delta)
+            scored.append(((move == tt_move, len(delta.flips), history.get(move, 0)), move, child_key))
+        scored.sort(key=lambda x: x[0], reverse=True)
+        return [(move, child_key) for _, move, child_key in scored]
+
+    # -------- evaluation --------
+
+    def _evaluate(self, engine: GameEngine) -> int:
+        totals = engine._totals
+        mine = totals[self._root]
+        best_other = max(t for v, t in enumerate(totals) if v and v != self._root)
+        return mine - best_other
+
+    def _terminal_score(self, engine: GameEngine, depth: int) -> int:
+        # Prefer quicker wins and slower losses
+        if engine.winner == engine.players[self._root - 1]:
+            return WIN_SCORE + depth
+        if engine.winner == "draw":
+            return 0
+        return -WIN_SCORE - depth
+
+    # -------- hashing --------
+
+    def _zobrist_for(self, engine: GameEngine) -> tuple:
+        dims = (len(engine._cells), len(engine.players) + 1)
+        keys = self._zobrist.get(dims)
+        if keys is None:
+            rnd = self._rng.getrandbits
+            zcell = [[0] + [rnd(64) for _ in range(dims[1] - 1)] for _ in range(dims[0])]
+            zturn = [rnd(64) for _ in range(len(engine.players))]
+            keys = self._zobrist[dims] = (zcell, zturn)
+        return keys
+
+    def _hash(self, engine: GameEngine) -> int:
+        zcell, zturn = self._zobrist_for(engine)
+        key = zturn[engine.turn_idx]
+        for cell, v in enumerate(engine._cells):
+            if v:
+                key ^= zcell[cell][v]
+        return key
+
+
+class _Node:
+    __slots__ = ("move", "parent", "mover", "children", "untried", "visits", "wins")
+
+    def __init__(self, move: Optional[int], parent: Optional["_Node"], mover: int, untried: List[int]):
+        self.move = move
+        self.parent = parent
+        self.mover = mover          # player number who made `move`
+        self.children: List[_Node] = []
+        self.untried = untried
+        self.visits = 0
+        self.wins = 0.0             # from the mover's point of view
+
+
+def _rollout_rewards(engine: GameEngine, rng: random.Random, depth: int, deltas: list) -> List[float]:
+    """
+    Random playout for up to `depth` moves (appended to `deltas` for undo).
+    Reward 1 goes to the winner (or the leaders, split).
+    """
+    for _ in range(depth):
+        if engine.winner:
+            break
+        deltas.append(engine.apply(engine.random_legal_move(rng)))
+
+    rewards = [0.0] * (len(engine.players) + 1)
+    if engine.winner and engine.winner != "draw":
+        rewards[engine.players.index(engine.winner) + 1] = 1.0
+        return rewards
+    best = max(engine._totals[1:])
+    leaders = [v for v in range(1, len(rewards)) if engine._totals[v] == best]
+    for v in leaders:
+        rewards[v] = 1.0 / len(leaders)
+    return rewards
+
+
+def _mcts_search(engine: GameEngine, deadline: float, seed: int,
+                 exploration: float, rollout_depth: int,
+                 iterations: Optional[int] = None) -> Dict[int, int]:
+    """
+    One independent UCT tree, grown until the wall-clock deadline (time.time())
+    or, if given, for at most `iterations` playouts (same seed, same tree).
+    Runs in a worker process; returns root visit counts per move.
+    Every iteration is undone, so `engine` is left as it was.
+    """
+    rng = random.Random(seed)
+    n = engine.size
+
+    def shuffled(moves: List[int]) -> List[int]:
+        rng.shuffle(moves)
+        return moves
+
+    root = _Node(None, None, 0, shuffled(candidate_moves(engine)))
+    while time.time() < deadline and (iterations is None or root.visits < iterations):
+        node = root
+        deltas = []
+
+        # Selection
+        while not node.untried and node.children:
+            log_n = math.log(node.visits)
+            node = max(node.children, key=lambda ch: ch.wins / ch.visits
+                       + exploration * math.sqrt(log_n / ch.visits))
+            deltas.append(engine.apply(divmod(node.move, n)))
+
+        # Expansion
+        if node.untried and not engine.winner:
+            move = node.untried.pop()
+            mover = engine.current_player_num
+            deltas.append(engine.apply(divmod(move, n)))
+            child = _Node(move, node, mover, [] if engine.winner else shuffled(candidate_moves(engine)))
+            node.children.append(child)
+            node = child
+
+        rewards = _rollout_rewards(engine, rng, rollout_depth, deltas)
+        for delta in reversed(deltas):
+            engine.undo(delta)
+
+        # Backpropagation
+        while node is not None:
+            node.visits += 1
+            node.wins += rewards[node.mover]
+            node = node.parent
+
+    return {ch.move: ch.visits for ch in root.children}
+
+
+def _greedy_move(engine: GameEngine, moves: List[int]) -> int:
+    """Move with the most flips (fallback when a search produced nothing)."""
+    n = engine.size
+    best, best_flips = moves[0], -1
+    for move in moves:
+        delta = engine.apply(divmod(move, n))
+        engine.undo(delta)
+        if len(delta.flips) > best_flips:
+            best, best_flips = move, len(delta.flips)
+    return best
+
+
+class MCTSBot(Bot):
+    """
+    Monte Carlo Tree Search (UCT with truncated random playouts) over GameEngine rules.
+
+    Root parallelism: `workers` independent trees are grown in `pool` (normally a
+    ProcessPoolExecutor shared by all bots) and merged by root visit counts.
+    The move is decided at the wall-clock deadline whether or not every worker
+    has reported. Without a pool a single tree is searched on a thread.
+    `iterations` caps the playouts per tree; with an unlimited time budget and
+    a seed that makes the bot deterministic (see benchmarks/tournament.py).
+    """
+
+    kind = "mcts"
+
+    # Extra time allowed for workers to report after the deadline
+    GRACE = 0.25
+
+    def __init__(self, time_budget: float = 1.0, workers: Optional[int] = None,
+                 pool: Optional[Executor] = None, exploration: float = 1.4,
+                 rollout_depth: int = 32, seed: Optional[int] = None,
+                 iterations: Optional[int] = None, book=None):
+        self.time_budget = time_budget
+        self.book = book
+        self.workers = workers or os.cpu_count() or 1
+        self.pool = pool
+        self.exploration = exploration
+        self.rollout_depth = rollout_depth
+        self.iterations = iterations
+        self._rng = random.Random(seed)
+
+    def choose_move(self, engine: GameEngine) -> Optional[Tuple[int, int]]:
+        done = threading.Event()
+        box: List[Optional[Tuple[int, int]]] = []
+
+        def on_done(move):
+            box.append(move)
+            done.set()
+
+        self.submit(engine, on_done)
+        done.wait()
+        return box[0]
+
+    def submit(self, engine: GameEngine, callback: Callable[[Optional[Tuple[int, int]]], None]) -> None:
+        n = engine.size
+        move = None if engine.winner else self.book_move(engine)
+        if move is not None:
+            callback(move)
+            return
+        moves = [] if engine.winner else candidate_moves(engine)
+        if len(moves) <= 1:
+            callback(divmod(moves[0], n) if moves else None)
+            return
+
+        deadline = time.time() + self.time_budget
+        args = (engine, deadline)
+        params = (self.exploration, self.rollout_depth, self.iterations)
+
+        if self.pool is None:
+            seed = self._rng.getrandbits(32)
+
+            def run():
+                counts = _mcts_search(*args, seed, *params)
+                callback(divmod(self._pick(engine, moves, [counts]), n))
+
+            threading.Thread(target=run, daemon=True).start()
+            return
+
+        lock = threading.Lock()
+        results: List[Dict[int, int]] = []
+        state = {"finished": False}
+        futures = [self.pool.submit(_mcts_search, *args, self._rng.getrandbits(32), *params)
+                   for _ in range(self.workers)]
+
+        def finish():
+            with lock:
+                if state["finished"]:
+                    return
+                state["finished"] = True
+                merged = list(results)
+            timer.cancel()
+            for f in futures:
+                f.cancel()
+            callback(divmod(self._pick(engine, moves, merged), n))
+
+        def on_result(future):
+            if future.cancelled() or future.exception() is not None:
+                counts = None
+            else:
+                counts = future.result()
+            with lock:
+                if counts is not None:
+                    results.append(counts)
+                remaining = sum(1 for f in futures if not f.done())
+            if remaining == 0:
+                finish()
+
+        timer = threading.Timer(self.time_budget + self.GRACE, finish)
+        timer.daemon = True
+        timer.start()
+        for f in futures:
+            f.add_done_callback(on_result)
+
+    def _pick(self, engine: GameEngine, moves: List[int], results: List[Dict[int, int]]) -> int:
+        visits: Dict[int, int] = {}
+        for counts in results:
+            for move, v in counts.items():
+                visits[move] = visits.get(move, 0) + v
+        if not visits:
+            return _greedy_move(engine, moves)
+        return max(visits, key=visits.get)
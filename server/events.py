@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+import threading
+from collections import deque
+from typing import List, NamedTuple, Tuple
+
+
+class Event(NamedTuple):
+    id: int
+    kind: str
+    data: dict
+
+
+class EventChannel:
+    """
+    Bounded ring buffer of events with increasing ids (1, 2, ...).
+    Readers block in wait() until something newer than their last id arrives,
+    so an idle channel costs nothing but the sleeping waiters.
+    """
+
+    def __init__(self, capacity: int = 256):
+        self._cond = threading.Condition()
+        self._events: deque = deque(maxlen=capacity)
+        self._last_id = 0
+        self.closed = False
+
+    @property
+    def last_id(self) -> int:
+        return self._last_id
+
+    def publish(self, kind: str, data: dict) -> int:
+        with self._cond:
+            self._last_id += 1
+            self._events.append(Event(self._last_id, kind, data))
+            self._cond.notify_all()
+            return self._last_id
+
+    def close(self) -> None:
+        """Wake every waiter for good (the lobby is gone)."""
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+    def wait(self, last_id: int, timeout: float) -> Tuple[List[Event], bool]:
+        """
+        Events after `last_id`, waiting up to `timeout` seconds if there are none yet.
+        The flag is True when the reader can't resume from `last_id` (events it
+        missed were already dropped, or the id is from another channel) and
+        should reload the full state instead.
+        """
+        with self._cond:
+            if last_id == self._last_id and not self.closed:
+                self._cond.wait_for(lambda: self._last_id > last_id or self.closed, timeout)
+
+            if last_id > self._last_id:
+                return [], True
+            events = [e for e in self._events if e.id > last_id]
+            missed = last_id < self._last_id and (not events or events[0].id != last_id + 1)
+            return events, missed
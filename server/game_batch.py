@@ -0,0 +1,215 @@
+from __future__ import annotations
+from typing import Optional, Tuple
+
+import numpy as np
+
+# Same neighbor order as GameEngine: with cascade off the order of checks matters.
+_DELTAS = ((-1,-1),(-1,0),(-1,1),(0,-1),(0,1),(1,-1),(1,0),(1,1))
+
+DRAW = -1
+
+
+class GameBatch:
+    """
+    B independent games of the same size and player count, advanced in lockstep.
+
+    boards: (B, N, N) int8, 0 = empty, 1..P = player number (like GameEngine.board).
+    turn_idx: (B,) current player index per game.
+    winner: (B,) int8, 0 = still playing, 1..P = winning player number, DRAW = draw.
+
+    Every step applies one move per game and must give the same result as
+    GameEngine.make_move on each game separately.
+    """
+
+    def __init__(self, size: int, n_players: int, batch: int, cascade_enabled: bool = True):
+        self.size = size
+        self.n_players = n_players
+        self.batch = batch
+        self.cascade_enabled = cascade_enabled
+        self.boards = np.zeros((batch, size, size), dtype=np.int8)
+        self.turn_idx = np.zeros(batch, dtype=np.int64)
+        self.winner = np.zeros(batch, dtype=np.int8)
+        self.history_len = np.zeros(batch, dtype=np.int64)
+
+    @property
+    def game_over(self) -> np.ndarray:
+        return self.winner != 0
+
+    @property
+    def current_player_num(self) -> np.ndarray:
+        return self.turn_idx + 1
+
+    def scores(self) -> np.ndarray:
+        """(B, P) number of cells owned by each player."""
+        vals = np.arange(1, self.n_players + 1, dtype=np.int8)
+        return (self.boards[:, None] == vals[None, :, None, None]).sum(axis=(2, 3))
+
+    def legal_mask(self) -> np.ndarray:
+        """
+        (B, N, N) bool: legal cells for the player to move in each game.
+        Includes the early-game restriction (no placing next to an opponent while
+        every player has <= 1 piece), with the same fallback to all empty cells.
+        Finished games have no legal cells.
+        """
+        boards = self.boards
+        p = self.current_player_num.astype(np.int8)[:, None, None]
+        empty = boards == 0
+
+        counts = self.scores()
+        early = (counts.sum(axis=1) > 0) & (counts.max(axis=1) <= 1)
+        legal = empty.copy()
+        if early.any():
+            opp = (boards != 0) & (boards != p)
+            filtered = empty & ~_dilate(opp)
+            use = early & filtered.any(axis=(1, 2))
+            legal[use] = filtered[use]
+
+        legal[self.game_over] = False
+        return legal
+
+    def step(self, cells: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Apply one move per game. cells: (B,) flat indices r * N + c, -1 = no move.
+        Returns (ok, flips): ok[b] is False where the move was invalid or skipped
+        (that game is left untouched), flips[b] is the number of captured cells.
+        """
+        n = self.size
+        cells = np.asarray(cells, dtype=np.int64)
+        ok = (cells >= 0) & (cells < n * n)
+        flat_legal = self.legal_mask().reshape(self.batch, n * n)
+        ok[ok] = flat_legal[ok.nonzero()[0], cells[ok]]
+
+        flips = np.zeros(self.batch, dtype=np.int64)
+        games = ok.nonzero()[0]
+        if games.size == 0:
+            return ok, flips
+
+        p = (self.turn_idx[games] + 1).astype(np.int8)
+        rows, cols = np.divmod(cells[games], n)
+        self.boards[games, rows, cols] = p
+
+        if self.cascade_enabled:
+            flips[games] = self._cascade(games, rows, cols, p)
+        else:
+            flips[games] = self._capture_around(games, rows, cols, p)
+
+        self.history_len[games] += 1
+        self.turn_idx[games] = (self.turn_idx[games] + 1) % self.n_players
+        self._check_winner(games)
+        return ok, flips
+
+    def random_moves(self, rng: np.random.Generator) -> np.ndarray:
+        """One uniformly random legal move per game (-1 for finished games)."""
+        legal = self.legal_mask().reshape(self.batch, -1)
+        noise = rng.random(legal.shape)
+        noise[~legal] = -1.0
+        moves = noise.argmax(axis=1)
+        moves[~legal.any(axis=1)] = -1
+        return moves
+
+    def play_random(self, rng: Optional[np.random.Generator] = None) -> np.ndarray:
+        """Play every game to the end with random legal moves, returns winner."""
+        rng = rng or np.random.default_rng()
+        while not self.game_over.all():
+            self.step(self.random_moves(rng))
+        return self.winner
+
+    def _cascade(self, games, rows, cols, p) -> np.ndarray:
+        # GameEngine re-checks only the neighbors of cells that changed during the
+        # move, and a capture only ever makes further captures easier. So flipping
+        # every capturable enemy cell next to the changed region at once, wave after
+        # wave, ends in exactly the position the engine's queue reaches.
+        n = self.size
+        flips = np.zeros(games.size, dtype=np.int64)
+        live = np.arange(games.size)
+        boards = self.boards[games]
+        frontier = np.zeros(boards.shape, dtype=bool)
+        frontier[live, rows, cols] = True
+
+        while live.size:
+            pb = p[live, None, None]
+            padded = _pad(boards)
+            att = np.zeros(boards.shape, dtype=np.int8)
+            dfn = np.zeros(boards.shape, dtype=np.int8)
+            for dr, dc in _DELTAS:
+                shifted = padded[:, 1+dr:n+1+dr, 1+dc:n+1+dc]
+                att += shifted == pb
+                dfn += shifted == boards
+            enemy = (boards != 0) & (boards != pb)
+            wave = enemy & _dilate(frontier) & (att > dfn)
+
+            hit = wave.any(axis=(1, 2))
+            if not hit.all():
+                # Games without captures in this wave are finished
+                self.boards[games[live[~hit]]] = boards[~hit]
+                live, boards, wave, pb = live[hit], boards[hit], wave[hit], pb[hit]
+            if not live.size:
+                break
+            boards[wave] = np.broadcast_to(pb, boards.shape)[wave]
+            flips[live] += wave.sum(axis=(1, 2))
+            frontier = wave
+
+        return flips
+
+    def _capture_around(self, games, rows, cols, p) -> np.ndarray:
+        # Without cascade GameEngine checks the placed cell's neighbors one by one
+        # and each capture is visible to the next check, so replay that order.
+        n = self.size
+        boards = self.boards
+        flips = np.zeros(games.size, dtype=np.int64)
+        for dr, dc in _DELTAS:
+            tr, tc = rows + dr, cols + dc
+            inside = (tr >= 0) & (tr < n) & (tc >= 0) & (tc < n)
+            g, tr, tc, pp = games[inside], tr[inside], tc[inside], p[inside]
+            t = boards[g, tr, tc]
+            enemy = (t != 0) & (t != pp)
+            att = self._count_around(g, tr, tc, pp)
+            dfn = self._count_around(g, tr, tc, t)
+            take = enemy & (att > dfn)
+            boards[g[take], tr[take], tc[take]] = pp[take]
+            flips[inside.nonzero()[0][take]] += 1
+        return flips
+
+    def _count_around(self, games, rows, cols, vals) -> np.ndarray:
+        n = self.size
+        count = np.zeros(games.size, dtype=np.int64)
+        for dr, dc in _DELTAS:
+            nr, nc = rows + dr, cols + dc
+            inside = (nr >= 0) & (nr < n) & (nc >= 0) & (nc < n)
+            hit = np.zeros(games.size, dtype=bool)
+            hit[inside] = self.boards[games[inside], nr[inside], nc[inside]] == vals[inside]
+            count += hit
+        return count
+
+    def _check_winner(self, games: np.ndarray) -> None:
+        # Same rules as GameEngine._check_winner / _finalize_winner
+        counts = self.scores()[games]
+        empty = (self.boards[games] == 0).sum(axis=(1, 2))
+        placed = counts.sum(axis=1)
+        active = (counts > 0).sum(axis=1)
+        done = (empty == 0) | ((placed >= 2) & (active == 1))
+        if not done.any():
+            return
+
+        counts = counts[done]
+        best = counts.max(axis=1)
+        tie = (counts == best[:, None]).sum(axis=1) > 1
+        self.winner[games[done]] = np.where(tie, DRAW, counts.argmax(axis=1) + 1)
+
+
+def _pad(x: np.ndarray) -> np.ndarray:
+    """Zero border of one cell around the last two axes."""
+    n = x.shape[-1]
+    padded = np.zeros(x.shape[:-2] + (n + 2, n + 2), dtype=x.dtype)
+    padded[..., 1:-1, 1:-1] = x
+    return padded
+
+
+def _dilate(mask: np.ndarray) -> np.ndarray:
+    """Cells with at least one neighbor set in mask (shifted ORs, zero outside the board)."""
+    n = mask.shape[-1]
+    padded = _pad(mask)
+    out = np.zeros_like(mask)
+    for dr, dc in _DELTAS:
+        out |= padded[..., 1+dr:n+1+dr, 1+dc:n+1+dc]
+    return out
@@ -1,22 +1,200 @@
 from __future__ import annotations
+import base64
 import random
-from typing import List, Dict, Any, Tuple, Optional
+import time
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from functools import lru_cache
+from typing import List, Dict, Any, Set, Tuple, Optional
+
+# Neighbor order matters: the capture queue visits neighbors in this order.
+_DELTAS = ((-1,-1),(-1,0),(-1,1),(0,-1),(0,1),(1,-1),(1,0),(1,1))
+
+# Compact board encodings for the wire (see GameEngine.encode_board)
+BOARD_FORMATS = ("bytes", "packed")
+_OCTAL_DIGITS = bytes.maketrans(bytes(range(8)), b"01234567")
+
+
+def wire_format(fmt: str, max_value: int) -> str:
+    """Format a board asked for in `fmt` goes out in: "packed" only fits values 0..7."""
+    if fmt not in BOARD_FORMATS:
+        raise ValueError(f"Unknown board format: {fmt}")
+    return "bytes" if fmt == "packed" and max_value > 7 else fmt
+
+
+def encode_cells(raw: bytes, fmt: str, max_value: Optional[int] = None) -> Tuple[str, str]:
+    """
+    Flat one-byte-per-cell board -> (base64 text, format used) (see
+    GameEngine.encode_board). "packed" only fits values 0..7; otherwise the
+    cells go out as "bytes", and callers must label the board with the format
+    returned here, not the one asked for. Pass `max_value` (the player count)
+    to decide by the game rather than by the cells, so every board and chunk
+    of a game gets the same format.
+    """
+    fmt = wire_format(fmt, max(raw, default=0) if max_value is None else max_value)
+    if fmt == "packed":
+        # Cells as octal digits -> one big int -> 3 bits per cell
+        n = len(raw)
+        raw = int(raw.translate(_OCTAL_DIGITS), 8).to_bytes((3 * n + 7) // 8, "big")
+    return base64.b64encode(raw).decode("ascii"), fmt
+
+
+@lru_cache(maxsize=None)
+def _neighbor_tables(size: int) -> Tuple[Tuple[Tuple[int, ...], ...], Tuple[int, ...]]:
+    """
+    Precomputed per-cell neighbor data for a board of the given size.
+    Cells are flat indices (r * size + c). Returns (neighbor index lists, neighbor bitmasks).
+    """
+    lists = []
+    masks = []
+    for r in range(size):
+        for c in range(size):
+            idx = []
+            mask = 0
+            for dr, dc in _DELTAS:
+                nr, nc = r+dr, c+dc
+                if 0 <= nr < size and 0 <= nc < size:
+                    i = nr * size + nc
+                    idx.append(i)
+                    mask |= 1 << i
+            lists.append(tuple(idx))
+            masks.append(mask)
+    return tuple(lists), tuple(masks)
+
+
+def _iter_bits(mask: int):
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+@dataclass
+class EngineProfile:
+    """
+    Hot-path counters and phase timings, summed over every move of one game.
+    Collected only while GameEngine.profile is set (see _apply_profiled).
+    """
+    moves: int = 0
+    cascade_waves: int = 0      # cascade depth: the placed cell is wave 0, its captures wave 1, ...
+    max_cascade_waves: int = 0
+    queue_pushes: int = 0
+    capture_checks: int = 0     # _should_capture calls
+    neighbor_reads: int = 0     # neighbor cells looked at by the cascade
+    flips: int = 0
+    max_flips: int = 0
+    legal_scans: int = 0        # _legal_mask calls (move validation and get_legal_moves)
+    legal_seconds: float = 0.0
+    cascade_seconds: float = 0.0    # placing the piece and the cascade
+    winner_seconds: float = 0.0
+
+    def merge(self, other: "EngineProfile") -> None:
+        for name, value in asdict(other).items():
+            if name.startswith("max_"):
+                setattr(self, name, max(getattr(self, name), value))
+            else:
+                setattr(self, name, getattr(self, name) + value)
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+# Methods enable_profile() shadows per instance
+_PROFILED_METHODS = ("apply", "_legal_mask", "_should_capture", "_check_winner")
+
+
+@dataclass
+class Delta:
+    """
+    One applied move, enough to undo it without copying the board.
+    Cells are flat indices (r * size + c).
+    """
+    player: str                 # player_id who moved
+    cell: int                   # placed cell
+    flips: List[int]            # captured cells, in capture order (wave by wave)
+    flipped_from: List[int]     # previous owner (player number) of each captured cell
+    prev_turn_idx: int
+    prev_winner: Optional[str]
+    # Cascade waves as consecutive runs of `flips`: wave 1 is captured by the
+    # placed piece, wave k+1 by the pieces of wave k
+    wave_sizes: List[int] = field(default_factory=list)
+    # Threat map changes made by make_move: (cell, owner), owner 0 = no longer
+    # threatened (see GameEngine.threats). Empty for apply() in searches.
+    threats: List[Tuple[int, int]] = field(default_factory=list)
+
+    def waves(self) -> List[List[int]]:
+        res, i = [], 0
+        for n in self.wave_sizes:
+            res.append(self.flips[i:i + n])
+            i += n
+        return res
+
 
 class GameEngine:
+    # When True, every move is followed by a full recount of the incremental
+    # tables (see _check_consistency). Meant for tests and debugging only.
+    debug = False
+    # Side of the square blocks get_view() sends the board in
+    CHUNK = 16
+
     def __init__(self, size: int, players: List[str]):
         """
         size: Board dimension (e.g. 8 for 8x8)
         players: List of player_ids in turn order.
         """
+        self._init_common(size, players)
+        # Cell values: 0 = empty, 1..N correspond to self.players indices
+        # (1-based for convenience in logic), same as the cells of self.board.
+        # Every table below is indexed by cell value, so index 0 tracks empties.
+        cells = size * size
+        values = len(players) + 1
+        self._nbr_lists, self._nbr_masks = _neighbor_tables(size)
+        self._cells = [0] * cells                 # flat owner per cell (r * size + c)
+        self._masks = [0] * values                # bit r*size+c set = cell has this value
+        self._masks[0] = (1 << cells) - 1
+        # _nbr_counts[v][cell]: how many of the cell's 8 neighbors have value v
+        self._nbr_counts = [[0] * cells for _ in range(values)]
+        self._nbr_counts[0] = [len(nbrs) for nbrs in self._nbr_lists]
+
+    def _init_common(self, size: int, players: List[str]) -> None:
+        """
+        State every engine has whatever its board representation; subclasses
+        call this from __init__ and add their own cell storage.
+        """
         self.size = size
         self.players = players  # player_id list
         self.turn_idx = 0
-        # Board is a list of lists. 0 = empty. 
-        # Values 1..N correspond to self.players indices (1-based for convenience in logic)
-        self.board = [[0 for _ in range(size)] for _ in range(size)]
+        self._totals = [0] * (len(players) + 1)   # number of cells with this value
+        self._totals[0] = size * size
         self.winner: Optional[str] = None
-        self.history: List[dict] = []
+        self.history: List[Delta] = []
         self.cascade_enabled = True
+        # See enable_profile(); None means the plain, uninstrumented methods run
+        self.profile: Optional[EngineProfile] = None
+        # Bumped by every make_move/unmake_move. Since _linear_since, each version
+        # step is exactly one history entry (see deltas_since).
+        self.version = 0
+        self._linear_since = 0
+        # Threatened cells -> owner (see threats()); kept by make_move/unmake_move
+        self._threatened: Dict[int, int] = {}
+
+    @classmethod
+    def from_cells(cls, size: int, players: List[str], cells: bytes, turn_idx: int,
+                   winner: Optional[str], version: int) -> "GameEngine":
+        """
+        Rebuild a game from a stored board (one byte per cell, like encode_board's
+        "bytes" format). There is no history, so deltas_since() only works for
+        versions after `version`.
+        """
+        game = cls(size, players)
+        for cell, val in enumerate(cells):
+            if val:
+                game._set_cell(cell, val)
+        game.turn_idx = turn_idx
+        game.winner = winner
+        game.version = game._linear_since = version
+        game._update_threats(cell for cell, val in enumerate(cells) if val)
+        return game
 
     @property
     def current_player_id(self) -> str:
@@ -26,74 +204,293 @@ class GameEngine:
     def current_player_num(self) -> int:
         return self.turn_idx + 1
 
-    def get_state(self) -> dict:
-        scores = {pid: 0 for pid in self.players}
-        total_cells = self.size * self.size
-        filled = 0
-        
-        for r in range(self.size):
-            for c in range(self.size):
-                val = self.board[r][c]
-                if val > 0:
-                    pid = self.players[val - 1]
-                    scores[pid] += 1
-                    filled += 1
-        
-        return {
+    def copy(self) -> "GameEngine":
+        """Independent copy of the game (boards, tables and history list)."""
+        new = self.__class__.__new__(self.__class__)
+        new.__dict__.update(self.__dict__)
+        new.players = list(self.players)
+        new._totals = self._totals[:]
+        new._threatened = dict(self._threatened)
+        new.history = list(self.history)
+        self._copy_cells(new)
+        new._drop_profile()  # searches on copies don't count towards the game
+        return new
+
+    def _copy_cells(self, new: "GameEngine") -> None:
+        """Give `new` (a shallow copy) its own cell storage; see copy()."""
+        new._cells = self._cells[:]
+        new._masks = self._masks[:]
+        new._nbr_counts = [row[:] for row in self._nbr_counts]
+
+    def __getstate__(self) -> dict:
+        # Neighbor tables are shared per board size; rebuild them instead of pickling
+        state = self.__dict__.copy()
+        del state["_nbr_lists"], state["_nbr_masks"]
+        for name in _PROFILED_METHODS:
+            state.pop(name, None)
+        state["profile"] = None
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._nbr_lists, self._nbr_masks = _neighbor_tables(self.size)
+
+    def enable_profile(self, profile: Optional[EngineProfile] = None) -> EngineProfile:
+        """
+        Start counting and timing moves into `profile` (a fresh one by default).
+        The instrumented methods are installed on this instance only, shadowing
+        the class ones, so games that never enable profiling pay nothing for it.
+        """
+        self.profile = profile or EngineProfile()
+        self.apply = self._apply_profiled
+        self._legal_mask = self._legal_mask_profiled
+        self._should_capture = self._should_capture_profiled
+        self._check_winner = self._check_winner_profiled
+        return self.profile
+
+    def disable_profile(self) -> Optional[EngineProfile]:
+        """Stop profiling; returns what was collected."""
+        profile = self.profile
+        self._drop_profile()
+        return profile
+
+    def _drop_profile(self) -> None:
+        self.profile = None
+        for name in _PROFILED_METHODS:
+            self.__dict__.pop(name, None)
+
+    @property
+    def board(self) -> List[List[int]]:
+        """List-of-lists view of the board. 0 = empty, 1..N = player number."""
+        n = self.size
+        cells = self._cells
+        return [cells[r*n:(r+1)*n] for r in range(n)]
+
+    def board_bytes(self) -> bytes:
+        """One byte per cell, row-major (the "bytes" format before base64)."""
+        return bytes(self._cells)
+
+    def encode_board(self, fmt: str) -> str:
+        """
+        Board as base64 text, row-major like `board`:
+          "bytes":  one byte per cell;
+          "packed": 3 bits per cell (values 0..7), big-endian, left-padded with
+                    zero bits to whole bytes, i.e. cell i is at bit offset
+                    pad + 3*i from the start of the data.
+        Both are built straight from the flat cell list, without row lists.
+        Games with 8+ players are always sent as "bytes" (see wire_format);
+        get_state labels them accordingly.
+        """
+        return encode_cells(self.board_bytes(), fmt, len(self.players))[0]
+
+    def get_state(self, include_board: bool = True, board_format: Optional[str] = None,
+                  include_threats: bool = True) -> dict:
+        """
+        JSON-ready game state. Without the board, clients that follow the moves
+        can also skip "threats" (include_threats=False) and apply each move's
+        "threats" changes (delta_to_dict) instead of the whole map.
+        """
+        scores = {pid: self._totals[i + 1] for i, pid in enumerate(self.players)}
+
+        state = {
             "size": self.size,
-            "board": self.board,
             "players": self.players,
             "turn_idx": self.turn_idx,
             "current_player_id": self.current_player_id,
             "scores": scores,
             "winner": self.winner,
             "game_over": self.winner is not None,
-            "history_len": len(self.history)
+            "history_len": len(self.history),
+            "version": self.version,
         }
+        if include_threats:
+            state["threats"] = self.threats()
+        if include_board:
+            if board_format:
+                state["board"], state["board_format"] = encode_cells(self.board_bytes(), board_format,
+                                                                      len(self.players))
+            else:
+                state["board"] = self.board
+        return state
+
+    def region_bytes(self, r: int, c: int, rows: int, cols: int) -> bytes:
+        """One byte per cell of the rows x cols rectangle at (r, c), row-major. Must lie on the board."""
+        n = self.size
+        cells = self._cells
+        out = bytearray()
+        for row in range(r, r + rows):
+            start = row * n + c
+            out += bytes(cells[start:start + cols])
+        return bytes(out)
+
+    def changed_chunks(self, version: int) -> Optional[Set[Tuple[int, int]]]:
+        """
+        (row, col) of every CHUNK x CHUNK block with a cell changed after
+        `version`; None if that can't be derived (see deltas_since).
+        """
+        deltas = self.deltas_since(version)
+        if deltas is None:
+            return None
+        n, k = self.size, self.CHUNK
+        res = set()
+        for d in deltas:
+            for cell in (d.cell, *d.flips):
+                r, c = divmod(cell, n)
+                res.add((r // k, c // k))
+        return res
+
+    def get_view(self, r: int, c: int, rows: int, cols: int, since: Optional[int] = None,
+                 board_format: Optional[str] = None) -> dict:
+        """
+        get_state for a viewport: instead of "board", "chunks" holds the CHUNK x
+        CHUNK blocks (clipped at the board edge) overlapping the rows x cols
+        rectangle at (r, c), each {"r", "c", "rows", "cols", "board"} with "board"
+        shaped like get_state's; "threats" only lists cells in the rectangle.
+        With `since` (a version the client already has) only blocks changed
+        after it are sent and "since" is set; if those aren't known, every
+        overlapping block is.
+        """
+        n, k = self.size, self.CHUNK
+        r0, c0 = max(r, 0), max(c, 0)
+        r1, c1 = min(r + rows, n), min(c + cols, n)
+        state = self.get_state(include_board=False, include_threats=False)
+        state["threats"] = self.threats((r0, c0, r1, c1))
+        state["chunk_size"] = k
+        state["view"] = {"r": r0, "c": c0, "rows": max(r1 - r0, 0), "cols": max(c1 - c0, 0)}
+        changed = self.changed_chunks(since) if since is not None else None
+        if changed is not None:
+            state["since"] = since
+        if board_format:
+            # One format for the whole game, so every chunk matches this label
+            board_format = state["board_format"] = wire_format(board_format, len(self.players))
+
+        chunks = []
+        if r1 > r0 and c1 > c0:
+            for cr in range(r0 // k, (r1 - 1) // k + 1):
+                for cc in range(c0 // k, (c1 - 1) // k + 1):
+                    if changed is not None and (cr, cc) not in changed:
+                        continue
+                    top, left = cr * k, cc * k
+                    h, w = min(k, n - top), min(k, n - left)
+                    raw = self.region_bytes(top, left, h, w)
+                    board = (encode_cells(raw, board_format, len(self.players))[0] if board_format
+                             else [list(raw[i * w:(i + 1) * w]) for i in range(h)])
+                    chunks.append({"r": top, "c": left, "rows": h, "cols": w, "board": board})
+        state["chunks"] = chunks
+        return state
+
+    def threats(self, region: Optional[Tuple[int, int, int, int]] = None) -> Dict[str, List[Tuple[int, int]]]:
+        """
+        Per player, their cells an opponent could capture with one placement:
+        cells with an empty neighbor where some opponent has at least as many
+        neighbors as the owner (placing there would tip it over). Same rule as
+        the "!" markers of the clients; the early-game restriction is ignored.
+        `region` (r0, c0, r1, c1) keeps only cells with r0 <= r < r1, c0 <= c < c1.
+        """
+        res: Dict[str, List[Tuple[int, int]]] = {pid: [] for pid in self.players}
+        n = self.size
+        for cell in sorted(self._threatened):
+            r, c = divmod(cell, n)
+            if region and not (region[0] <= r < region[2] and region[1] <= c < region[3]):
+                continue
+            res[self.players[self._threatened[cell] - 1]].append((r, c))
+        return res
+
+    def _neighbors(self, cell: int) -> Tuple[int, ...]:
+        return self._nbr_lists[cell]
+
+    def _is_threatened(self, cell: int) -> bool:
+        owner = self._cells[cell]
+        counts = self._nbr_counts
+        if not owner or not counts[0][cell]:
+            return False
+        own = counts[owner][cell]
+        return any(counts[v][cell] >= own for v in range(1, len(counts)) if v != owner)
+
+    def _update_threats(self, cells) -> List[Tuple[int, int]]:
+        """
+        Re-check the given cells and their neighbors (a cell's status only
+        depends on those); returns the changes as (cell, owner), owner 0 = cleared.
+        """
+        region = set()
+        for cell in cells:
+            region.add(cell)
+            region.update(self._neighbors(cell))
+        threatened = self._threatened
+        changes = []
+        for cell in sorted(region):
+            old = threatened.get(cell, 0)
+            new = self._cell_value(cell) if self._is_threatened(cell) else 0
+            if new != old:
+                changes.append((cell, new))
+                if new:
+                    threatened[cell] = new
+                else:
+                    del threatened[cell]
+        return changes
+
+    def _cell_value(self, cell: int) -> int:
+        return self._cells[cell]
+
+    def deltas_since(self, version: int) -> Optional[List[Delta]]:
+        """
+        History entries made after `version`, oldest first. None if that can't be
+        derived (unknown version, or a move was taken back since then).
+        """
+        if version < self._linear_since or version > self.version:
+            return None
+        k = self.version - version
+        return self.history[len(self.history) - k:] if k else []
+
+    def delta_to_dict(self, delta: Delta) -> dict:
+        """
+        JSON form of a history entry: {"p": player number, "r", "c",
+        "flips": [[r, c], ...], "waves": [[[r, c], ...], ...] (flips split into
+        cascade waves), "threats": [[r, c, p], ...]} (threat map changes, p = 0
+        for cells no longer threatened).
+        """
+        n = self.size
+        r, c = divmod(delta.cell, n)
+        return {"p": delta.prev_turn_idx + 1, "r": r, "c": c, "flips": [divmod(f, n) for f in delta.flips],
+                "waves": [[divmod(f, n) for f in wave] for wave in delta.waves()],
+                "threats": [(*divmod(cell, n), p) for cell, p in delta.threats]}
 
     def get_legal_moves(self, player_num: int) -> List[Tuple[int, int]]:
         """
         Get all legal moves for a player.
-        IMPORTANT: In the early game (first 2 moves total), 
+        IMPORTANT: In the early game (first 2 moves total),
         players cannot place adjacent to opponent pieces.
         """
-        empty_cells = []
-        for r in range(self.size):
-            for c in range(self.size):
-                if self.board[r][c] == 0:
-                    empty_cells.append((r, c))
-        
-        # Count pieces for each player
-        player_counts = {i: 0 for i in range(1, len(self.players) + 1)}
-        for r in range(self.size):
-            for c in range(self.size):
-                val = self.board[r][c]
-                if val > 0:
-                    player_counts[val] += 1
-        
-        my_count = player_counts[player_num]
-        total_placed = sum(player_counts.values())
-        
+        n = self.size
+        return [divmod(i, n) for i in _iter_bits(self._legal_mask(player_num))]
+
+    def random_legal_move(self, rng: random.Random) -> Optional[Tuple[int, int]]:
+        """
+        A uniformly random legal move for the current player, None if there is
+        none. Same draw as rng.choice(get_legal_moves(...)); SparseGameEngine
+        samples cells instead of listing every empty one.
+        """
+        moves = self.get_legal_moves(self.current_player_num)
+        return rng.choice(moves) if moves else None
+
+    def _legal_mask(self, player_num: int) -> int:
+        empty = self._masks[0]
+        counts = self._totals[1:]
+
         # Early game restriction: if <= 1 piece per player and at least 1 piece on board,
         # cannot place adjacent to opponent
-        if total_placed > 0 and all(count <= 1 for count in player_counts.values()):
-            # Filter out cells adjacent to opponents
-            legal = []
-            for r, c in empty_cells:
-                can_place = True
-                for nr, nc in self._neighbors(r, c):
-                    neighbor_val = self.board[nr][nc]
-                    if neighbor_val != 0 and neighbor_val != player_num:
-                        can_place = False
-                        break
-                if can_place:
-                    legal.append((r, c))
-            
-            # If filtered list is not empty, use it; otherwise fall back to all empty
+        if sum(counts) > 0 and max(counts) <= 1:
+            blocked = 0
+            for p_num in range(1, len(self._masks)):
+                if p_num != player_num and self._masks[p_num]:
+                    # At most one piece here, so its index is the mask's only bit
+                    blocked |= self._nbr_masks[self._masks[p_num].bit_length() - 1]
+            legal = empty & ~blocked
+            # If filtered set is not empty, use it; otherwise fall back to all empty
             if legal:
                 return legal
-        
-        return empty_cells
+
+        return empty
 
     def is_valid_move(self, r: int, c: int, player_id: str) -> bool:
         if self.winner:
@@ -102,110 +499,216 @@ class GameEngine:
             return False
         if not (0 <= r < self.size and 0 <= c < self.size):
             return False
-        if self.board[r][c] != 0:
+        cell = r * self.size + c
+        if self._cells[cell] != 0:
             return False
-        
-        # Check if move is in legal moves list
-        legal_moves = self.get_legal_moves(self.current_player_num)
-        return (r, c) in legal_moves
+
+        # Check if move is in legal moves set
+        return bool(self._legal_mask(self.current_player_num) >> cell & 1)
 
     def make_move(self, r: int, c: int, player_id: str) -> dict:
         if not self.is_valid_move(r, c, player_id):
             return {"ok": False, "error": "Invalid move"}
 
+        delta = self.apply((r, c))
+        self.history.append(delta)
+        self.version += 1
+        delta.threats = self._update_threats((delta.cell, *delta.flips))
+
+        n = self.size
+        return {
+            "ok": True,
+            "flips": [divmod(f, n) for f in delta.flips],
+            "waves": [[divmod(f, n) for f in wave] for wave in delta.waves()],
+            "next_player": self.current_player_id
+        }
+
+    def unmake_move(self) -> Optional[Delta]:
+        """Take back the last move made with make_move (pops it from history)."""
+        if not self.history:
+            return None
+        delta = self.history.pop()
+        self.undo(delta)
+        self._update_threats((delta.cell, *delta.flips))
+        self.version += 1
+        self._linear_since = self.version
+        return delta
+
+    def apply(self, move: Tuple[int, int]) -> Delta:
+        """
+        Play `move` (r, c) for the current player without validation or history.
+        The returned Delta undoes it via undo(); for search and analysis.
+
+        Neither apply/undo nor their overrides (SparseGameEngine.apply) touch
+        the threat map: like the history, threats() is kept only by
+        make_move/unmake_move, which pass the placed and flipped cells to
+        _update_threats. An engine with its own cell storage must override
+        _is_threatened with the same rule (see threats()); the sparse/dense
+        parity tests hold the two to it.
+        """
         p_num = self.current_player_num
-        self.board[r][c] = p_num
-        
-        # Каскадная логика захвата
+        cells = self._cells
+        nbr_lists = self._nbr_lists
+        r, c = move
+        cell = r * self.size + c
+        delta = Delta(self.current_player_id, cell, [], [], self.turn_idx, self.winner)
+        self._set_cell(cell, p_num)
+
+        # Каскадная логика захвата, волна за волной
         # ВАЖНО: Проверяем только вражеские клетки!
-        processed_flips = []
-        check_queue = [(r, c)]
-        
-        while check_queue:
-            curr_r, curr_c = check_queue.pop(0)
-            
-            # Проверяем соседей текущей клетки
-            for nr, nc in self._neighbors(curr_r, curr_c):
-                target_val = self.board[nr][nc]
-                
-                # Пропускаем пустые и свои клетки
-                if target_val == 0 or target_val == p_num:
-                    continue
-                
-                # Это вражеская клетка - проверяем условие захвата
-                if self._should_capture(nr, nc, p_num, target_val):
-                    # Захватываем!
-                    self.board[nr][nc] = p_num
-                    processed_flips.append((nr, nc))
-                    
-                    # Если каскад включён, добавляем в очередь
-                    if self.cascade_enabled:
-                        check_queue.append((nr, nc))
-                            
-        self.history.append({
-            "player": player_id,
-            "move": (r,c),
-            "flips": len(processed_flips)
-        })
+        # Захваченная клетка сразу становится нашей, поэтому в очередь она
+        # попадает ровно один раз (повторов во фронте нет)
+        flips = delta.flips
+        flipped_from = delta.flipped_from
+        wave_sizes = delta.wave_sizes
+        frontier = deque((cell,))
+
+        while frontier:
+            before = len(flips)
+            # Текущая волна — всё, что сейчас во фронте; новые захваты идут в следующую
+            for _ in range(len(frontier)):
+                curr = frontier.popleft()
+
+                # Проверяем соседей текущей клетки
+                for nb in nbr_lists[curr]:
+                    target_val = cells[nb]
+
+                    # Пропускаем пустые и свои клетки
+                    if target_val == 0 or target_val == p_num:
+                        continue
+
+                    # Это вражеская клетка - проверяем условие захвата
+                    if self._should_capture(nb, p_num, target_val):
+                        # Захватываем!
+                        self._set_cell(nb, p_num)
+                        flips.append(nb)
+                        flipped_from.append(target_val)
+
+                        # Если каскад включён, добавляем в очередь
+                        if self.cascade_enabled:
+                            frontier.append(nb)
+            if len(flips) > before:
+                wave_sizes.append(len(flips) - before)
 
         # Next turn
         self.turn_idx = (self.turn_idx + 1) % len(self.players)
-        
+
         # Check game end
         self._check_winner()
-        
-        return {
-            "ok": True, 
-            "flips": processed_flips,
-            "next_player": self.current_player_id
-        }
 
-    def _neighbors(self, r, c) -> List[Tuple[int, int]]:
-        deltas = [(-1,-1),(-1,0),(-1,1),(0,-1),(0,1),(1,-1),(1,0),(1,1)]
-        res = []
-        for dr, dc in deltas:
-            nr, nc = r+dr, c+dc
-            if 0 <= nr < self.size and 0 <= nc < self.size:
-                res.append((nr, nc))
-        return res
+        if self.debug:
+            self._check_consistency()
+        return delta
+
+    def _apply_profiled(self, move: Tuple[int, int]) -> Delta:
+        """
+        apply() timed from outside, so there is one cascade implementation.
+        Capture checks and winner time come from the shadowed _should_capture
+        and _check_winner; the rest is read off the returned Delta.
+        """
+        prof = self.profile
+        winner_before = prof.winner_seconds
+        started = time.perf_counter()
+        delta = type(self).apply(self, move)
+        elapsed = time.perf_counter() - started
+        flips = delta.flips
+        waves = len(delta.wave_sizes)
+        # The placed cell and, with cascade on, every captured one is queued
+        # once and has all of its neighbors read
+        queued = (delta.cell, *flips) if self.cascade_enabled else (delta.cell,)
+        prof.moves += 1
+        prof.cascade_waves += waves
+        prof.max_cascade_waves = max(prof.max_cascade_waves, waves)
+        prof.queue_pushes += len(queued)
+        prof.neighbor_reads += sum(len(self._neighbors(c)) for c in queued)
+        prof.flips += len(flips)
+        prof.max_flips = max(prof.max_flips, len(flips))
+        prof.cascade_seconds += elapsed - (prof.winner_seconds - winner_before)
+        return delta
+
+    def _should_capture_profiled(self, cell, attacker_val, defender_val) -> bool:
+        self.profile.capture_checks += 1
+        return type(self)._should_capture(self, cell, attacker_val, defender_val)
+
+    def _check_winner_profiled(self):
+        started = time.perf_counter()
+        type(self)._check_winner(self)
+        self.profile.winner_seconds += time.perf_counter() - started
 
-    def _count_neighbors(self, r, c, val) -> int:
-        count = 0
-        for nr, nc in self._neighbors(r, c):
-            if self.board[nr][nc] == val:
-                count += 1
-        return count
+    def _legal_mask_profiled(self, player_num: int) -> int:
+        started = time.perf_counter()
+        mask = type(self)._legal_mask(self, player_num)
+        self.profile.legal_scans += 1
+        self.profile.legal_seconds += time.perf_counter() - started
+        return mask
 
-    def _should_capture(self, r, c, attacker_val, defender_val) -> bool:
-        # The target cell is at (r,c) with value defender_val.
+    def undo(self, delta: Delta) -> None:
+        """Revert a move returned by apply(). Deltas must be undone newest first."""
+        for cell, old in zip(delta.flips, delta.flipped_from):
+            self._set_cell(cell, old)
+        self._set_cell(delta.cell, 0)
+        self.turn_idx = delta.prev_turn_idx
+        self.winner = delta.prev_winner
+
+        if self.debug:
+            self._check_consistency()
+
+    def _set_cell(self, cell: int, val: int) -> None:
+        """Change one cell's value, keeping every incremental table in sync (O(8))."""
+        old = self._cells[cell]
+        if old == val:
+            return
+        bit = 1 << cell
+        nbrs = self._nbr_lists[cell]
+
+        self._masks[old] &= ~bit
+        self._totals[old] -= 1
+        old_counts = self._nbr_counts[old]
+        for nb in nbrs:
+            old_counts[nb] -= 1
+
+        self._masks[val] |= bit
+        self._totals[val] += 1
+        new_counts = self._nbr_counts[val]
+        for nb in nbrs:
+            new_counts[nb] += 1
+
+        self._cells[cell] = val
+
+    def _check_consistency(self) -> None:
+        """Debug check: recount everything from _cells and compare with the incremental tables."""
+        values = len(self.players) + 1
+        masks = [0] * values
+        totals = [0] * values
+        nbr_counts = [[0] * len(self._cells) for _ in range(values)]
+        for cell, v in enumerate(self._cells):
+            masks[v] |= 1 << cell
+            totals[v] += 1
+            for nb in self._nbr_lists[cell]:
+                nbr_counts[v][nb] += 1
+        assert masks == self._masks, "bitmasks out of sync with cells"
+        assert totals == self._totals, "piece totals out of sync with cells"
+        assert nbr_counts == self._nbr_counts, "neighbor counts out of sync with cells"
+
+    def _should_capture(self, cell, attacker_val, defender_val) -> bool:
+        # The target cell has value defender_val.
         # Attacker is attacker_val.
-        # Condition: Attacker neighbors > Defender neighbors around (r,c)
-        att_count = self._count_neighbors(r, c, attacker_val)
-        def_count = self._count_neighbors(r, c, defender_val)
-        return att_count > def_count
+        # Condition: Attacker neighbors > Defender neighbors around the cell
+        counts = self._nbr_counts
+        return counts[attacker_val][cell] > counts[defender_val][cell]
 
     def _check_winner(self):
         # Game ends if board full or only one player left (wipeout)
-        counts = {i:0 for i in range(1, len(self.players)+1)}
-        empty = 0
-        for r in range(self.size):
-            for c in range(self.size):
-                v = self.board[r][c]
-                if v == 0:
-                    empty += 1
-                else:
-                    counts[v] += 1
-        
-        active_players = [i for i, c in counts.items() if c > 0]
-        total_placed = sum(counts.values())
-        
+        counts = {i: self._totals[i] for i in range(1, len(self._totals))}
+
         # If board is full, game over
-        if empty == 0:
+        if self._totals[0] == 0:
             self._finalize_winner(counts)
             return
-        
+
         # If at least 2 pieces placed and only one player has pieces, they win
-        if total_placed >= 2 and len(active_players) == 1:
+        active_players = [i for i, c in counts.items() if c > 0]
+        if self.size * self.size - self._totals[0] >= 2 and len(active_players) == 1:
             self._finalize_winner(counts)
             return
 
@@ -214,7 +717,7 @@ class GameEngine:
         best_p_num = -1
         max_score = -1
         tie = False
-        
+
         for p_num, score in counts.items():
             if score > max_score:
                 max_score = score
@@ -222,7 +725,7 @@ class GameEngine:
                 tie = False
             elif score == max_score:
                 tie = True
-        
+
         if tie:
             self.winner = "draw"
         else:
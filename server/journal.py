@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+import json
+import os
+import queue
+import re
+import threading
+from typing import Iterator, List, Optional, Tuple
+
+_SEGMENT_RE = re.compile(r"^journal-(\d+)\.log$")
+SNAPSHOT_FILE = "snapshot.json"
+
+
+class Journal:
+    """
+    Append-only log of store changes, one compact JSON array per line:
+        [kind, seq, code, ...fields]
+    `seq` increases across the whole journal. Records are handed to a writer
+    thread, which writes whatever has queued up and fsyncs once per batch (group
+    commit), so append() never waits for the disk.
+
+    The log is split into numbered segments. A snapshot names the first segment
+    that has to be replayed after it; older segments are deleted once the
+    snapshot is on disk. Each process starts a fresh segment, so a torn last
+    line from a crash is only ever at the end of an old segment.
+    """
+
+    def __init__(self, directory: str, snapshot_every: int = 5000):
+        self.directory = directory
+        self.snapshot_every = snapshot_every
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._segment = max(self._segments(), default=0) + 1
+        self.records_since_snapshot = 0
+
+        self._queue: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._file = open(self._segment_path(self._segment), "a", encoding="utf-8")
+        self._thread = threading.Thread(target=self._writer, name="journal-writer", daemon=True)
+        self._thread.start()
+
+    # ---- reading (startup) ----
+
+    def load(self) -> Tuple[Optional[dict], Iterator[list]]:
+        """
+        The last snapshot (or None) and the records written after it, oldest
+        first. Call before appending anything: it also moves `seq` past every
+        record already on disk.
+        """
+        snapshot = None
+        path = os.path.join(self.directory, SNAPSHOT_FILE)
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                snapshot = json.load(f)
+            self._seq = max(self._seq, snapshot.get("seq", 0))
+        first = snapshot["segment"] if snapshot else 0
+        segments = [n for n in self._segments() if first <= n < self._segment]
+
+        records = []
+        for n in segments:
+            with open(self._segment_path(n), encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:
+                        break  # torn write at the end of a crashed segment
+                    records.append(rec)
+                    self._seq = max(self._seq, rec[1])
+        return snapshot, iter(records)
+
+    # ---- writing ----
+
+    def append(self, kind: str, code: str, *fields) -> int:
+        """Queue one record and return its seq."""
+        with self._lock:
+            self._seq += 1
+            seq = self._seq
+            self.records_since_snapshot += 1
+        self._queue.put([kind, seq, code, *fields])
+        return seq
+
+    def rotate(self) -> Tuple[int, int]:
+        """
+        Start a new segment for everything appended from now on. Returns
+        (segment, seq): the new segment number and the last seq before it.
+        """
+        with self._lock:
+            self._segment += 1
+            self.records_since_snapshot = 0
+            segment, seq = self._segment, self._seq
+            self._queue.put(("rotate", segment))
+        return segment, seq
+
+    def write_snapshot(self, data: dict) -> None:
+        """
+        Atomically replace the snapshot, then drop the segments it covers.
+        `data` must carry the "segment" returned by the rotate() it was taken after.
+        """
+        path = os.path.join(self.directory, SNAPSHOT_FILE)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        self._queue.put(("prune", data["segment"]))
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until everything appended so far is on disk."""
+        done = threading.Event()
+        self._queue.put(("flush", done))
+        return done.wait(timeout)
+
+    def close(self) -> None:
+        self.flush()
+        self._queue.put(("stop", None))
+        self._thread.join()
+
+    def _writer(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            waiters: List[threading.Event] = []
+            stop = False
+            for item in batch:
+                if isinstance(item, list):
+                    self._file.write(json.dumps(item, separators=(",", ":")))
+                    self._file.write("\n")
+                    continue
+                op, arg = item
+                if op == "rotate":
+                    self._sync()
+                    self._file.close()
+                    self._file = open(self._segment_path(arg), "a", encoding="utf-8")
+                elif op == "prune":
+                    for n in self._segments():
+                        if n < arg:
+                            os.remove(self._segment_path(n))
+                elif op == "flush":
+                    waiters.append(arg)
+                elif op == "stop":
+                    stop = True
+
+            self._sync()
+            for w in waiters:
+                w.set()
+            if stop:
+                self._file.close()
+                return
+
+    def _sync(self) -> None:
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def _segments(self) -> List[int]:
+        res = []
+        for name in os.listdir(self.directory):
+            m = _SEGMENT_RE.match(name)
+            if m:
+                res.append(int(m.group(1)))
+        return sorted(res)
+
+    def _segment_path(self, n: int) -> str:
+        return os.path.join(self.directory, f"journal-{n:06d}.log")
@@ -1,14 +1,39 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+from concurrent.futures import Executor
+import cProfile
+import io
+import pstats
+from dataclasses import dataclass, field
 from typing import Dict, List, Optional, Tuple
+import bisect
+import heapq
+import itertools
+import json
 import secrets
 import string
 import threading
 import time
 import random
 
-from game_engine import GameEngine
+from game_engine import EngineProfile, GameEngine
+from bots import AlphaBetaBot, Bot, MCTSBot
+from events import Event, EventChannel
+from journal import Journal
+from metrics import MOVE_BUCKETS, Histogram, LockTimer
+from opening_book import BookShelf
+from replay import Replay
+from sparse_engine import engine_class
+from storage import MemoryBackend, StorageBackend, encode_players
+
+CONFLICT = {"ok": False, "error": "Lobby changed meanwhile, try again"}
+
+# Lobby formats (board sizes) players can pick
+FORMATS = ("6x6", "8x8", "10x10", "16x16")
+# Large boards for many players, on SparseGameEngine; no bots, and clients
+# should read them through get_game_view
+ARENA_FORMATS = ("64x64", "128x128", "256x256")
+
 
 def _now() -> float:
     return time.time()
@@ -23,6 +48,17 @@ def _norm_code(code: str) -> str:
     return (code or "").strip().upper()
 
 
+def _format_size(game_format: str) -> int:
+    try:
+        return int(game_format.split('x')[0])
+    except ValueError:
+        return 8
+
+
+def _game_etag(lobby: "Lobby") -> str:
+    return f"{lobby.code}-{lobby.game.version}-{lobby.rev}"
+
+
 @dataclass
 class Player:
     player_id: str
@@ -30,6 +66,7 @@ class Player:
     is_host: bool
     joined_at: float
     last_seen: float
+    is_bot: bool = False
 
 
 @dataclass
@@ -41,6 +78,24 @@ class Lobby:
     started: bool
     players: Dict[str, Player]
     game: Optional[GameEngine] = None  # The actual game instance
+    bots: Dict[str, Bot] = field(default_factory=dict)  # player_id -> bot
+    bot_pending: bool = False  # a bot's search for the current turn is running
+    rev: int = 0  # bumped by every saved change; the backend's version of the lobby
+    events: EventChannel = field(default_factory=EventChannel)
+    # Guards everything above; the store lock only guards which lobbies exist
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+    closed: bool = False  # removed from the store; set under `lock`
+    seq: int = 0  # creation order, used as the listing cursor
+    journal_seq: int = 0  # seq of the last journal record for this lobby
+    # Encoded game state for the current version and roster, keyed by
+    # (since, board_format); cleared on every move and roster change
+    state_cache: Dict[Tuple[Optional[int], Optional[str]], bytes] = field(default_factory=dict, repr=False)
+    replay: Optional[Tuple[GameEngine, Replay]] = field(default=None, repr=False)  # finished game -> its replay
+    # cProfile of every `profile_every`-th move while profiling this lobby (see set_profiling)
+    profiler: Optional[cProfile.Profile] = field(default=None, repr=False)
+    profile_every: int = 1
+    moves_seen: int = 0
+    moves_profiled: int = 0
 
     def host(self) -> Optional[Player]:
         for p in self.players.values():
@@ -48,6 +103,39 @@ class Lobby:
                 return p
         return None
 
+    def has_humans(self) -> bool:
+        return any(not p.is_bot for p in self.players.values())
+
+    def reassign_host(self) -> None:
+        """Make the longest-present human host if nobody is (bots never host)."""
+        if any(p.is_host for p in self.players.values()):
+            return
+        humans = sorted((p for p in self.players.values() if not p.is_bot), key=lambda x: x.joined_at)
+        if humans:
+            humans[0].is_host = True
+
+    def public_state(self) -> dict:
+        host = self.host()
+        return {
+            "ok": True,
+            "code": self.code,
+            "format": self.game_format,
+            "started": self.started,
+            "players": self.player_list(),
+            "players_count": len(self.players),
+            "max_players": self.max_players,
+            "host_nick": host.nick if host else None,
+        }
+
+    def listing_entry(self) -> dict:
+        return {
+            "code": self.code,
+            "format": self.game_format,
+            "players": len(self.players),
+            "max_players": self.max_players,
+            "created_at": self.created_at,
+        }
+
     def player_list(self) -> List[dict]:
         items = sorted(self.players.values(), key=lambda p: p.joined_at)
         return [
@@ -55,6 +143,7 @@ class Lobby:
                 "player_id": p.player_id,
                 "nick": p.nick,
                 "is_host": p.is_host,
+                "is_bot": p.is_bot,
                 "last_seen": p.last_seen,
             }
             for p in items
@@ -62,82 +151,246 @@ class Lobby:
 
 
 class LobbyStore:
-    def __init__(self, max_players: int = 5, player_timeout_seconds: int = 35):
-        self._lock = threading.Lock()
-        self._lobbies: Dict[str, Lobby] = {}
+    """
+    Locking: `_lock` guards only the code -> lobby dict and is held just for
+    lookups, inserts and removals. Everything inside a lobby (players, game,
+    bots) is guarded by that lobby's own `lock`, so a long cascade in one game
+    doesn't hold up the others. Lock order is lobby.lock -> _lock, never the
+    reverse; a lobby removed while someone waited on its lock has `closed` set.
+
+    Timeouts: `_expiry` is a min-heap of (deadline, code, player_id) with at most
+    one entry per human player. ping() only bumps last_seen; cleanup() pops the
+    entries whose deadline passed and either drops the player or pushes a new
+    entry for their current deadline. So cleanup work follows deadlines, not the
+    number of players, and entries for players or lobbies that are gone are
+    simply discarded when they come up.
+
+    Persistence: with a `journal`, every create/join/leave/start/move is
+    appended to it (under the lobby lock, so per-lobby order matches seq order)
+    and the store is rebuilt from the last snapshot plus the journal on startup.
+    snapshot() is cheap to call often; maybe_snapshot() does it every
+    journal.snapshot_every records.
+
+    Storage: every change is saved through `backend` (see storage.py). With a
+    shared backend other processes change lobbies too, so each operation first
+    re-reads its lobby if the stored version moved (_sync) and saves with
+    compare-and-swap on the version it read (_commit). Events, bots and caches
+    stay per process: SSE subscribers only hear about changes made by their
+    own process and fall back to polling for the rest.
+    """
+
+    def __init__(self, max_players: int = 5, player_timeout_seconds: int = 35,
+                 bot_time_budget: float = 1.0, bot_pool: Optional[Executor] = None,
+                 journal: Optional[Journal] = None, backend: Optional[StorageBackend] = None,
+                 engine_profile: bool = False, arena_max_players: int = 16,
+                 books: Optional[BookShelf] = None):
+        # Every store and lobby lock reports wait/hold times (see /metrics)
+        self._store_locks = LockTimer("store")
+        self._lobby_locks = LockTimer("lobby")
+        self.lock_timers = (self._store_locks, self._lobby_locks)
+        self._lock = self._store_locks.lock()
+        self._lobbies: Dict[str, Lobby] = {}  # every lobby, or those this process has touched (shared backend)
+        self.backend = backend or MemoryBackend()
         self.max_players = int(max_players)
         self.player_timeout_seconds = int(player_timeout_seconds)
-        self.formats = ["6x6", "8x8", "10x10", "16x16"]
+        self.bot_time_budget = float(bot_time_budget)
+        # Process pool for MCTS bots; without one they search on a thread
+        self.bot_pool = bot_pool
+        self.formats = list(FORMATS)
+        self.arena_formats = list(ARENA_FORMATS)
+        self.arena_max_players = int(arena_max_players)
+        # board size -> time spent in _apply_move
+        self.move_seconds: Dict[int, Histogram] = {
+            _format_size(f): Histogram(MOVE_BUCKETS, f'size="{_format_size(f)}"')
+            for f in self.formats + self.arena_formats}
+        self.bot_kinds = ["mcts", "alphabeta"]
+        # Opening books the bots play from before searching (see opening_book.py)
+        self.books = books
+        # Count and time engine internals in every game (EngineProfile); lobbies
+        # being profiled with set_profiling get it regardless
+        self.engine_profile = engine_profile
+        # "changed" events whenever the open-lobby list may have changed
+        self.lobby_list_events = EventChannel()
+        self._expiry: List[Tuple[float, str, str]] = []
+        self._expiry_lock = threading.Lock()  # leaf lock, taken last
+
+        # Open (not started) lobbies in creation order, all and per format, with
+        # their listing entries; guarded by _lock. Any change bumps
+        # _index_version, which drops every cached listing page.
+        self._seq = itertools.count(1)
+        self._open: Dict[str, dict] = {}
+        self._open_by_format: Dict[str, Dict[str, dict]] = {f: {} for f in self.formats + self.arena_formats}
+        self._index_version = 0
+        self._listing_cache: Dict[tuple, Tuple[bytes, Optional[str]]] = {}
+        self._listing_cache_version = -1
+        # format -> (entries oldest first, their seqs), rebuilt once per version
+        self._open_views: Dict[Optional[str], Tuple[List[dict], List[int]]] = {}
+
+        self._stats_lock = threading.Lock()  # leaf lock for the counters below
+        self.state_cache_hits = 0
+        self.state_cache_misses = 0
+        self.engine_totals = EngineProfile()  # profiles of games no longer in the store
+
+        self.journal = journal
+        if journal:
+            self._restore()
 
     def _new_player(self, nick: str, is_host: bool) -> Player:
         pid = secrets.token_urlsafe(10)
         t = _now()
         return Player(player_id=pid, nick=nick, is_host=is_host, joined_at=t, last_seen=t)
 
+    def _schedule_expiry(self, code: str, player: Player) -> None:
+        if self.backend.shared:
+            return  # presence is tracked by the backend
+        entry = (player.last_seen + self.player_timeout_seconds, code, player.player_id)
+        with self._expiry_lock:
+            heapq.heappush(self._expiry, entry)
+
     def create_lobby(self, host_nick: str, game_format: str) -> Tuple[Lobby, Player]:
+        host = self._new_player(host_nick, is_host=True)
         with self._lock:
             while True:
                 code = _gen_code(6)
-                if code not in self._lobbies:
+                if code in self._lobbies:
+                    continue
+
+                lobby = Lobby(
+                    code=code,
+                    game_format=game_format,
+                    max_players=(self.arena_max_players if game_format in self.arena_formats
+                                 else self.max_players),
+                    created_at=_now(),
+                    started=False,
+                    players={host.player_id: host},
+                    seq=next(self._seq),
+                    lock=self._lobby_locks.lock(),
+                )
+                if self.backend.insert(lobby):
                     break
 
-            host = self._new_player(host_nick, is_host=True)
-            lobby = Lobby(
-                code=code,
-                game_format=game_format,
-                max_players=self.max_players,
-                created_at=_now(),
-                started=False,
-                players={host.player_id: host},
-            )
+            # Logged before the lobby is visible, so nothing about it can precede this
+            self._log(lobby, "c", game_format, lobby.max_players, lobby.created_at,
+                      host.player_id, host.nick)
             self._lobbies[code] = lobby
-            return lobby, host
+            self._index_put(lobby)
+        self._schedule_expiry(code, host)
+        self.lobby_list_events.publish("changed", {"code": code})
+        return lobby, host
 
     def get_lobby(self, code: str) -> Optional[Lobby]:
         code = _norm_code(code)
         with self._lock:
-            return self._lobbies.get(code)
+            lobby = self._lobbies.get(code)
+        if lobby or not self.backend.shared:
+            return lobby
 
-    def list_public(self) -> List[dict]:
+        # Created by another process: load it once, then _sync keeps it current
+        record = self.backend.load(code)
+        if not record:
+            return None
+        lobby = Lobby(code=code, game_format=record["format"], max_players=record["max_players"],
+                      created_at=record["created_at"], started=False, players={},
+                      lock=self._lobby_locks.lock())
+        self._load_into(lobby, record)
         with self._lock:
-            res = []
-            for lobby in self._lobbies.values():
-                if lobby.started:
-                    continue
-                res.append({
-                    "code": lobby.code,
-                    "format": lobby.game_format,
-                    "players": len(lobby.players),
-                    "max_players": lobby.max_players,
-                    "created_at": lobby.created_at,
-                })
-            res.sort(key=lambda x: x["created_at"], reverse=True)
-            return res
+            return self._lobbies.setdefault(code, lobby)
 
-    def get_public_state(self, code: str) -> dict:
-        code = _norm_code(code)
+    def _all_lobbies(self) -> List[Lobby]:
         with self._lock:
-            lobby = self._lobbies.get(code)
-            if not lobby:
-                return {"ok": False, "error": "Lobby not found"}
+            return list(self._lobbies.values())
 
-            host = lobby.host()
-            return {
-                "ok": True,
-                "code": lobby.code,
-                "format": lobby.game_format,
-                "started": lobby.started,
-                "players": lobby.player_list(),
-                "players_count": len(lobby.players),
-                "max_players": lobby.max_players,
-                "host_nick": host.nick if host else None,
-            }
+    # Open-lobby index (callers hold _lock)
 
-    def join_lobby(self, code: str, nick: str) -> dict:
-        code = _norm_code(code)
+    def _index_put(self, lobby: Lobby) -> None:
+        entry = lobby.listing_entry()
+        entry["_seq"] = lobby.seq
+        self._open[lobby.code] = entry
+        self._open_by_format.setdefault(lobby.game_format, {})[lobby.code] = entry
+        self._index_version += 1
+
+    def _index_drop(self, lobby: Lobby) -> None:
+        if self._open.pop(lobby.code, None) is not None:
+            self._open_by_format.get(lobby.game_format, {}).pop(lobby.code, None)
+            self._index_version += 1
+
+    def _index_update(self, lobby: Lobby) -> None:
+        """Re-list a lobby after a roster change or start (lobby.lock held)."""
         with self._lock:
-            lobby = self._lobbies.get(code)
-            if not lobby:
+            if lobby.started or lobby.closed:
+                self._index_drop(lobby)
+            elif self._lobbies.get(lobby.code) is lobby:
+                self._index_put(lobby)
+
+    def list_public(self, game_format: Optional[str] = None, limit: Optional[int] = None,
+                    cursor: Optional[str] = None) -> List[dict]:
+        """Open lobbies, newest first. See list_public_json for the arguments."""
+        body, _ = self.list_public_json(game_format, limit, cursor)
+        return json.loads(body)
+
+    def list_public_json(self, game_format: Optional[str] = None, limit: Optional[int] = None,
+                         cursor: Optional[str] = None) -> Tuple[bytes, Optional[str]]:
+        """
+        Encoded page of open lobbies, newest first, and the cursor for the next
+        page (None on the last one). `cursor` is a value returned earlier; the
+        page starts right after that lobby. Pages are cached until the index
+        changes, so repeated polls of an unchanged list are one dict lookup.
+        """
+        key = (game_format, limit, cursor)
+        version = self.backend.change_token() if self.backend.shared else self._index_version
+        with self._lock:
+            if self._listing_cache_version != version:
+                self._listing_cache = {}
+                self._open_views = {}
+                self._listing_cache_version = version
+            page = self._listing_cache.get(key)
+            if page is None:
+                page = self._listing_cache[key] = self._build_listing(game_format, limit, cursor)
+            return page
+
+    def _build_listing(self, game_format: Optional[str], limit: Optional[int],
+                       cursor: Optional[str]) -> Tuple[bytes, Optional[str]]:
+        if self.backend.shared:
+            try:
+                seq = int(cursor) if cursor else None
+            except ValueError:
+                seq = None
+            page, next_seq = self.backend.list_open(game_format, limit, seq)
+            return json.dumps(page, separators=(",", ":")).encode(), (str(next_seq) if next_seq else None)
+
+        view = self._open_views.get(game_format)
+        if view is None:
+            entries = self._open if game_format is None else self._open_by_format.get(game_format, {})
+            items = list(entries.values())
+            view = self._open_views[game_format] = (items, [e["_seq"] for e in items])
+        items, seqs = view
+
+        end = len(items)
+        if cursor:
+            try:
+                end = bisect.bisect_left(seqs, int(cursor))
+            except ValueError:
+                pass
+        start = 0 if limit is None else max(0, end - limit)
+        page = [{k: v for k, v in e.items() if k != "_seq"} for e in reversed(items[start:end])]
+        next_cursor = str(items[start]["_seq"]) if start > 0 else None
+        return json.dumps(page, separators=(",", ":")).encode(), next_cursor
+
+    def get_public_state(self, code: str) -> dict:
+        lobby = self.get_lobby(code)
+        if not lobby:
+            return {"ok": False, "error": "Lobby not found"}
+        with lobby.lock:
+            if not self._sync(lobby):
+                return {"ok": False, "error": "Lobby not found"}
+            return lobby.public_state()
+
+    def join_lobby(self, code: str, nick: str) -> dict:
+        lobby = self.get_lobby(code)
+        if not lobby:
+            return {"ok": False, "error": "Lobby not found"}
+        with lobby.lock:
+            if not self._sync(lobby):
                 return {"ok": False, "error": "Lobby not found"}
             if lobby.started:
                 return {"ok": False, "error": "Lobby already started"}
@@ -150,6 +403,11 @@ class LobbyStore:
 
             p = self._new_player(nick, is_host=False)
             lobby.players[p.player_id] = p
+            if not self._commit(lobby):
+                return CONFLICT
+            self._log(lobby, "j", p.player_id, p.nick, p.joined_at, None)
+            self._schedule_expiry(lobby.code, p)
+            self._roster_event(lobby, "join")
             return {
                 "ok": True,
                 "code": lobby.code,
@@ -159,39 +417,224 @@ class LobbyStore:
             }
 
     def leave_lobby(self, code: str, player_id: str) -> bool:
-        code = _norm_code(code)
-        with self._lock:
-            lobby = self._lobbies.get(code)
-            if not lobby:
+        lobby = self.get_lobby(code)
+        if not lobby:
+            return False
+        with lobby.lock:
+            if not self._sync(lobby):
                 return False
             p = lobby.players.pop(player_id, None)
             if not p:
                 return False
+            lobby.bots.pop(player_id, None)
+            lobby.reassign_host()
 
-            if p.is_host and lobby.players:
-                remaining = sorted(lobby.players.values(), key=lambda x: x.joined_at)
-                remaining[0].is_host = True
-
-            if not lobby.players:
-                self._lobbies.pop(code, None)
+            # Bots alone don't keep a lobby alive
+            if not lobby.has_humans():
+                self._log(lobby, "l", player_id)
+                self._delete_lobby(lobby)
+            elif self._commit(lobby):
+                self._log(lobby, "l", player_id)
+                self._roster_event(lobby, "leave")
+            else:
+                return False
             return True
 
-    def ping(self, code: str, player_id: str) -> None:
-        code = _norm_code(code)
+    # Helpers below expect lobby.lock to be held
+
+    def _sync(self, lobby: Lobby) -> bool:
+        """Catch up with changes saved by other processes; False if the lobby is gone."""
+        if lobby.closed or not self.backend.shared:
+            return not lobby.closed
+        if self.backend.version(lobby.code) != lobby.rev:
+            record = self.backend.load(lobby.code)
+            if not record:
+                self._forget_lobby(lobby)
+                return False
+            self._load_into(lobby, record)
+        return True
+
+    def _commit(self, lobby: Lobby) -> bool:
+        """
+        Save the lobby after a change. False if another process saved first: the
+        lobby has then been reloaded from storage and the change is gone.
+        """
+        if not self.backend.save(lobby, lobby.rev):
+            # Force a full reload, including the engine we just changed
+            lobby.rev = -1
+            self._set_game(lobby, None)
+            self._sync(lobby)
+            return False
+        lobby.rev += 1
+        lobby.state_cache.clear()
+        return True
+
+    def _load_into(self, lobby: Lobby, record: dict) -> None:
+        lobby.rev = record["version"]
+        lobby.seq = record["seq"]
+        lobby.started = record["started"]
+        old_players, old_bots = lobby.players, lobby.bots
+        lobby.players, lobby.bots = {}, {}
+        for pid, nick, is_host, joined_at, bot_kind in record["players"]:
+            prev = old_players.get(pid)
+            lobby.players[pid] = Player(player_id=pid, nick=nick, is_host=is_host, joined_at=joined_at,
+                                        last_seen=prev.last_seen if prev else joined_at,
+                                        is_bot=bot_kind is not None)
+            if bot_kind:
+                bot = old_bots.get(pid)
+                lobby.bots[pid] = bot if bot and bot.kind == bot_kind else self._new_bot(bot_kind)
+
+        g = record["game"]
+        game = lobby.game
+        if g is None:
+            self._set_game(lobby, None)
+        elif not game or game.version != g["version"] or game.players != g["order"]:
+            # Keep our own engine (and its move history) if it is already at that version
+            size = _format_size(lobby.game_format)
+            self._set_game(lobby, engine_class(size).from_cells(size, g["order"], record["board"],
+                                                                g["turn_idx"], g["winner"], g["version"]))
+        lobby.state_cache.clear()
+        self._index_update(lobby)
+
+    def _set_game(self, lobby: Lobby, game: Optional[GameEngine]) -> None:
+        """Replace the lobby's engine, keeping engine profiles counted."""
+        old = lobby.game
+        if old is not None and old is not game and old.profile is not None:
+            with self._stats_lock:
+                self.engine_totals.merge(old.profile)
+        if game is not None and (self.engine_profile or lobby.profiler is not None):
+            game.enable_profile()
+        lobby.game = game
+
+    def _forget_lobby(self, lobby: Lobby) -> None:
+        """Drop a lobby from this process only (it is already gone from storage)."""
+        lobby.closed = True
+        self._set_game(lobby, None)
         with self._lock:
-            lobby = self._lobbies.get(code)
-            if not lobby:
-                return
+            if self._lobbies.get(lobby.code) is lobby:
+                del self._lobbies[lobby.code]
+                self._index_drop(lobby)
+        lobby.events.publish("closed", {})
+        lobby.events.close()
+        self.lobby_list_events.publish("changed", {"code": lobby.code})
+
+    def _log(self, lobby: Lobby, kind: str, *fields) -> None:
+        if self.journal:
+            lobby.journal_seq = self.journal.append(kind, lobby.code, *fields)
+
+    def _roster_event(self, lobby: Lobby, kind: str) -> None:
+        self._index_update(lobby)
+        lobby.events.publish(kind, {"lobby": lobby.public_state()})
+        self.lobby_list_events.publish("changed", {"code": lobby.code})
+
+    def _delete_lobby(self, lobby: Lobby) -> None:
+        self.backend.delete(lobby.code)
+        self._forget_lobby(lobby)
+
+    def _apply_move(self, lobby: Lobby, r: int, c: int, player_id: str) -> dict:
+        started = time.perf_counter()
+        size = _format_size(lobby.game_format)
+        profiler = lobby.profiler
+        if profiler is not None and lobby.moves_seen % lobby.profile_every == 0:
+            res = self._play_move_profiled(lobby, profiler, r, c, player_id)
+        else:
+            res = self._play_move(lobby, r, c, player_id)
+        lobby.moves_seen += 1
+        hist = self.move_seconds.get(size)
+        if hist is None:
+            hist = self.move_seconds.setdefault(size, Histogram(MOVE_BUCKETS, f'size="{size}"'))
+        hist.observe(time.perf_counter() - started)
+        return res
+
+    def _play_move_profiled(self, lobby: Lobby, profiler: cProfile.Profile,
+                            r: int, c: int, player_id: str) -> dict:
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler is active in this thread (or, on 3.12+, the process)
+            return self._play_move(lobby, r, c, player_id)
+        try:
+            return self._play_move(lobby, r, c, player_id)
+        finally:
+            profiler.disable()
+            lobby.moves_profiled += 1
+
+    def _play_move(self, lobby: Lobby, r: int, c: int, player_id: str) -> dict:
+        # A conflict means another process moved in this game since we synced;
+        # after the reload the move is checked again against the new position
+        for _ in range(3):
+            game = lobby.game
+            res = game.make_move(r, c, player_id)
+            if not res["ok"] or self._commit(lobby):
+                break
+            res = CONFLICT
+            if lobby.closed or not lobby.game:
+                return {"ok": False, "error": "Game not active"}
+        if res["ok"]:
+            self._log(lobby, "m", player_id, r, c)
+            # The move carries its threat changes; the whole map would cost O(pieces)
+            data = game.get_state(include_board=False, include_threats=False)
+            data["move"] = game.delta_to_dict(game.history[-1])
+            lobby.events.publish("move", data)
+            if game.winner:
+                lobby.events.publish("game_over", {"winner": game.winner, "scores": data["scores"]})
+        return res
+
+    def _new_bot(self, kind: str) -> Bot:
+        if kind == "alphabeta":
+            return AlphaBetaBot(time_budget=self.bot_time_budget, book=self.books)
+        return MCTSBot(time_budget=self.bot_time_budget, pool=self.bot_pool, book=self.books)
+
+    def add_bot(self, code: str, player_id: str, kind: str = "mcts") -> dict:
+        if kind not in self.bot_kinds:
+            return {"ok": False, "error": "Unknown bot kind"}
+        lobby = self.get_lobby(code)
+        if not lobby:
+            return {"ok": False, "error": "Lobby not found"}
+        with lobby.lock:
+            if not self._sync(lobby):
+                return {"ok": False, "error": "Lobby not found"}
+            p = lobby.players.get(player_id)
+            if not p or not p.is_host:
+                return {"ok": False, "error": "Only host can add bots"}
+            if lobby.started:
+                return {"ok": False, "error": "Lobby already started"}
+            if lobby.game_format in self.arena_formats:
+                return {"ok": False, "error": "Bots can't play arena formats"}
+            if len(lobby.players) >= lobby.max_players:
+                return {"ok": False, "error": "Lobby is full"}
+
+            nicks = {pl.nick.lower() for pl in lobby.players.values()}
+            n = 1
+            while f"bot {n}" in nicks:
+                n += 1
+            bot_player = self._new_player(f"Bot {n}", is_host=False)
+            bot_player.is_bot = True
+            lobby.players[bot_player.player_id] = bot_player
+            lobby.bots[bot_player.player_id] = self._new_bot(kind)
+            if not self._commit(lobby):
+                return CONFLICT
+            self._log(lobby, "j", bot_player.player_id, bot_player.nick, bot_player.joined_at, kind)
+            self._roster_event(lobby, "join")
+            return {"ok": True, "code": lobby.code, "player_id": bot_player.player_id, "nick": bot_player.nick}
+
+    def ping(self, code: str, player_id: str) -> None:
+        lobby = self.get_lobby(code)
+        if not lobby:
+            return
+        with lobby.lock:
             p = lobby.players.get(player_id)
             if not p:
                 return
             p.last_seen = _now()
+            self.backend.touch(lobby.code, player_id, p.last_seen)
 
     def start_lobby(self, code: str, player_id: str) -> dict:
-        code = _norm_code(code)
-        with self._lock:
-            lobby = self._lobbies.get(code)
-            if not lobby:
+        lobby = self.get_lobby(code)
+        if not lobby:
+            return {"ok": False, "error": "Lobby not found"}
+        with lobby.lock:
+            if not self._sync(lobby):
                 return {"ok": False, "error": "Lobby not found"}
             p = lobby.players.get(player_id)
             if not p:
@@ -210,63 +653,501 @@ class LobbyStore:
             # Randomize order
             p_ids = list(lobby.players.keys())
             random.shuffle(p_ids)
-            
-            # Parse size
-            try:
-                size = int(lobby.game_format.split('x')[0])
-            except:
-                size = 8
 
-            lobby.game = GameEngine(size=size, players=p_ids)
+            size = _format_size(lobby.game_format)
+            self._set_game(lobby, engine_class(size)(size=size, players=p_ids))
             lobby.started = True
-            
+            if not self._commit(lobby):
+                return CONFLICT
+            self._log(lobby, "s", p_ids)
+            self._roster_event(lobby, "start")
+
             return {"ok": True, "started": True}
 
-    def get_game_state(self, code: str) -> Optional[dict]:
-        code = _norm_code(code)
+    def get_game_etag(self, code: str) -> Optional[str]:
+        """Changes whenever the game state does (moves or roster). None if no game."""
+        lobby = self.get_lobby(code)
+        if not lobby:
+            return None
+        with lobby.lock:
+            if not self._sync(lobby) or not lobby.game:
+                return None
+            return _game_etag(lobby)
+
+    def get_game_state(self, code: str, since: Optional[int] = None,
+                       board_format: Optional[str] = None) -> Optional[dict]:
+        """
+        Full game state, or with `since` (a version the client already has) the state
+        without the board plus "moves": the history entries after that version.
+        Falls back to the full state when the moves since `since` aren't available.
+        `board_format` selects a compact board encoding (GameEngine.encode_board).
+        """
+        lobby = self.get_lobby(code)
+        if not lobby:
+            return None
+        with lobby.lock:
+            if not self._sync(lobby) or not lobby.game:
+                return None
+            return self._game_state(lobby, since, board_format)
+
+    def _game_state(self, lobby: Lobby, since: Optional[int], board_format: Optional[str] = None) -> dict:
+        game = lobby.game
+        deltas = game.deltas_since(since) if since is not None else None
+        if deltas is None:
+            state = game.get_state(board_format=board_format)
+        else:
+            state = game.get_state(include_board=False, include_threats=False)
+            state["since"] = since
+            state["moves"] = [game.delta_to_dict(d) for d in deltas]
+
+        return self._with_players(lobby, state)
+
+    def _with_players(self, lobby: Lobby, state: dict) -> dict:
+        # Enrich with nicks
+        players_info = []
+        for pid in state["players"]:
+            pl = lobby.players.get(pid)
+            players_info.append({
+                "id": pid,
+                "nick": pl.nick if pl else "Unknown"
+            })
+
+        state["players_info"] = players_info
+        state["etag"] = _game_etag(lobby)
+        return state
+
+    def get_game_view(self, code: str, r: int = 0, c: int = 0, rows: Optional[int] = None,
+                      cols: Optional[int] = None, since: Optional[int] = None,
+                      board_format: Optional[str] = None) -> Optional[dict]:
+        """
+        Game state for a viewport (GameEngine.get_view): the board chunks the
+        rectangle overlaps, only those changed after `since` if given. Rows and
+        cols default to the rest of the board. None if there's no game.
+        """
+        lobby = self.get_lobby(code)
+        if not lobby:
+            return None
+        with lobby.lock:
+            if not self._sync(lobby) or not lobby.game:
+                return None
+            game = lobby.game
+            state = game.get_view(r, c, game.size if rows is None else rows,
+                                  game.size if cols is None else cols, since, board_format)
+            return self._with_players(lobby, state)
+
+    # At most this many `since` variants are cached per version
+    STATE_CACHE_SLOTS = 8
+
+    def get_game_state_json(self, code: str, since: Optional[int] = None,
+                            board_format: Optional[str] = None) -> Optional[Tuple[bytes, str]]:
+        """
+        get_game_state encoded as JSON, with its etag. The encoding is cached on
+        the lobby until the next move or roster change, so every poller of an
+        unchanged game after the first costs one dict lookup.
+        """
+        lobby = self.get_lobby(code)
+        if not lobby:
+            return None
+        with lobby.lock:
+            if not self._sync(lobby) or not lobby.game:
+                return None
+            etag = _game_etag(lobby)
+            key = (since, board_format)
+            body = lobby.state_cache.get(key)
+            hit = body is not None
+            if not hit:
+                body = json.dumps(self._game_state(lobby, since, board_format), separators=(",", ":")).encode()
+                if len(lobby.state_cache) < self.STATE_CACHE_SLOTS:
+                    lobby.state_cache[key] = body
+        with self._stats_lock:
+            if hit:
+                self.state_cache_hits += 1
+            else:
+                self.state_cache_misses += 1
+        return body, etag
+
+    def stats(self) -> dict:
         with self._lock:
-            lobby = self._lobbies.get(code)
-            if not lobby or not lobby.game:
+            lobbies = len(self._lobbies)
+            open_lobbies = len(self._open)
+        with self._stats_lock:
+            return {
+                "lobbies": lobbies,
+                "open_lobbies": open_lobbies,
+                "state_cache_hits": self.state_cache_hits,
+                "state_cache_misses": self.state_cache_misses,
+            }
+
+    def engine_profile_totals(self) -> EngineProfile:
+        """EngineProfile summed over every profiled game, past and present."""
+        with self._stats_lock:
+            total = EngineProfile()
+            total.merge(self.engine_totals)
+        for lobby in self._all_lobbies():
+            game = lobby.game
+            if game is not None and game.profile is not None:
+                total.merge(game.profile)
+        return total
+
+    def set_profiling(self, code: str, player_id: str, enabled: bool, every: int = 1) -> dict:
+        """
+        Turn cProfile sampling on or off for one lobby's moves: every `every`-th
+        move is run under the profiler. Turning it on also collects EngineProfile
+        counters for the lobby's game. Turning it on again starts a fresh profile.
+        Profiling slows the lobby's moves down, so only its host may do this.
+        """
+        lobby = self.get_lobby(code)
+        if not lobby:
+            return {"ok": False, "error": "Lobby not found"}
+        with lobby.lock:
+            if not self._sync(lobby):
+                return {"ok": False, "error": "Lobby not found"}
+            p = lobby.players.get(player_id)
+            if not p or not p.is_host:
+                return {"ok": False, "error": "Only host can profile"}
+            if enabled:
+                lobby.profiler = cProfile.Profile()
+                lobby.profile_every = max(1, int(every))
+                lobby.moves_seen = lobby.moves_profiled = 0
+                if lobby.game is not None and lobby.game.profile is None:
+                    lobby.game.enable_profile()
+            else:
+                lobby.profiler = None
+            return {"ok": True, "enabled": enabled, "every": lobby.profile_every}
+
+    def get_profile(self, code: str, sort: str = "cumulative", limit: int = 30) -> Optional[dict]:
+        """The lobby's cProfile report (pstats text) and its game's EngineProfile counters."""
+        lobby = self.get_lobby(code)
+        if not lobby:
+            return None
+        with lobby.lock:
+            game = lobby.game
+            res = {
+                "ok": True,
+                "enabled": lobby.profiler is not None,
+                "every": lobby.profile_every,
+                "moves_profiled": lobby.moves_profiled,
+                "engine": game.profile.as_dict() if game is not None and game.profile is not None else None,
+                "stats": None,
+            }
+            if lobby.profiler is not None and lobby.moves_profiled:
+                out = io.StringIO()
+                try:
+                    pstats.Stats(lobby.profiler, stream=out).sort_stats(sort).print_stats(limit)
+                except KeyError:
+                    return {"ok": False, "error": "Unknown sort key"}
+                res["stats"] = out.getvalue()
+            return res
+
+    def gauges(self) -> dict:
+        """Current lobby, game and player counts (read without lobby locks; a scrape can be a move behind)."""
+        res = {"lobbies": 0, "open_lobbies": 0, "games_active": 0, "games_finished": 0, "humans": 0, "bots": 0}
+        for lobby in self._all_lobbies():
+            res["lobbies"] += 1
+            game = lobby.game
+            if not lobby.started:
+                res["open_lobbies"] += 1
+            elif game and game.winner:
+                res["games_finished"] += 1
+            elif game:
+                res["games_active"] += 1
+            bots = len(lobby.bots)
+            res["bots"] += bots
+            res["humans"] += len(lobby.players) - bots
+        return res
+
+    def get_replay_position(self, code: str, move_index: int, board_format: Optional[str] = None) -> Optional[dict]:
+        """
+        Position of a finished game after its first `move_index` moves (see
+        replay.Replay). The replay is built once per game; None if there's no game.
+        """
+        lobby = self.get_lobby(code)
+        if not lobby:
+            return None
+        with lobby.lock:
+            if not self._sync(lobby) or not lobby.game:
                 return None
-            
-            state = lobby.game.get_state()
-            
-            # Enrich with nicks
-            players_info = []
-            for pid in state["players"]:
-                pl = lobby.players.get(pid)
-                players_info.append({
-                    "id": pid,
-                    "nick": pl.nick if pl else "Unknown"
-                })
-            
-            state["players_info"] = players_info
-            return state
+            game = lobby.game
+            if not game.winner:
+                return {"ok": False, "error": "Game is not finished"}
+            if not lobby.replay or lobby.replay[0] is not game:
+                try:
+                    # Sparser checkpoints on big boards: each one is a full board
+                    lobby.replay = (game, Replay(game, every=max(16, game.size)))
+                except ValueError:
+                    return {"ok": False, "error": "Game history is not available"}
+            replay = lobby.replay[1]
+            if not 0 <= move_index <= len(replay):
+                return {"ok": False, "error": "Move index out of range"}
+            return {"ok": True, **replay.position(move_index, board_format)}
 
     def make_move(self, code: str, player_id: str, r: int, c: int) -> dict:
-        code = _norm_code(code)
-        with self._lock:
-            lobby = self._lobbies.get(code)
-            if not lobby or not lobby.game:
+        lobby = self.get_lobby(code)
+        if not lobby:
+            return {"ok": False, "error": "Game not active"}
+        with lobby.lock:
+            if not self._sync(lobby) or not lobby.game:
                 return {"ok": False, "error": "Game not active"}
-            
-            return lobby.game.make_move(r, c, player_id)
 
-    def cleanup(self) -> None:
-        cutoff = _now() - self.player_timeout_seconds
-        with self._lock:
-            to_delete = []
-            for code, lobby in self._lobbies.items():
-                stale = [pid for pid, p in lobby.players.items() if p.last_seen < cutoff]
-                for pid in stale:
-                    lobby.players.pop(pid, None)
+            return self._apply_move(lobby, r, c, player_id)
+
+    def wait_events(self, code: str, last_id: int, timeout: float) -> Optional[Tuple[List[Event], bool, bool]]:
+        """
+        Lobby events after `last_id`, blocking up to `timeout` seconds (without any
+        store or lobby lock) if there are none yet. Returns (events, reset, closed)
+        or None if the lobby doesn't exist; `reset` means the caller missed events
+        and should reload the full state.
+        """
+        lobby = self.get_lobby(code)
+        if not lobby:
+            return None
+        events, reset = lobby.events.wait(last_id, timeout)
+        return events, reset, lobby.events.closed
 
-                if lobby.players and not any(p.is_host for p in lobby.players.values()):
-                    remaining = sorted(lobby.players.values(), key=lambda x: x.joined_at)
-                    remaining[0].is_host = True
+    def request_bot_turn(self, code: str) -> bool:
+        """
+        If it's a bot's turn, start its search in the background and return at once.
+        The move is applied when the search finishes, and the next bot (if any) is
+        started from there. Returns True if a search was started.
+        """
+        lobby = self.get_lobby(code)
+        if not lobby:
+            return False
+        with lobby.lock:
+            if not self._sync(lobby) or not lobby.game or lobby.game.winner or lobby.bot_pending:
+                return False
+            game = lobby.game
+            bot = lobby.bots.get(game.current_player_id)
+            if bot is None:
+                return False
+            lobby.bot_pending = True
+            snapshot = game.copy()
+
+        bot.submit(snapshot, lambda move: self._finish_bot_turn(lobby, game, snapshot, move))
+        return True
+
+    def _finish_bot_turn(self, lobby: Lobby, game: GameEngine, snapshot: GameEngine,
+                         move: Optional[Tuple[int, int]]) -> None:
+        with lobby.lock:
+            lobby.bot_pending = False
+            if not self._sync(lobby) or move is None or lobby.game is not game or len(game.history) != len(snapshot.history):
+                return
+            self._apply_move(lobby, move[0], move[1], snapshot.current_player_id)
+        self.request_bot_turn(lobby.code)
 
-                if not lobby.players:
-                    to_delete.append(code)
+    def play_bot_turns(self, code: str) -> List[dict]:
+        """
+        Blocking variant of request_bot_turn: let bot players move for as long as it's a bot's turn.
+        Each search runs on a copy of the game outside the lobby lock; the move is
+        applied only if nobody else moved in the meantime.
+        """
+        lobby = self.get_lobby(code)
+        results = []
+        if not lobby:
+            return results
+        while True:
+            with lobby.lock:
+                if not self._sync(lobby) or not lobby.game or lobby.game.winner:
+                    return results
+                game = lobby.game
+                bot = lobby.bots.get(game.current_player_id)
+                if bot is None:
+                    return results
+                snapshot = game.copy()
 
-            for code in to_delete:
-                self._lobbies.pop(code, None)
+            move = bot.choose_move(snapshot)
+
+            with lobby.lock:
+                if not self._sync(lobby) or move is None or lobby.game is not game or len(game.history) != len(snapshot.history):
+                    return results
+                results.append(self._apply_move(lobby, move[0], move[1], snapshot.current_player_id))
+
+    def cleanup(self, now: Optional[float] = None) -> None:
+        """Drop players not seen for player_timeout_seconds (see the class docstring)."""
+        now = _now() if now is None else now
+        cutoff = now - self.player_timeout_seconds
+        if self.backend.shared:
+            self._cleanup_shared(cutoff)
+            return
+
+        due: Dict[str, List[Tuple[float, str]]] = {}
+        with self._expiry_lock:
+            while self._expiry and self._expiry[0][0] < now:
+                deadline, code, pid = heapq.heappop(self._expiry)
+                due.setdefault(code, []).append((deadline, pid))
+
+        # One lobby at a time, without the store lock. A lobby that is busy right
+        # now keeps its entries for the next pass.
+        for code, entries in due.items():
+            lobby = self.get_lobby(code)
+            if not lobby:
+                continue
+            if not lobby.lock.acquire(blocking=False):
+                with self._expiry_lock:
+                    for deadline, pid in entries:
+                        heapq.heappush(self._expiry, (deadline, code, pid))
+                continue
+            try:
+                if not self._sync(lobby):
+                    continue
+                stale = []
+                for _, pid in entries:
+                    p = lobby.players.get(pid)
+                    if not p:
+                        continue
+                    if p.last_seen < cutoff:
+                        stale.append(pid)
+                    else:
+                        self._schedule_expiry(code, p)
+                self._drop_players(lobby, stale)
+            finally:
+                lobby.lock.release()
+
+    def _cleanup_shared(self, cutoff: float) -> None:
+        # Presence lives in the backend (pings may go to any process)
+        for code in self.backend.expired(cutoff):
+            lobby = self.get_lobby(code)
+            if not lobby or not lobby.lock.acquire(blocking=False):
+                continue
+            try:
+                if self._sync(lobby):
+                    # Ask again under the lock: a ping may have arrived meanwhile
+                    stale = self.backend.expired(cutoff, code).get(code, [])
+                    self._drop_players(lobby, [pid for pid in stale if pid in lobby.players])
+            finally:
+                lobby.lock.release()
+
+    def _drop_players(self, lobby: Lobby, stale: List[str]) -> None:
+        """Remove timed-out players (lobby.lock held), like leave_lobby does."""
+        if not stale:
+            return
+        for pid in stale:
+            lobby.players.pop(pid)
+            lobby.bots.pop(pid, None)
+        lobby.reassign_host()
+
+        if not lobby.has_humans():
+            for pid in stale:
+                self._log(lobby, "l", pid)
+            self._delete_lobby(lobby)
+        elif self._commit(lobby):
+            for pid in stale:
+                self._log(lobby, "l", pid)
+            self._roster_event(lobby, "leave")
+
+    # ---- persistence ----
+
+    def maybe_snapshot(self) -> bool:
+        if self.journal and self.journal.records_since_snapshot >= self.journal.snapshot_every:
+            self.snapshot()
+            return True
+        return False
+
+    def snapshot(self) -> None:
+        """
+        Write every live lobby to the journal's snapshot and drop the older
+        segments. Moves keep flowing meanwhile: records appended after the
+        rotation land in the new segment, and on replay those a lobby's snapshot
+        already covers are skipped by seq.
+        """
+        if not self.journal:
+            return
+        segment, seq = self.journal.rotate()
+        lobbies = []
+        for lobby in self._all_lobbies():
+            with lobby.lock:
+                if not lobby.closed:
+                    lobbies.append(self._lobby_snapshot(lobby))
+                    seq = max(seq, lobby.journal_seq)
+        self.journal.write_snapshot({"segment": segment, "seq": seq, "lobbies": lobbies})
+
+    def _lobby_snapshot(self, lobby: Lobby) -> dict:
+        game = lobby.game
+        return {
+            "code": lobby.code,
+            "format": lobby.game_format,
+            "max_players": lobby.max_players,
+            "created_at": lobby.created_at,
+            "seq": lobby.journal_seq,
+            "players": encode_players(lobby),
+            "order": game.players if game else None,
+            "moves": [[d.player, *divmod(d.cell, game.size)] for d in game.history] if game else [],
+        }
+
+    def _restore(self) -> None:
+        """Rebuild lobbies from the journal; games are replayed with make_move."""
+        snapshot, records = self.journal.load()
+        lobbies: Dict[str, Lobby] = {}
+        for data in (snapshot or {}).get("lobbies", []):
+            lobby = Lobby(code=data["code"], game_format=data["format"], max_players=data["max_players"],
+                          created_at=data["created_at"], started=False, players={},
+                          journal_seq=data["seq"], lock=self._lobby_locks.lock())
+            for pid, nick, is_host, joined_at, bot_kind in data["players"]:
+                self._replay(lobby, "j", [pid, nick, joined_at, bot_kind])
+                lobby.players[pid].is_host = is_host
+            if data["order"]:
+                self._replay(lobby, "s", [data["order"]])
+                for pid, r, c in data["moves"]:
+                    self._replay(lobby, "m", [pid, r, c])
+            lobbies[lobby.code] = lobby
+
+        for kind, seq, code, *fields in records:
+            lobby = lobbies.get(code)
+            if kind == "c":
+                if lobby and lobby.journal_seq >= seq:
+                    continue
+                game_format, max_players, created_at, pid, nick = fields
+                lobby = Lobby(code=code, game_format=game_format, max_players=max_players,
+                              created_at=created_at, started=False, players={},
+                              lock=self._lobby_locks.lock())
+                self._replay(lobby, "j", [pid, nick, created_at, None])
+                lobby.players[pid].is_host = True
+                lobbies[code] = lobby
+            elif not lobby or seq <= lobby.journal_seq:
+                continue
+            else:
+                self._replay(lobby, kind, fields)
+                if lobby.closed:
+                    del lobbies[code]
+            lobby.journal_seq = seq
+
+        # Everyone gets a full timeout to reconnect
+        now = _now()
+        with self._lock:
+            for lobby in sorted(lobbies.values(), key=lambda l: l.created_at):
+                lobby.seq = next(self._seq)
+                self._lobbies[lobby.code] = lobby
+                if not lobby.started:
+                    self._index_put(lobby)
+        for lobby in lobbies.values():
+            if self.engine_profile and lobby.game:
+                lobby.game.enable_profile()  # only moves made from now on
+            for p in lobby.players.values():
+                if not p.is_bot:
+                    p.last_seen = now
+                    self._schedule_expiry(lobby.code, p)
+            if lobby.started:
+                self.request_bot_turn(lobby.code)
+
+    def _replay(self, lobby: Lobby, kind: str, fields: list) -> None:
+        if kind == "j":
+            pid, nick, joined_at, bot_kind = fields
+            lobby.players[pid] = Player(player_id=pid, nick=nick, is_host=False, joined_at=joined_at,
+                                        last_seen=joined_at, is_bot=bot_kind is not None)
+            if bot_kind:
+                lobby.bots[pid] = self._new_bot(bot_kind)
+        elif kind == "l":
+            (pid,) = fields
+            lobby.players.pop(pid, None)
+            lobby.bots.pop(pid, None)
+            lobby.reassign_host()
+            if not lobby.has_humans():
+                lobby.closed = True
+        elif kind == "s":
+            (order,) = fields
+            size = _format_size(lobby.game_format)
+            lobby.game = engine_class(size)(size=size, players=order)
+            lobby.started = True
+        elif kind == "m":
+            pid, r, c = fields
+            lobby.game.make_move(r, c, pid)
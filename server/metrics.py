@@ -0,0 +1,194 @@
+from __future__ import annotations
+
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, List, Optional, Tuple
+
+# Upper bounds in seconds (Prometheus "le"); +Inf is implicit
+REQUEST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LOCK_BUCKETS = (1e-6, 5e-6, 1e-5, 5e-5, 1e-4, 5e-4, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+MOVE_BUCKETS = (1e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25)
+
+
+class Histogram:
+    """
+    Prometheus-style histogram with fixed buckets. observe() is a bisect and
+    two additions under a small lock; labels are formatted once, up front.
+    """
+
+    __slots__ = ("bounds", "labels", "counts", "sum", "_lock")
+
+    def __init__(self, bounds: Tuple[float, ...], labels: str = ""):
+        self.bounds = bounds
+        self.labels = labels            # preformatted, e.g. 'lock="store"'
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        i = bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    def snapshot(self) -> Tuple[List[int], float]:
+        """Consistent copy of (per-bucket counts, sum); the last count is +Inf."""
+        with self._lock:
+            return list(self.counts), self.sum
+
+    def render(self, name: str, out: List[str]) -> None:
+        counts, total = self.snapshot()
+        sep = "," if self.labels else ""
+        cum = 0
+        for bound, n in zip(self.bounds, counts):
+            cum += n
+            out.append(f'{name}_bucket{{{self.labels}{sep}le="{bound!r}"}} {cum}')
+        cum += counts[-1]
+        out.append(f'{name}_bucket{{{self.labels}{sep}le="+Inf"}} {cum}')
+        braces = f"{{{self.labels}}}" if self.labels else ""
+        out.append(f"{name}_sum{braces} {total!r}")
+        out.append(f"{name}_count{braces} {cum}")
+
+
+class LockTimer:
+    """Wait and hold time histograms shared by every lock made with lock()."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.wait = Histogram(LOCK_BUCKETS, f'lock="{name}"')
+        self.hold = Histogram(LOCK_BUCKETS, f'lock="{name}"')
+
+    def lock(self) -> "TimedLock":
+        return TimedLock(self)
+
+
+class TimedLock:
+    """threading.Lock that reports how long acquire() waited and how long the lock was held."""
+
+    __slots__ = ("_lock", "_timer", "_since")
+
+    def __init__(self, timer: LockTimer):
+        self._lock = threading.Lock()
+        self._timer = timer
+        self._since = 0.0
+
+    def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+        t0 = time.perf_counter()
+        if not self._lock.acquire(blocking, timeout):
+            return False
+        self._since = t = time.perf_counter()
+        if blocking:
+            self._timer.wait.observe(t - t0)
+        return True
+
+    def release(self) -> None:
+        # Only the holder touches _since, so reading it before release is safe
+        self._timer.hold.observe(time.perf_counter() - self._since)
+        self._lock.release()
+
+    def locked(self) -> bool:
+        return self._lock.locked()
+
+    __enter__ = acquire
+
+    def __exit__(self, *exc) -> None:
+        self.release()
+
+
+class HttpMetrics:
+    """Request latency per (route, method) and response counts per status."""
+
+    def __init__(self):
+        self._latency: Dict[Tuple[str, str], Histogram] = {}
+        self._responses: Dict[Tuple[str, str, int], int] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, route: str, method: str, status: int, seconds: float) -> None:
+        key = (route, method)
+        hist = self._latency.get(key)
+        if hist is None:
+            with self._lock:
+                hist = self._latency.setdefault(
+                    key, Histogram(REQUEST_BUCKETS, f'route="{route}",method="{method}"'))
+        hist.observe(seconds)
+        with self._lock:
+            k = (route, method, status)
+            self._responses[k] = self._responses.get(k, 0) + 1
+
+    def render(self, out: List[str]) -> None:
+        with self._lock:
+            hists = sorted(self._latency.items())
+            responses = sorted(self._responses.items())
+        out.append("# HELP majority_http_request_duration_seconds Time to produce a response, per route.")
+        out.append("# TYPE majority_http_request_duration_seconds histogram")
+        for _, h in hists:
+            h.render("majority_http_request_duration_seconds", out)
+        out.append("# HELP majority_http_responses_total Responses per route and status code.")
+        out.append("# TYPE majority_http_responses_total counter")
+        for (route, method, status), n in responses:
+            out.append(f'majority_http_responses_total{{route="{route}",method="{method}",code="{status}"}} {n}')
+
+
+def render(store, http: Optional[HttpMetrics] = None) -> str:
+    """Everything in Prometheus text exposition format (version 0.0.4)."""
+    out: List[str] = []
+    if http:
+        http.render(out)
+
+    g = store.gauges()
+    for name, help_text, value in (
+        ("majority_lobbies", "Lobbies in this process.", g["lobbies"]),
+        ("majority_open_lobbies", "Lobbies waiting for players.", g["open_lobbies"]),
+        ("majority_games_active", "Started games without a winner yet.", g["games_active"]),
+        ("majority_games_finished", "Finished games still kept in a lobby.", g["games_finished"]),
+    ):
+        out.append(f"# HELP {name} {help_text}")
+        out.append(f"# TYPE {name} gauge")
+        out.append(f"{name} {value}")
+    out.append("# HELP majority_players Players in lobbies, by kind.")
+    out.append("# TYPE majority_players gauge")
+    out.append(f'majority_players{{kind="human"}} {g["humans"]}')
+    out.append(f'majority_players{{kind="bot"}} {g["bots"]}')
+
+    stats = store.stats()
+    for name, key in (("majority_state_cache_hits_total", "state_cache_hits"),
+                      ("majority_state_cache_misses_total", "state_cache_misses")):
+        out.append(f"# TYPE {name} counter")
+        out.append(f"{name} {stats[key]}")
+
+    out.append("# HELP majority_lock_wait_seconds Time spent waiting to acquire store and lobby locks.")
+    out.append("# TYPE majority_lock_wait_seconds histogram")
+    for timer in store.lock_timers:
+        timer.wait.render("majority_lock_wait_seconds", out)
+    out.append("# HELP majority_lock_hold_seconds Time store and lobby locks were held.")
+    out.append("# TYPE majority_lock_hold_seconds histogram")
+    for timer in store.lock_timers:
+        timer.hold.render("majority_lock_hold_seconds", out)
+
+    out.append("# HELP majority_move_duration_seconds Applying a move (engine, cascade, storage, events), by board size.")
+    out.append("# TYPE majority_move_duration_seconds histogram")
+    for _, h in sorted(store.move_seconds.items()):
+        h.render("majority_move_duration_seconds", out)
+
+    prof = store.engine_profile_totals()
+    for field, help_text in (
+        ("moves", "Moves made in profiled games (see GameEngine.enable_profile)."),
+        ("cascade_waves", "Cascade waves (depth) summed over moves."),
+        ("queue_pushes", "Cells pushed onto the cascade queue."),
+        ("capture_checks", "Capture condition evaluations."),
+        ("neighbor_reads", "Neighbor cells read by the cascade."),
+        ("flips", "Cells captured."),
+        ("legal_scans", "Legal move mask computations."),
+    ):
+        name = f"majority_engine_{field}_total"
+        out.append(f"# HELP {name} {help_text}")
+        out.append(f"# TYPE {name} counter")
+        out.append(f"{name} {getattr(prof, field)}")
+    out.append("# HELP majority_engine_phase_seconds_total Engine time in profiled games, by phase.")
+    out.append("# TYPE majority_engine_phase_seconds_total counter")
+    for phase in ("legal", "cascade", "winner"):
+        out.append(f'majority_engine_phase_seconds_total{{phase="{phase}"}} {getattr(prof, phase + "_seconds")!r}')
+
+    out.append("")
+    return "\n".join(out)
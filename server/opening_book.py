@@ -0,0 +1,300 @@
+"""
+Opening book: precomputed best moves for the first plies of each format.
+
+Positions are canonicalized before lookup, so one entry serves every
+position that is the same up to
+  - the 8 symmetries of the square board (rotations and reflections), and
+  - relabeling players relative to the one to move (mover = 1, next = 2, ...),
+which the rules, the early-game restriction included, don't distinguish.
+
+A book file is a small header and records sorted by key, binary-searched in
+place through mmap, so opening it costs nothing until the first lookup and
+books are shared between processes by the page cache:
+
+    header  "<8sHHBBxxI": magic, size, players, cascade, plies, count
+    record  "<QH":        position key, best move (flat cell, canonical frame)
+
+`plies` is the book depth: positions with fewer pieces than that are in it.
+
+Build books offline with deep search, e.g.
+
+    python server/opening_book.py -o data/books --formats 6x6,8x8 --players 2,3 --depth 3
+"""
+from __future__ import annotations
+
+import hashlib
+import math
+import mmap
+import os
+import struct
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple
+
+from game_engine import GameEngine, _iter_bits
+
+MAGIC = b"MGBOOK1\n"
+_HEADER = struct.Struct("<8sHHBBxxI")
+_RECORD = struct.Struct("<QH")
+_KEY = struct.Struct("<Q")
+
+# Canonical piece list: cell << 3 | relative player, sorted
+Items = Tuple[int, ...]
+
+
+def book_name(size: int, players: int) -> str:
+    return f"{size}x{size}-p{players}.book"
+
+
+@lru_cache(maxsize=None)
+def _symmetries(size: int) -> Tuple[Tuple[Tuple[int, ...], ...], Tuple[Tuple[int, ...], ...]]:
+    """The 8 dihedral maps of flat cells, and their inverses."""
+    m = size - 1
+    coords = (
+        lambda r, c: (r, c), lambda r, c: (c, m - r), lambda r, c: (m - r, m - c), lambda r, c: (m - c, r),
+        lambda r, c: (r, m - c), lambda r, c: (m - r, c), lambda r, c: (c, r), lambda r, c: (m - c, m - r),
+    )
+    maps, inverses = [], []
+    for f in coords:
+        fwd = [0] * (size * size)
+        inv = [0] * (size * size)
+        for cell in range(size * size):
+            r, c = f(*divmod(cell, size))
+            fwd[cell] = r * size + c
+            inv[r * size + c] = cell
+        maps.append(tuple(fwd))
+        inverses.append(tuple(inv))
+    return tuple(maps), tuple(inverses)
+
+
+def _pieces(engine: GameEngine) -> List[Tuple[int, int]]:
+    """(cell, player number) of every piece, without scanning the board."""
+    occupied = getattr(engine, "_occupied", None)  # SparseGameEngine
+    if occupied is not None:
+        return list(occupied.items())
+    masks = engine._masks
+    return [(cell, v) for v in range(1, len(masks)) for cell in _iter_bits(masks[v])]
+
+
+def canonical(size: int, players: int, pieces: List[Tuple[int, int]], mover: int) -> Tuple[Items, int]:
+    """
+    Smallest piece list over the 8 symmetries, with players renumbered so the
+    mover is 1; returns it and the index of the symmetry that produced it.
+    """
+    relabeled = [(cell, (v - mover) % players + 1) for cell, v in pieces]
+    best, best_k = None, 0
+    for k, fwd in enumerate(_symmetries(size)[0]):
+        items = sorted([fwd[cell] << 3 | v for cell, v in relabeled])
+        if best is None or items < best:
+            best, best_k = items, k
+    return tuple(best), best_k
+
+
+def position_key(items: Items) -> int:
+    """64-bit key of a canonical piece list."""
+    raw = struct.pack(f"<{len(items)}I", *items)
+    return _KEY.unpack(hashlib.blake2b(raw, digest_size=8).digest())[0]
+
+
+class OpeningBook:
+    """One book file (one board size and player count), mapped on first lookup."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._mm: Optional[mmap.mmap] = None
+        self._lock = threading.Lock()
+        self.size = self.players = self.plies = self.count = 0
+        self.cascade = True
+
+    def _open(self) -> mmap.mmap:
+        with self._lock:
+            if self._mm is None:
+                with open(self.path, "rb") as f:
+                    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                if len(mm) < _HEADER.size:
+                    mm.close()
+                    raise ValueError(f"{self.path} is not an opening book")
+                magic, size, players, cascade, plies, count = _HEADER.unpack_from(mm, 0)
+                if magic != MAGIC or len(mm) != _HEADER.size + count * _RECORD.size:
+                    mm.close()
+                    raise ValueError(f"{self.path} is not an opening book")
+                self.size, self.players, self.cascade, self.plies, self.count = \
+                    size, players, bool(cascade), plies, count
+                self._mm = mm
+            return self._mm
+
+    def __len__(self) -> int:
+        self._open()
+        return self.count
+
+    def close(self) -> None:
+        with self._lock:
+            if self._mm is not None:
+                self._mm.close()
+                self._mm = None
+
+    def _find(self, key: int) -> Optional[int]:
+        mm = self._mm
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            k, move = _RECORD.unpack_from(mm, _HEADER.size + mid * _RECORD.size)
+            if k == key:
+                return move
+            if k < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return None
+
+    def lookup(self, engine: GameEngine) -> Optional[Tuple[int, int]]:
+        """Book move (r, c) for the player to move, in this board's orientation; None if out of book."""
+        if self._mm is None:
+            self._open()
+        size = engine.size
+        if (size != self.size or len(engine.players) != self.players or engine.winner
+                or engine.cascade_enabled != self.cascade
+                or size * size - engine._totals[0] >= self.plies):
+            return None
+        items, k = canonical(size, self.players, _pieces(engine), engine.current_player_num)
+        move = self._find(position_key(items))
+        if move is None:
+            return None
+        r, c = divmod(_symmetries(size)[1][k][move], size)
+        # A stale book or a key collision must never produce an illegal move
+        if not engine.is_valid_move(r, c, engine.current_player_id):
+            return None
+        return r, c
+
+    @staticmethod
+    def write(path: str, size: int, players: int, plies: int, entries: Dict[int, int],
+              cascade: bool = True) -> None:
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(_HEADER.pack(MAGIC, size, players, int(cascade), plies, len(entries)))
+            for key in sorted(entries):
+                f.write(_RECORD.pack(key, entries[key]))
+        os.replace(tmp, path)
+
+
+class BookShelf:
+    """
+    The books in a directory, one per (size, players), opened when first
+    needed. Formats without a book file simply have no book moves.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._books: Dict[Tuple[int, int], Optional[OpeningBook]] = {}
+
+    def book(self, size: int, players: int) -> Optional[OpeningBook]:
+        key = (size, players)
+        if key not in self._books:
+            path = os.path.join(self.directory, book_name(size, players))
+            self._books[key] = OpeningBook(path) if os.path.exists(path) else None
+        return self._books[key]
+
+    def lookup(self, engine: GameEngine) -> Optional[Tuple[int, int]]:
+        book = self.book(engine.size, len(engine.players))
+        if book is None:
+            return None
+        try:
+            return book.lookup(engine)
+        except (OSError, ValueError):
+            # Unreadable book: play on without it
+            self._books[(engine.size, len(engine.players))] = None
+            return None
+
+
+# -------- building --------
+
+def _engine_for(size: int, players: int, items: Items) -> GameEngine:
+    cells = bytearray(size * size)
+    for code in items:
+        cells[code >> 3] = code & 7
+    return GameEngine.from_cells(size, [str(i) for i in range(players)], bytes(cells), 0, None, 0)
+
+
+def positions(size: int, players: int, plies: int) -> Dict[int, Items]:
+    """Every canonical position with fewer than `plies` pieces reachable from the empty board."""
+    start: Items = ()
+    frontier = {position_key(start): start}
+    res: Dict[int, Items] = {}
+    for ply in range(plies):
+        res.update(frontier)
+        if ply == plies - 1:
+            break
+        nxt: Dict[int, Items] = {}
+        for items in frontier.values():
+            game = _engine_for(size, players, items)
+            for move in game.get_legal_moves(game.current_player_num):
+                delta = game.apply(move)
+                if not game.winner:
+                    child, _ = canonical(size, players, _pieces(game), game.current_player_num)
+                    nxt.setdefault(position_key(child), child)
+                game.undo(delta)
+        frontier = nxt
+    return res
+
+
+def best_move(args: Tuple[int, int, Items, int, int]) -> int:
+    """Deep search on one canonical position (player 1 to move); runs in a pool worker."""
+    from bots import AlphaBetaBot
+
+    size, players, items, depth, seed = args
+    game = _engine_for(size, players, items)
+    r, c = AlphaBetaBot(time_budget=math.inf, max_depth=depth, seed=seed).choose_move(game)
+    return r * size + c
+
+
+def build(size: int, players: int, plies: int = 3, depth: int = 3, seed: int = 0,
+          workers: Optional[int] = None, progress: Optional[Callable[[str], None]] = None) -> Dict[int, int]:
+    """Book entries (key -> canonical best move) for one format; workers=0 searches in-process."""
+    found = positions(size, players, plies)
+    if progress:
+        progress(f"{size}x{size} p{players}: {len(found)} positions")
+    keys = sorted(found)
+    jobs = [(size, players, found[k], depth, seed) for k in keys]
+    if workers == 0:
+        moves = [best_move(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            moves = list(pool.map(best_move, jobs, chunksize=8))
+    return dict(zip(keys, moves))
+
+
+def main(argv=None) -> int:
+    import argparse
+    import sys
+    import time
+
+    from lobby_store import FORMATS, _format_size
+
+    parser = argparse.ArgumentParser(prog="python server/opening_book.py",
+                                     description="Build opening books by deep search.")
+    parser.add_argument("-o", "--output", required=True, help="directory for the book files")
+    parser.add_argument("--formats", help="e.g. 6x6,8x8 (default: every lobby format)")
+    parser.add_argument("--players", default="2,3,4,5", help="player counts, e.g. 2,3")
+    parser.add_argument("--plies", type=int, default=3, help="book depth in plies")
+    parser.add_argument("--depth", type=int, default=3, help="alpha-beta depth per position")
+    parser.add_argument("--workers", type=int, help="worker processes (default: CPU count)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    formats = args.formats.split(",") if args.formats else FORMATS
+    os.makedirs(args.output, exist_ok=True)
+    for fmt in formats:
+        size = _format_size(fmt)
+        for players in (int(p) for p in args.players.split(",") if p):
+            started = time.perf_counter()
+            entries = build(size, players, args.plies, args.depth, args.seed, args.workers,
+                            progress=lambda msg: print(f"  {msg}", file=sys.stderr))
+            path = os.path.join(args.output, book_name(size, players))
+            OpeningBook.write(path, size, players, args.plies, entries)
+            print(f"{path}: {len(entries)} positions in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+from typing import List, Optional
+
+from game_engine import Delta, GameEngine, encode_cells
+
+
+class Replay:
+    """
+    Random access to every position of a recorded game.
+
+    The board after every `every`-th move is kept as a bytes checkpoint (one
+    byte per cell). seek(i) starts from whichever is closer, the nearest
+    checkpoint or the position it was last at, and applies history deltas
+    forward or backward from there, so any seek touches at most every/2 moves
+    and stepping through a game one move at a time costs one delta per step.
+    """
+
+    def __init__(self, game: GameEngine, every: int = 16):
+        if len(game.history) != game.version:
+            raise ValueError("Game history is incomplete")
+        self.size = game.size
+        self.players = list(game.players)
+        self.history: List[Delta] = list(game.history)
+        self.final_turn_idx = game.turn_idx
+        self.winner = game.winner
+        self.every = every
+
+        board = bytearray(self.size * self.size)
+        self._checkpoints = [bytes(board)]
+        for i, d in enumerate(self.history, 1):
+            self._forward(board, d)
+            if i % every == 0:
+                self._checkpoints.append(bytes(board))
+        self._board = board
+        self._pos = len(self.history)
+
+    def __len__(self) -> int:
+        return len(self.history)
+
+    def seek(self, i: int) -> bytes:
+        """Board after the first i moves (0 = empty board)."""
+        if not 0 <= i <= len(self.history):
+            raise IndexError(i)
+        k = min((i + self.every // 2) // self.every, len(self._checkpoints) - 1)
+        if abs(k * self.every - i) < abs(self._pos - i):
+            self._board[:] = self._checkpoints[k]
+            self._pos = k * self.every
+
+        board = self._board
+        while self._pos < i:
+            self._forward(board, self.history[self._pos])
+            self._pos += 1
+        while self._pos > i:
+            self._pos -= 1
+            self._backward(board, self.history[self._pos])
+        return bytes(board)
+
+    def position(self, i: int, board_format: Optional[str] = None) -> dict:
+        """JSON-ready position after move i, in the shape of GameEngine.get_state."""
+        raw = self.seek(i)
+        n = self.size
+        done = i == len(self.history)
+        turn_idx = self.final_turn_idx if done else self.history[i].prev_turn_idx
+        last = self.history[i - 1] if i else None
+        state = {
+            "size": n,
+            "players": self.players,
+            "move_index": i,
+            "moves_total": len(self.history),
+            "turn_idx": turn_idx,
+            "current_player_id": self.players[turn_idx],
+            "scores": {pid: raw.count(k + 1) for k, pid in enumerate(self.players)},
+            "winner": self.winner if done else None,
+            "last_move": None if last is None else {
+                "p": last.prev_turn_idx + 1,
+                "r": last.cell // n,
+                "c": last.cell % n,
+                "flips": [divmod(f, n) for f in last.flips],
+                "waves": [[divmod(f, n) for f in wave] for wave in last.waves()],
+                "threats": [(*divmod(cell, n), p) for cell, p in last.threats],
+            },
+        }
+        if board_format:
+            state["board"], state["board_format"] = encode_cells(raw, board_format, len(self.players))
+        else:
+            state["board"] = [list(raw[r*n:(r+1)*n]) for r in range(n)]
+        return state
+
+    @staticmethod
+    def _forward(board: bytearray, d: Delta) -> None:
+        p = d.prev_turn_idx + 1
+        board[d.cell] = p
+        for f in d.flips:
+            board[f] = p
+
+    @staticmethod
+    def _backward(board: bytearray, d: Delta) -> None:
+        board[d.cell] = 0
+        for f, prev in zip(d.flips, d.flipped_from):
+            board[f] = prev
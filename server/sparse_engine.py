@@ -0,0 +1,223 @@
+"""
+GameEngine for arena boards (64x64 and up).
+
+GameEngine keeps dense per-cell tables: neighbor counts per value, one bitmask
+per value and precomputed neighbor lists, all sized N*N. On a 256x256 board
+every placement rewrites a 65536-bit mask and the tables alone take hundreds
+of megabytes. SparseGameEngine stores only occupied cells, in a dict, plus the
+per-value totals, and counts neighbors when the cascade asks for them, so a
+move costs O(8) per cell the cascade touches whatever the board size.
+
+Rules, deltas, history and the JSON shapes are GameEngine's; the parity tests
+check both engines play identically. Clients of large boards should use
+GameEngine.get_view (per-chunk state) rather than the full board.
+"""
+from __future__ import annotations
+
+import random
+from collections import deque
+from typing import Dict, List, Optional, Set, Tuple, Type
+
+from game_engine import _DELTAS, Delta, GameEngine, _PROFILED_METHODS
+
+# Boards at least this big get SparseGameEngine (see engine_class)
+SPARSE_MIN_SIZE = 48
+
+
+def engine_class(size: int) -> Type[GameEngine]:
+    """Engine to run a board of the given size with."""
+    return SparseGameEngine if size >= SPARSE_MIN_SIZE else GameEngine
+
+
+class SparseGameEngine(GameEngine):
+    def __init__(self, size: int, players: List[str]):
+        self._init_common(size, players)
+        # Occupied cells only: flat index (r * size + c) -> player number
+        self._occupied: Dict[int, int] = {}
+        # Neighbor index offsets of an interior cell, in _DELTAS order
+        self._offsets = tuple(dr * size + dc for dr, dc in _DELTAS)
+
+    def _copy_cells(self, new: "SparseGameEngine") -> None:
+        new._occupied = dict(self._occupied)
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        for name in _PROFILED_METHODS:
+            state.pop(name, None)
+        state["profile"] = None
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+
+    @property
+    def board(self) -> List[List[int]]:
+        n = self.size
+        raw = self.board_bytes()
+        return [list(raw[r*n:(r+1)*n]) for r in range(n)]
+
+    def board_bytes(self) -> bytes:
+        out = bytearray(self.size * self.size)
+        for cell, val in self._occupied.items():
+            out[cell] = val
+        return bytes(out)
+
+    def region_bytes(self, r: int, c: int, rows: int, cols: int) -> bytes:
+        n = self.size
+        occ = self._occupied
+        out = bytearray(rows * cols)
+        if rows * cols <= len(occ):
+            get = occ.get
+            i = 0
+            for row in range(r, r + rows):
+                start = row * n + c
+                for cell in range(start, start + cols):
+                    out[i] = get(cell, 0)
+                    i += 1
+        else:
+            # Fewer pieces on the board than cells in the region
+            for cell, val in occ.items():
+                rr, cc = divmod(cell, n)
+                if r <= rr < r + rows and c <= cc < c + cols:
+                    out[(rr - r) * cols + cc - c] = val
+        return bytes(out)
+
+    def _neighbors(self, cell: int) -> List[int]:
+        n = self.size
+        r, c = divmod(cell, n)
+        if 0 < r < n - 1 and 0 < c < n - 1:
+            return [cell + d for d in self._offsets]
+        return [nr * n + nc for nr, nc in ((r + dr, c + dc) for dr, dc in _DELTAS)
+                if 0 <= nr < n and 0 <= nc < n]
+
+    def _is_threatened(self, cell: int) -> bool:
+        get = self._occupied.get
+        owner = get(cell)
+        if not owner:
+            return False
+        counts = [0] * len(self._totals)
+        for nb in self._neighbors(cell):
+            counts[get(nb, 0)] += 1
+        own = counts[owner]
+        return counts[0] > 0 and any(counts[v] >= own for v in range(1, len(counts)) if v != owner)
+
+    def _cell_value(self, cell: int) -> int:
+        return self._occupied.get(cell, 0)
+
+    def _blocked(self, player_num: int) -> Set[int]:
+        """
+        Empty cells the early-game rule keeps `player_num` off (see
+        GameEngine._legal_mask); empty when the rule doesn't apply or would
+        leave no legal move at all.
+        """
+        counts = self._totals[1:]
+        if not (sum(counts) > 0 and max(counts) <= 1):
+            return set()
+        occ = self._occupied
+        # At most one piece per player, so this loop is over a handful of cells
+        blocked = {nb for cell, val in occ.items() if val != player_num
+                   for nb in self._neighbors(cell) if nb not in occ}
+        return blocked if len(blocked) < self._totals[0] else set()
+
+    def get_legal_moves(self, player_num: int) -> List[Tuple[int, int]]:
+        """
+        Every legal move; the list itself is O(N^2) on an empty arena board, so
+        callers that need one move should use random_legal_move or
+        is_valid_move instead.
+        """
+        n = self.size
+        taken = self._blocked(player_num)
+        taken.update(self._occupied)
+        return [divmod(i, n) for i in range(n * n) if i not in taken]
+
+    # Random cells tried before random_legal_move falls back to listing moves
+    SAMPLE_TRIES = 64
+
+    def random_legal_move(self, rng: random.Random) -> Optional[Tuple[int, int]]:
+        # Arena boards are mostly empty: a random cell is almost always free
+        n = self.size
+        occ = self._occupied
+        blocked = self._blocked(self.current_player_num)
+        for _ in range(self.SAMPLE_TRIES):
+            cell = rng.randrange(n * n)
+            if cell not in occ and cell not in blocked:
+                return divmod(cell, n)
+        return super().random_legal_move(rng)
+
+    def is_valid_move(self, r: int, c: int, player_id: str) -> bool:
+        if self.winner:
+            return False
+        if player_id != self.current_player_id:
+            return False
+        if not (0 <= r < self.size and 0 <= c < self.size):
+            return False
+        cell = r * self.size + c
+        return cell not in self._occupied and cell not in self._blocked(self.current_player_num)
+
+    def apply(self, move: Tuple[int, int]) -> Delta:
+        p_num = self.current_player_num
+        get = self._occupied.get
+        neighbors = self._neighbors
+        r, c = move
+        cell = r * self.size + c
+        delta = Delta(self.current_player_id, cell, [], [], self.turn_idx, self.winner)
+        self._set_cell(cell, p_num)
+
+        # Same wave-by-wave cascade as GameEngine.apply
+        flips = delta.flips
+        flipped_from = delta.flipped_from
+        wave_sizes = delta.wave_sizes
+        frontier = deque((cell,))
+        while frontier:
+            before = len(flips)
+            for _ in range(len(frontier)):
+                for nb in neighbors(frontier.popleft()):
+                    target_val = get(nb, 0)
+                    if target_val == 0 or target_val == p_num:
+                        continue
+                    if self._should_capture(nb, p_num, target_val):
+                        self._set_cell(nb, p_num)
+                        flips.append(nb)
+                        flipped_from.append(target_val)
+                        if self.cascade_enabled:
+                            frontier.append(nb)
+            if len(flips) > before:
+                wave_sizes.append(len(flips) - before)
+
+        self.turn_idx = (self.turn_idx + 1) % len(self.players)
+        self._check_winner()
+
+        if self.debug:
+            self._check_consistency()
+        return delta
+
+    def _set_cell(self, cell: int, val: int) -> None:
+        occ = self._occupied
+        old = occ.get(cell, 0)
+        if old == val:
+            return
+        if val:
+            occ[cell] = val
+        else:
+            del occ[cell]
+        self._totals[old] -= 1
+        self._totals[val] += 1
+
+    def _should_capture(self, cell, attacker_val, defender_val) -> bool:
+        get = self._occupied.get
+        att = dfn = 0
+        for nb in self._neighbors(cell):
+            v = get(nb)
+            if v == attacker_val:
+                att += 1
+            elif v == defender_val:
+                dfn += 1
+        return att > dfn
+
+    def _check_consistency(self) -> None:
+        totals = [0] * (len(self.players) + 1)
+        for val in self._occupied.values():
+            assert val, "empty cell stored as occupied"
+            totals[val] += 1
+        totals[0] = self.size * self.size - len(self._occupied)
+        assert totals == self._totals, "piece totals out of sync with cells"
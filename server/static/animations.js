@@ -61,9 +61,11 @@ function lockBoard(lock) {
  * @param {number} c - столбец
  * @param {number} player - игрок (1 или 2)
  * @param {boolean} cascadeOn - включён ли каскад
+ * @param {Array|null} waves - готовые волны [[[r, c], ...], ...] (например, от сервера);
+ *   если не переданы, считаются через calculateCascadeWaves
  * @returns {number} - время анимации в мс
  */
-function applyMoveWithAnimation(board, r, c, player, cascadeOn = true) {
+function applyMoveWithAnimation(board, r, c, player, cascadeOn = true, waves = null) {
   const N = board.length;
   
   // Применяем ход
@@ -71,8 +73,8 @@ function applyMoveWithAnimation(board, r, c, player, cascadeOn = true) {
   updateCellVisual(board, r, c, false);
   updateThreats(board);
 
-  // Вычисляем волны каскада
-  const waves = calculateCascadeWaves(board, r, c, player, cascadeOn);
+  // Вычисляем волны каскада, если их не прислали
+  if (!waves) waves = calculateCascadeWaves(board, r, c, player, cascadeOn);
 
   // Константы анимации
   const DOT_TIME   = 400;
@@ -179,3 +179,29 @@ function evaluate(board, player) {
   const oppStab = stabilityScore(board, opp);
   return net * 4 + (myStab - oppStab) * 1.5;
 }
+
+// Компактная доска с сервера (?board=bytes|packed) -> массив строк, как board.
+// "bytes": байт на клетку; "packed": 3 бита на клетку, big-endian,
+// с ведущими нулевыми битами до целого числа байт.
+// cols — для прямоугольных блоков /view (size строк по cols клеток).
+function decodeBoard(data, size, format, cols = size) {
+  const bin = atob(data);
+  const n = size * cols;
+  const cells = new Array(n);
+  if (format === 'packed') {
+    let bit = bin.length * 8 - 3 * n;
+    for (let i = 0; i < n; i++, bit += 3) {
+      let v = 0;
+      for (let k = 0; k < 3; k++) {
+        const b = bit + k;
+        v = (v << 1) | ((bin.charCodeAt(b >> 3) >> (7 - (b & 7))) & 1);
+      }
+      cells[i] = v;
+    }
+  } else {
+    for (let i = 0; i < n; i++) cells[i] = bin.charCodeAt(i);
+  }
+  const board = [];
+  for (let r = 0; r < size; r++) board.push(cells.slice(r * cols, (r + 1) * cols));
+  return board;
+}
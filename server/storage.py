@@ -0,0 +1,341 @@
+from __future__ import annotations
+
+import json
+import sqlite3
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+
+def encode_players(lobby) -> list:
+    """[[player_id, nick, is_host, joined_at, bot_kind or None], ...] in join order."""
+    return [
+        [p.player_id, p.nick, p.is_host, p.joined_at, lobby.bots[p.player_id].kind if p.is_bot else None]
+        for p in sorted(lobby.players.values(), key=lambda p: p.joined_at)
+    ]
+
+
+class StorageBackend:
+    """
+    Where LobbyStore keeps lobbies. LobbyStore always works on its own Lobby
+    objects under their locks; a backend decides whether anyone else can see
+    or change them.
+
+    shared = False: the objects in this process are the only copy and every
+    call below is a no-op (MemoryBackend).
+    shared = True: lobbies live in storage that other processes write too. A
+    lobby row carries a version that is bumped by every save; LobbyStore
+    re-reads a lobby when its version moved and saves with compare-and-swap on
+    the version it read, so concurrent writers never overwrite each other.
+    """
+
+    shared = False
+
+    def insert(self, lobby) -> bool:
+        """Store a new lobby; False if its code is taken. May set lobby.seq."""
+        return True
+
+    def save(self, lobby, expected_version: int) -> bool:
+        """Replace the stored lobby if its version is still expected_version."""
+        return True
+
+    def delete(self, code: str) -> None:
+        pass
+
+    def version(self, code: str) -> Optional[int]:
+        """Stored version of the lobby, None if it doesn't exist."""
+        return None
+
+    def load(self, code: str) -> Optional[dict]:
+        """
+        Stored lobby as a dict: version, seq, format, max_players, created_at,
+        started, players (see encode_players), game ({order, turn_idx, winner,
+        version} or None) and board (one byte per cell or None).
+        """
+        return None
+
+    def touch(self, code: str, player_id: str, t: float) -> None:
+        """Record that a player was seen at time t."""
+
+    def expired(self, cutoff: float, code: Optional[str] = None) -> Dict[str, List[str]]:
+        """Human players not seen since cutoff, by lobby code."""
+        return {}
+
+    def list_open(self, game_format: Optional[str], limit: Optional[int],
+                  cursor: Optional[int]) -> Tuple[List[dict], Optional[int]]:
+        """Listing entries of lobbies that haven't started, newest first, plus the next cursor."""
+        return [], None
+
+    def change_token(self):
+        """Changes whenever any lobby may have changed (for listing caches)."""
+        return None
+
+    def close(self) -> None:
+        pass
+
+
+class MemoryBackend(StorageBackend):
+    """Default: lobbies exist only in this process."""
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS lobbies (
+    seq           INTEGER PRIMARY KEY AUTOINCREMENT,
+    code          TEXT NOT NULL UNIQUE,
+    version       INTEGER NOT NULL,
+    format        TEXT NOT NULL,
+    max_players   INTEGER NOT NULL,
+    created_at    REAL NOT NULL,
+    started       INTEGER NOT NULL,
+    players_count INTEGER NOT NULL,
+    players       TEXT NOT NULL,
+    game          TEXT,
+    board         BLOB
+);
+CREATE INDEX IF NOT EXISTS lobbies_open ON lobbies (started, format, seq);
+CREATE TABLE IF NOT EXISTS presence (
+    code      TEXT NOT NULL,
+    player_id TEXT NOT NULL,
+    last_seen REAL NOT NULL,
+    PRIMARY KEY (code, player_id)
+);
+CREATE INDEX IF NOT EXISTS presence_last_seen ON presence (last_seen);
+CREATE TABLE IF NOT EXISTS board_log (
+    code    TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    cells   BLOB NOT NULL,
+    PRIMARY KEY (code, version)
+);
+"""
+
+# Rows board_log may hold for a lobby before a save writes the board whole again
+SNAPSHOT_EVERY = 64
+
+
+class SQLiteBackend(StorageBackend):
+    """
+    Lobbies in a local SQLite database in WAL mode, so several worker processes
+    on one machine can share them: readers never block the writer and each
+    save is one short transaction. The board is a blob with one byte per cell,
+    written whole only at the start of a game and then every SNAPSHOT_EVERY
+    saves; in between a save appends just the cells its moves changed to
+    board_log (keyed by game version), and load() applies them to the blob.
+    Player presence (last_seen) is a separate table so pings don't bump the
+    lobby version.
+    """
+
+    shared = True
+
+    def __init__(self, path: str, busy_timeout_ms: int = 5000):
+        self.path = path
+        # One connection per backend; calls are short, so a lock is enough
+        self._conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._writes = 0
+        with self._lock:
+            self._conn.execute(f"PRAGMA busy_timeout = {int(busy_timeout_ms)}")
+            self._conn.execute("PRAGMA journal_mode = WAL")
+            self._conn.execute("PRAGMA synchronous = NORMAL")
+            self._conn.executescript(_SCHEMA)
+
+    def _row(self, lobby) -> tuple:
+        game = lobby.game
+        meta = None
+        if game:
+            meta = json.dumps({"order": game.players, "turn_idx": game.turn_idx,
+                               "winner": game.winner, "version": game.version})
+        return (int(lobby.started), len(lobby.players),
+                json.dumps(encode_players(lobby), separators=(",", ":")), meta)
+
+    def _changed_cells(self, lobby, expected_version: int) -> Optional[bytes]:
+        """
+        Cells the lobby's game changed since the stored row, as little-endian
+        uint32 (cell << 8 | value); None if the board has to be written whole:
+        no stored game, its moves aren't in our history (a reload or a take-back
+        since), or board_log is due for a snapshot. Call inside a transaction.
+        """
+        game = lobby.game
+        row = self._conn.execute("SELECT game FROM lobbies WHERE code = ? AND version = ?",
+                                 (lobby.code, expected_version)).fetchone()
+        if not game or not row or not row[0]:
+            return None
+        stored = json.loads(row[0])
+        deltas = game.deltas_since(stored["version"]) if stored["order"] == game.players else None
+        if deltas is None:
+            return None
+        (logged,) = self._conn.execute("SELECT COUNT(*) FROM board_log WHERE code = ?", (lobby.code,)).fetchone()
+        if logged >= SNAPSHOT_EVERY:
+            return None
+        changed: Dict[int, int] = {}
+        for delta in deltas:
+            p = game.players.index(delta.player) + 1
+            changed[delta.cell] = p
+            for f in delta.flips:
+                changed[f] = p
+        return struct.pack(f"<{len(changed)}I", *(cell << 8 | p for cell, p in changed.items()))
+
+    def _sync_presence(self, lobby) -> None:
+        humans = [p.player_id for p in lobby.players.values() if not p.is_bot]
+        now = time.time()
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO presence (code, player_id, last_seen) VALUES (?, ?, ?)",
+            [(lobby.code, pid, now) for pid in humans])
+        marks = ",".join("?" * len(humans))
+        self._conn.execute(
+            f"DELETE FROM presence WHERE code = ? AND player_id NOT IN ({marks})", (lobby.code, *humans))
+
+    @contextmanager
+    def _transaction(self, mode: str = "IMMEDIATE"):
+        """
+        BEGIN IMMEDIATE ... COMMIT on the shared connection (call under _lock);
+        mode "DEFERRED" for reads that need one consistent snapshot.
+        Any error, including a failed COMMIT, rolls back before propagating:
+        a transaction left open would make every later BEGIN fail.
+        """
+        self._conn.execute(f"BEGIN {mode}")
+        try:
+            yield
+            self._conn.execute("COMMIT")
+        except BaseException:
+            if self._conn.in_transaction:
+                self._conn.execute("ROLLBACK")
+            raise
+
+    def insert(self, lobby) -> bool:
+        row = self._row(lobby)
+        board = lobby.game.board_bytes() if lobby.game else None
+        with self._lock:
+            try:
+                with self._transaction():
+                    cur = self._conn.execute(
+                        "INSERT INTO lobbies (code, version, format, max_players, created_at,"
+                        " started, players_count, players, game, board) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (lobby.code, lobby.rev, lobby.game_format, lobby.max_players, lobby.created_at,
+                         *row, board))
+                    self._sync_presence(lobby)
+            except sqlite3.IntegrityError:
+                return False
+            self._writes += 1
+            lobby.seq = cur.lastrowid
+            return True
+
+    def save(self, lobby, expected_version: int) -> bool:
+        row = self._row(lobby)
+        with self._lock:
+            with self._transaction():
+                cells = self._changed_cells(lobby, expected_version)
+                if cells is None:
+                    cur = self._conn.execute(
+                        "UPDATE lobbies SET version = version + 1, started = ?, players_count = ?,"
+                        " players = ?, game = ?, board = ? WHERE code = ? AND version = ?",
+                        (*row, lobby.game.board_bytes() if lobby.game else None, lobby.code, expected_version))
+                    if cur.rowcount == 1:
+                        self._conn.execute("DELETE FROM board_log WHERE code = ?", (lobby.code,))
+                else:
+                    cur = self._conn.execute(
+                        "UPDATE lobbies SET version = version + 1, started = ?, players_count = ?,"
+                        " players = ?, game = ? WHERE code = ? AND version = ?",
+                        (*row, lobby.code, expected_version))
+                    if cur.rowcount == 1 and cells:
+                        self._conn.execute("INSERT INTO board_log (code, version, cells) VALUES (?, ?, ?)",
+                                           (lobby.code, lobby.game.version, cells))
+                # Lost the compare-and-swap: nothing was written, the COMMIT is empty
+                if cur.rowcount == 1:
+                    self._sync_presence(lobby)
+            if cur.rowcount != 1:
+                return False
+            self._writes += 1
+            return True
+
+    def delete(self, code: str) -> None:
+        with self._lock:
+            with self._transaction():
+                self._conn.execute("DELETE FROM lobbies WHERE code = ?", (code,))
+                self._conn.execute("DELETE FROM board_log WHERE code = ?", (code,))
+                self._conn.execute("DELETE FROM presence WHERE code = ?", (code,))
+            self._writes += 1
+
+    def version(self, code: str) -> Optional[int]:
+        with self._lock:
+            row = self._conn.execute("SELECT version FROM lobbies WHERE code = ?", (code,)).fetchone()
+        return row[0] if row else None
+
+    def load(self, code: str) -> Optional[dict]:
+        with self._lock:
+            with self._transaction("DEFERRED"):
+                row = self._conn.execute(
+                    "SELECT version, seq, format, max_players, created_at, started, players, game, board"
+                    " FROM lobbies WHERE code = ?", (code,)).fetchone()
+                log = self._conn.execute("SELECT cells FROM board_log WHERE code = ? ORDER BY version",
+                                         (code,)).fetchall() if row and row[8] is not None else []
+        if not row:
+            return None
+        version, seq, fmt, max_players, created_at, started, players, game, board = row
+        if log:
+            board = bytearray(board)
+            for (cells,) in log:
+                for (x,) in struct.iter_unpack("<I", cells):
+                    board[x >> 8] = x & 0xFF
+            board = bytes(board)
+        return {
+            "version": version,
+            "seq": seq,
+            "format": fmt,
+            "max_players": max_players,
+            "created_at": created_at,
+            "started": bool(started),
+            "players": json.loads(players),
+            "game": json.loads(game) if game else None,
+            "board": board,
+        }
+
+    def touch(self, code: str, player_id: str, t: float) -> None:
+        with self._lock:
+            self._conn.execute("UPDATE presence SET last_seen = ? WHERE code = ? AND player_id = ?",
+                               (t, code, player_id))
+
+    def expired(self, cutoff: float, code: Optional[str] = None) -> Dict[str, List[str]]:
+        sql = "SELECT code, player_id FROM presence WHERE last_seen < ?"
+        args: tuple = (cutoff,)
+        if code is not None:
+            sql += " AND code = ?"
+            args += (code,)
+        res: Dict[str, List[str]] = {}
+        with self._lock:
+            for c, pid in self._conn.execute(sql, args):
+                res.setdefault(c, []).append(pid)
+        return res
+
+    def list_open(self, game_format: Optional[str], limit: Optional[int],
+                  cursor: Optional[int]) -> Tuple[List[dict], Optional[int]]:
+        sql = "SELECT seq, code, format, players_count, max_players, created_at FROM lobbies WHERE started = 0"
+        args: tuple = ()
+        if game_format is not None:
+            sql += " AND format = ?"
+            args += (game_format,)
+        if cursor is not None:
+            sql += " AND seq < ?"
+            args += (cursor,)
+        sql += " ORDER BY seq DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            args += (limit + 1,)
+        with self._lock:
+            rows = self._conn.execute(sql, args).fetchall()
+
+        more = limit is not None and len(rows) > limit
+        rows = rows[:limit] if more else rows
+        entries = [{"code": code, "format": fmt, "players": n, "max_players": mx, "created_at": at}
+                   for _, code, fmt, n, mx, at in rows]
+        return entries, (rows[-1][0] if more else None)
+
+    def change_token(self):
+        # data_version moves when another connection commits; _writes covers ours
+        with self._lock:
+            return self._conn.execute("PRAGMA data_version").fetchone()[0], self._writes
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
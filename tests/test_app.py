@@ -0,0 +1,146 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "server"))
+
+from app import create_app
+
+
+class TestGameApi(unittest.TestCase):
+    def setUp(self):
+        self.client = create_app().test_client()
+        res = self.client.post("/api/lobbies", json={"nick": "host", "format": "6x6"}).get_json()
+        self.code, self.host = res["code"], res["player_id"]
+        self.guest = self.client.post(f"/api/lobbies/{self.code}/join", json={"nick": "guest"}).get_json()["player_id"]
+        self.client.post(f"/api/lobbies/{self.code}/start", json={"player_id": self.host})
+
+    def _state(self, **params):
+        return self.client.get(f"/api/game/{self.code}", query_string=params)
+
+    def _move(self):
+        # Some empty cells are illegal early on; play the first accepted one
+        state = self._state().get_json()
+        for r in range(6):
+            for c in range(6):
+                res = self.client.post(f"/api/game/{self.code}/move",
+                                       json={"player_id": state["current_player_id"], "r": r, "c": c})
+                if res.status_code == 200:
+                    return
+
+    def test_conditional_get_and_since(self):
+        first = self._state()
+        self.assertEqual(first.status_code, 200)
+        etag = first.headers["ETag"]
+        version = first.get_json()["version"]
+
+        unchanged = self.client.get(f"/api/game/{self.code}", headers={"If-None-Match": etag})
+        self.assertEqual(unchanged.status_code, 304)
+
+        self._move()
+        self._move()
+        changed = self.client.get(f"/api/game/{self.code}?since={version}", headers={"If-None-Match": etag})
+        self.assertEqual(changed.status_code, 200)
+        data = changed.get_json()
+        self.assertNotIn("board", data)
+        self.assertNotIn("threats", data)
+        self.assertEqual(len(data["moves"]), 2)
+        self.assertEqual(data["version"], version + 2)
+
+        # Replaying the moves on the old board gives the current board
+        board = first.get_json()["board"]
+        for m in data["moves"]:
+            board[m["r"]][m["c"]] = m["p"]
+            for fr, fc in m["flips"]:
+                board[fr][fc] = m["p"]
+        self.assertEqual(board, self._state().get_json()["board"])
+
+    def test_unknown_version_falls_back_to_full_state(self):
+        data = self._state(since=99).get_json()
+        self.assertIn("board", data)
+
+    def test_state_encoded_once_per_version(self):
+        stats = lambda: self.client.get("/api/stats").get_json()
+        before = stats()
+        first = self._state().data
+        self.assertEqual(self._state().data, first)
+        after = stats()
+        self.assertEqual(after["state_cache_misses"] - before["state_cache_misses"], 1)
+        self.assertEqual(after["state_cache_hits"] - before["state_cache_hits"], 1)
+
+        self._move()
+        self.assertNotEqual(self._state().data, first)
+        self.assertEqual(stats()["state_cache_misses"] - after["state_cache_misses"], 1)
+
+    def test_long_poll_events(self):
+        res = self.client.get(f"/api/lobbies/{self.code}/events/poll", query_string={"timeout": 0}).get_json()
+        kinds = [e["event"] for e in res["events"]]
+        self.assertEqual(kinds, ["join", "start"])
+        self.assertFalse(res["reset"])
+        last_id = res["events"][-1]["id"]
+
+        self._move()
+        res = self.client.get(f"/api/lobbies/{self.code}/events/poll",
+                              query_string={"timeout": 0, "last_event_id": last_id}).get_json()
+        (move,) = res["events"]
+        self.assertEqual(move["event"], "move")
+        self.assertNotIn("threats", move["data"])
+        self.assertIn("threats", move["data"]["move"])
+        self.assertEqual(move["data"]["version"], self._state().get_json()["version"])
+
+        # An id this channel never issued means the client has to reload
+        res = self.client.get(f"/api/lobbies/{self.code}/events/poll",
+                              query_string={"timeout": 0, "last_event_id": 999}).get_json()
+        self.assertTrue(res["reset"])
+
+    def test_metrics(self):
+        self._state()
+        self._move()
+        text = self.client.get("/metrics").get_data(as_text=True)
+        self.assertIn('majority_http_request_duration_seconds_count{route="/api/game/<code>",method="GET"}', text)
+        self.assertIn('majority_http_responses_total{route="/api/game/<code>/move",method="POST",code="200"} 1', text)
+        self.assertIn("majority_games_active 1", text)
+        self.assertIn('majority_players{kind="human"} 2', text)
+        self.assertIn('majority_move_duration_seconds_count{size="6"} 1', text)
+        self.assertIn('majority_lock_hold_seconds_bucket{lock="lobby",le="+Inf"}', text)
+
+    def test_lobby_profiling(self):
+        url = f"/api/lobbies/{self.code}/profile"
+        self.assertEqual(self.client.post(url, json={"enabled": True}).status_code, 400)
+        self.assertEqual(self.client.post(url, json={"player_id": self.guest}).status_code, 403)
+        self.assertFalse(self.client.get(url).get_json()["enabled"])
+        res = self.client.post(url, json={"player_id": self.host, "enabled": True}).get_json()
+        self.assertTrue(res["enabled"])
+        self._move()
+        prof = self.client.get(f"/api/lobbies/{self.code}/profile").get_json()
+        self.assertEqual(prof["moves_profiled"], 1)
+        self.assertEqual(prof["engine"]["moves"], 1)
+        self.assertIn("make_move", prof["stats"])
+        self.assertIn("majority_engine_moves_total 1", self.client.get("/metrics").get_data(as_text=True))
+
+        self.client.post(url, json={"player_id": self.host, "enabled": False})
+        self.assertFalse(self.client.get(f"/api/lobbies/{self.code}/profile").get_json()["enabled"])
+
+    def test_arena_view(self):
+        res = self.client.post("/api/lobbies", json={"nick": "host", "format": "64x64"}).get_json()
+        code, host = res["code"], res["player_id"]
+        self.client.post(f"/api/lobbies/{code}/join", json={"nick": "guest"})
+        self.client.post(f"/api/lobbies/{code}/start", json={"player_id": host})
+        view = self.client.get(f"/api/game/{code}/view", query_string={"rows": 20, "cols": 20}).get_json()
+        self.assertEqual(view["chunk_size"], 16)
+        self.assertEqual(len(view["chunks"]), 4)
+
+        self.client.post(f"/api/game/{code}/move",
+                         json={"player_id": view["current_player_id"], "r": 40, "c": 40})
+        changed = self.client.get(f"/api/game/{code}/view",
+                                  query_string={"since": view["version"], "board": "bytes"}).get_json()
+        self.assertEqual([(ch["r"], ch["c"]) for ch in changed["chunks"]], [(32, 32)])
+
+        # The lobby UI offers arena formats and the game page renders them through /view
+        self.assertIn('value="64x64"', self.client.get("/").get_data(as_text=True))
+        self.assertIn("const isArena = true;", self.client.get(f"/game/{code}").get_data(as_text=True))
+        self.assertIn("const isArena = false;", self.client.get(f"/game/{self.code}").get_data(as_text=True))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import os
+import random
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from benchmarks import engine, load, report, tournament
+
+
+class TestBenchmarks(unittest.TestCase):
+    def test_snake_cascade_flips_whole_snake(self):
+        for size, players in ((6, 2), (7, 3), (16, 5)):
+            game = engine.snake_position(size, players)
+            snake = sum(1 for v in game.board_bytes() if v > 1)
+            self.assertEqual(len(game.apply((0, 0)).flips), snake)
+
+    def test_run_and_compare(self):
+        results = engine.run([6], [2], budget=0.01, name_filter="cascade-on")
+        self.assertIn("make_move/6x6/p2/cascade-on", results)
+        self.assertIn("worst_cascade/6x6/p2/cascade-on", results)
+        for entry in results.values():
+            self.assertGreater(entry["ops_per_sec"], 0)
+            self.assertLessEqual(entry["p50_us"], entry["p99_us"])
+
+        slower = {k: dict(v, ops_per_sec=v["ops_per_sec"] * 0.5) for k, v in results.items()}
+        rows, regressions = report.compare(results, slower, 0.1)
+        self.assertEqual(len(rows), len(results))
+        self.assertEqual(sorted(regressions), sorted(results))
+        self.assertEqual(report.compare(results, results, 0.1)[1], [])
+
+    def test_load_in_process(self):
+        sc = load.Scenario(lobbies=3, players=2, format="6x6", duration=1.0, poll_interval=0.2, workers=4)
+        res = load.run(sc)
+        self.assertEqual(res["setup"]["endpoints"]["POST /api/lobbies"]["n"], 3)
+        for label in ("GET /api/game/<code>", "GET /api/lobbies/<code>", "POST /api/game/<code>/move"):
+            self.assertGreater(res["endpoints"][label]["n"], 0)
+            self.assertEqual(res["endpoints"][label]["errors"], 0)
+        self.assertGreater(res["moves"], 0)
+        self.assertGreater(res["locks"]["lobby"]["acquisitions"], 0)
+
+    def test_lock_report_sees_new_lobbies(self):
+        from lobby_store import LobbyStore
+
+        store = LobbyStore(bot_pool=None)
+        before = load.lock_snapshot(store)
+        lobby, _ = store.create_lobby("host", "6x6")  # its lock didn't exist at the first snapshot
+        store.join_lobby(lobby.code, "guest")
+        locks = load.lock_report(before, load.lock_snapshot(store))
+        self.assertGreater(locks["lobby"]["acquisitions"], 0)
+        self.assertIsNotNone(locks["store"]["hold_p99_us"])
+
+    def test_tournament_resumes_deterministically(self):
+        bots = [tournament.BotSpec.parse(t) for t in ("random", "greedy", "mc=mcts:iterations=20")]
+        configs = [tournament.Config(6, 2, True), tournament.Config(6, 3, False)]
+
+        def strip(results):
+            return sorted((r["key"], r["scores"], r["winner"]) for r in results)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            full = os.path.join(tmp, "full.jsonl")
+            expected = strip(tournament.run(bots, configs, full, rounds=2, seed=5, workers=0))
+            self.assertEqual(len(expected), 2 * (3 * 2 + 1 * 3))
+
+            # Killed part way, in the middle of writing a line
+            part = os.path.join(tmp, "part.jsonl")
+            with open(full) as src, open(part, "w") as dst:
+                dst.writelines(src.readlines()[:6])
+                dst.write('{"key": "6x6')
+            resumed = tournament.run(bots, configs, part, rounds=2, seed=5, workers=0)
+            self.assertEqual(strip(resumed), expected)
+            self.assertEqual(strip(tournament.load_results(part)[1]), expected)
+            with self.assertRaises(ValueError):
+                tournament.run(bots, configs, part, rounds=2, seed=6, workers=0)
+
+        table = tournament.ratings(resumed, samples=20)
+        rows = table["6x6/p2/cascade-on"]
+        self.assertEqual(rows[-1]["bot"], "random")
+        for r in rows:
+            self.assertLessEqual(r["lo"], r["hi"])
+        self.assertAlmostEqual(sum(r["elo"] for r in rows) / len(rows), tournament.ELO_BASE, delta=30)
+        # Completion order (worker count) doesn't move the intervals
+        shuffled = list(resumed)
+        random.Random(1).shuffle(shuffled)
+        self.assertEqual(tournament.ratings(shuffled, samples=20), table)
+
+    def test_tournament_rounds_vary_deterministic_bots(self):
+        bots = [tournament.BotSpec.parse(t) for t in ("greedy", "ab=alphabeta:depth=1")]
+        with tempfile.TemporaryDirectory() as tmp:
+            results = tournament.run(bots, [tournament.Config(6, 2, True)], os.path.join(tmp, "t.jsonl"),
+                                     rounds=4, seed=2, workers=0)
+        traces = {(tuple(r["seats"]), r["trace"]) for r in results}
+        self.assertGreater(len(traces), 2)  # not one game per seating
+        # A repeated game counts once
+        table = tournament.ratings(results + [dict(results[0], key=results[0]["key"].replace("/r0/", "/r9/"))])
+        self.assertEqual(table, tournament.ratings(results))
+
+
+if __name__ == '__main__':
+    unittest.main()
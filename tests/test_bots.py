@@ -0,0 +1,106 @@
+import os
+import sys
+import time
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "server"))
+
+from game_engine import GameEngine
+from bots import AlphaBetaBot, MCTSBot, TranspositionTable, EXACT
+from lobby_store import LobbyStore
+
+
+class TestAlphaBetaBot(unittest.TestCase):
+    def test_returns_legal_move_within_budget(self):
+        game = GameEngine(size=8, players=["a", "b", "c"])
+        bot = AlphaBetaBot(time_budget=0.2, seed=1)
+        while not game.winner:
+            if game.turn_idx == 0:
+                t = time.monotonic()
+                move = bot.choose_move(game)
+                self.assertLess(time.monotonic() - t, 0.5)
+            else:
+                move = game.get_legal_moves(game.current_player_num)[0]
+            self.assertIn(move, game.get_legal_moves(game.current_player_num))
+            self.assertTrue(game.make_move(move[0], move[1], game.current_player_id)["ok"])
+
+    def test_takes_winning_capture(self):
+        game = GameEngine(size=6, players=["a", "b"])
+        game.make_move(0, 0, "a")
+        game.make_move(5, 5, "b")
+        game.make_move(1, 1, "a")
+        # b's only piece can be wiped out from (4, 4) next turn; a at (4, 4) wins now
+        game.turn_idx = 0
+        bot = AlphaBetaBot(time_budget=0.5, seed=1)
+        self.assertEqual(bot.choose_move(game), (4, 4))
+
+    def test_transposition_table_replacement(self):
+        tt = TranspositionTable(size_log2=2)
+        tt.put(5, 4, EXACT, 10, 1)
+        tt.put(9, 2, EXACT, 20, 2)  # same slot, shallower: kept out
+        self.assertEqual(tt.get(5), (4, EXACT, 10, 1))
+        tt.new_search()
+        tt.put(9, 2, EXACT, 20, 2)  # stale entry is replaced
+        self.assertIsNone(tt.get(5))
+        self.assertEqual(tt.get(9), (2, EXACT, 20, 2))
+
+
+class TestMCTSBot(unittest.TestCase):
+    def test_root_parallel_search_meets_deadline(self):
+        game = GameEngine(size=8, players=["a", "b"])
+        game.make_move(3, 3, "a")
+        game.make_move(6, 6, "b")
+        with ProcessPoolExecutor(max_workers=2) as pool:
+            bot = MCTSBot(time_budget=0.3, workers=2, pool=pool, seed=1)
+            t = time.monotonic()
+            move = bot.choose_move(game)
+            self.assertLess(time.monotonic() - t, 0.3 + MCTSBot.GRACE + 0.2)
+        self.assertIn(move, game.get_legal_moves(game.current_player_num))
+
+
+class TestLobbyBots(unittest.TestCase):
+    def test_bot_seat_replies_to_human_move(self):
+        store = LobbyStore(bot_time_budget=0.05)
+        lobby, host = store.create_lobby("host", "6x6")
+        res = store.add_bot(lobby.code, host.player_id)
+        self.assertTrue(res["ok"])
+        self.assertFalse(store.add_bot(lobby.code, res["player_id"])["ok"])  # bots can't add bots
+
+        store.start_lobby(lobby.code, host.player_id)
+        store.play_bot_turns(lobby.code)
+        game = lobby.game
+        self.assertEqual(game.current_player_id, host.player_id)
+
+        r, c = game.get_legal_moves(game.current_player_num)[0]
+        self.assertTrue(store.make_move(lobby.code, host.player_id, r, c)["ok"])
+        moves = store.play_bot_turns(lobby.code)
+        self.assertTrue(all(m["ok"] for m in moves))
+        self.assertTrue(game.winner or game.current_player_id == host.player_id)
+
+    def test_bot_turn_is_applied_in_background(self):
+        store = LobbyStore(bot_time_budget=0.05)
+        lobby, host = store.create_lobby("host", "6x6")
+        store.add_bot(lobby.code, host.player_id, kind="mcts")
+        store.start_lobby(lobby.code, host.player_id)
+        game = lobby.game
+        if game.current_player_id != host.player_id:
+            self.assertTrue(store.request_bot_turn(lobby.code))
+            self.assertFalse(store.request_bot_turn(lobby.code))  # already thinking
+            for _ in range(100):
+                if game.history:
+                    break
+                time.sleep(0.02)
+        self.assertEqual(game.current_player_id, host.player_id)
+        self.assertFalse(lobby.bot_pending)
+
+    def test_bots_alone_do_not_keep_lobby(self):
+        store = LobbyStore()
+        lobby, host = store.create_lobby("host", "8x8")
+        store.add_bot(lobby.code, host.player_id)
+        store.leave_lobby(lobby.code, host.player_id)
+        self.assertIsNone(store.get_lobby(lobby.code))
+
+
+if __name__ == '__main__':
+    unittest.main()
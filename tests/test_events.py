@@ -0,0 +1,51 @@
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "server"))
+
+from events import EventChannel
+
+
+class TestEventChannel(unittest.TestCase):
+    def test_wait_wakes_on_publish(self):
+        ch = EventChannel()
+        got = []
+        t = threading.Thread(target=lambda: got.append(ch.wait(0, timeout=5)))
+        t.start()
+        time.sleep(0.05)
+        ch.publish("move", {"n": 1})
+        t.join(2)
+        self.assertFalse(t.is_alive())
+        events, missed = got[0]
+        self.assertEqual([(e.id, e.kind) for e in events], [(1, "move")])
+        self.assertFalse(missed)
+
+    def test_resume_and_missed(self):
+        ch = EventChannel(capacity=3)
+        for i in range(5):
+            ch.publish("move", {"n": i})
+        # ids 3..5 are still buffered
+        events, missed = ch.wait(2, timeout=0)
+        self.assertEqual([e.id for e in events], [3, 4, 5])
+        self.assertFalse(missed)
+        # id 2 was dropped, so a reader at 1 has a gap
+        events, missed = ch.wait(1, timeout=0)
+        self.assertTrue(missed)
+        # Nothing new: times out empty
+        self.assertEqual(ch.wait(5, timeout=0.01), ([], False))
+
+    def test_close_wakes_waiters(self):
+        ch = EventChannel()
+        t = threading.Thread(target=ch.wait, args=(0, 5))
+        t.start()
+        time.sleep(0.05)
+        ch.close()
+        t.join(2)
+        self.assertFalse(t.is_alive())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,54 @@
+import base64
+import random
 import unittest
 from server.game_engine import GameEngine
 
+
+def _ref_neighbors(r, c, n):
+    for dr, dc in [(-1,-1),(-1,0),(-1,1),(0,-1),(0,1),(1,-1),(1,0),(1,1)]:
+        if 0 <= r+dr < n and 0 <= c+dc < n:
+            yield r+dr, c+dc
+
+
+def _ref_move(board, r, c, p_num, cascade=True):
+    """Straightforward list-of-lists capture rules, used as the parity reference."""
+    n = len(board)
+    board[r][c] = p_num
+    flips = []
+    queue = [(r, c)]
+    while queue:
+        cr, cc = queue.pop(0)
+        for nr, nc in _ref_neighbors(cr, cc, n):
+            t = board[nr][nc]
+            if t == 0 or t == p_num:
+                continue
+            att = sum(1 for a, b in _ref_neighbors(nr, nc, n) if board[a][b] == p_num)
+            dfn = sum(1 for a, b in _ref_neighbors(nr, nc, n) if board[a][b] == t)
+            if att > dfn:
+                board[nr][nc] = p_num
+                flips.append((nr, nc))
+                if cascade:
+                    queue.append((nr, nc))
+    return flips
+
+
+def _ref_threats(board, players):
+    """The clients' "!" rule, recomputed over the whole board."""
+    n = len(board)
+    res = {pid: [] for pid in players}
+    for r in range(n):
+        for c in range(n):
+            owner = board[r][c]
+            if not owner:
+                continue
+            counts = [0] * (len(players) + 1)
+            for a, b in _ref_neighbors(r, c, n):
+                counts[board[a][b]] += 1
+            if counts[0] and max(counts[v] for v in range(1, len(counts)) if v != owner) >= counts[owner]:
+                res[players[owner - 1]].append((r, c))
+    return res
+
+
 class TestGameEngine(unittest.TestCase):
     def test_initial_state(self):
         players = ["p1", "p2", "p3"]
@@ -110,5 +158,170 @@ class TestGameEngine(unittest.TestCase):
         
         self.assertEqual(game.board[1][1], 3, "B should have been captured by C immediately upon C's move")
 
+    def test_matches_reference_rules(self):
+        rng = random.Random(7)
+        for size, n_players, cascade in [(6, 2, True), (8, 3, False), (10, 5, True), (16, 4, True)]:
+            players = [f"p{i}" for i in range(n_players)]
+            game = GameEngine(size=size, players=players)
+            game.cascade_enabled = cascade
+            game.debug = True
+            ref = [[0] * size for _ in range(size)]
+            while not game.winner:
+                p_num = game.current_player_num
+                r, c = rng.choice(game.get_legal_moves(p_num))
+                res = game.make_move(r, c, game.current_player_id)
+                self.assertTrue(res["ok"])
+                self.assertEqual(res["flips"], _ref_move(ref, r, c, p_num, cascade))
+                self.assertEqual(game.board, ref)
+
+    def test_apply_undo_round_trip(self):
+        rng = random.Random(3)
+        game = GameEngine(size=8, players=["a", "b", "c"])
+        game.debug = True
+        snapshots = []
+        while not game.winner:
+            snapshots.append((game.board, game.turn_idx, game.winner))
+            r, c = rng.choice(game.get_legal_moves(game.current_player_num))
+            self.assertTrue(game.make_move(r, c, game.current_player_id)["ok"])
+
+        # Search-style: apply/undo leaves the position untouched
+        game.undo(game.history[-1])
+        game.history.pop()
+        r, c = game.get_legal_moves(game.current_player_num)[0]
+        before = (game.board, game.turn_idx, game.winner)
+        delta = game.apply((r, c))
+        self.assertEqual(game.board[r][c], delta.prev_turn_idx + 1)
+        game.undo(delta)
+        self.assertEqual((game.board, game.turn_idx, game.winner), before)
+
+        # History carries enough to rewind the whole game
+        while game.history:
+            game.unmake_move()
+            self.assertEqual((game.board, game.turn_idx, game.winner), snapshots[len(game.history)])
+        self.assertIsNone(game.unmake_move())
+
+    def test_compact_board_encodings(self):
+        rng = random.Random(5)
+        game = GameEngine(size=10, players=["a", "b", "c", "d", "e"])
+        for _ in range(40):
+            r, c = rng.choice(game.get_legal_moves(game.current_player_num))
+            game.make_move(r, c, game.current_player_id)
+        flat = [v for row in game.board for v in row]
+
+        self.assertEqual(list(base64.b64decode(game.encode_board("bytes"))), flat)
+
+        data = base64.b64decode(game.encode_board("packed"))
+        self.assertEqual(len(data), (3 * len(flat) + 7) // 8)
+        bits = int.from_bytes(data, "big")
+        n = len(flat)
+        self.assertEqual([(bits >> (3 * (n - 1 - i))) & 7 for i in range(n)], flat)
+
+        state = game.get_state(board_format="packed")
+        self.assertEqual(state["board_format"], "packed")
+
+    def test_packed_falls_back_to_bytes_above_seven_players(self):
+        players = [f"p{i}" for i in range(10)]
+        game = GameEngine(size=12, players=players)
+        for _ in range(len(players)):
+            r, c = game.get_legal_moves(game.current_player_num)[-1]
+            game.make_move(r, c, game.current_player_id)
+        self.assertGreater(max(game.board_bytes()), 7)
+
+        # 3 bits can't hold player 8+, and the label has to say what was sent
+        state = game.get_state(board_format="packed")
+        self.assertEqual(state["board_format"], "bytes")
+        self.assertEqual(base64.b64decode(state["board"]), game.board_bytes())
+
+    def test_cascade_waves(self):
+        rng = random.Random(13)
+        for cascade in (True, False):
+            game = GameEngine(size=10, players=["a", "b", "c"])
+            game.cascade_enabled = cascade
+            while not game.winner:
+                r, c = rng.choice(game.get_legal_moves(game.current_player_num))
+                res = game.make_move(r, c, game.current_player_id)
+                delta = game.history[-1]
+                waves = delta.waves()
+                # Waves split the flips in order, none empty
+                self.assertEqual([f for w in waves for f in w], delta.flips)
+                self.assertTrue(all(waves))
+                self.assertEqual(res["waves"], game.delta_to_dict(delta)["waves"])
+                if not cascade:
+                    self.assertLessEqual(len(waves), 1)
+                # Every cell of wave k touches a cell of wave k-1 (wave 0 is the placed piece)
+                prev = {delta.cell}
+                for wave in waves:
+                    for cell in wave:
+                        self.assertTrue(prev & set(game._nbr_lists[cell]))
+                    prev = set(wave)
+
+    def test_threats_match_full_scan(self):
+        rng = random.Random(19)
+        for size, n_players in [(6, 2), (9, 3), (12, 5)]:
+            players = [f"p{i}" for i in range(n_players)]
+            game = GameEngine(size=size, players=players)
+            while not game.winner:
+                r, c = rng.choice(game.get_legal_moves(game.current_player_num))
+                game.make_move(r, c, game.current_player_id)
+                self.assertEqual(game.threats(), _ref_threats(game.board, players))
+                if rng.random() < 0.2:
+                    game.unmake_move()
+                    self.assertEqual(game.threats(), _ref_threats(game.board, players))
+            self.assertEqual(game.get_state()["threats"], game.threats())
+
+            rebuilt = GameEngine.from_cells(size, players, game.board_bytes(), game.turn_idx, game.winner, 0)
+            self.assertEqual(rebuilt.threats(), game.threats())
+            view = game.get_view(2, 3, 4, 4)
+            self.assertEqual(view["threats"], {pid: [(r, c) for r, c in cells if 2 <= r < 6 and 3 <= c < 7]
+                                               for pid, cells in game.threats().items()})
+
+    def test_move_threat_changes_rebuild_map(self):
+        rng = random.Random(23)
+        players = ["a", "b", "c"]
+        game = GameEngine(size=9, players=players)
+        known = {}
+        while not game.winner:
+            r, c = rng.choice(game.get_legal_moves(game.current_player_num))
+            game.make_move(r, c, game.current_player_id)
+            for r, c, p in game.delta_to_dict(game.history[-1])["threats"]:
+                if p:
+                    known[(r, c)] = players[p - 1]
+                else:
+                    del known[(r, c)]
+            self.assertEqual({pid: sorted(rc for rc, owner in known.items() if owner == pid) for pid in players},
+                             game.threats())
+
+    def test_profile_counts_without_changing_play(self):
+        rng = random.Random(11)
+        plain = GameEngine(size=8, players=["a", "b", "c"])
+        profiled = GameEngine(size=8, players=["a", "b", "c"])
+        profile = profiled.enable_profile()
+        while not plain.winner:
+            r, c = rng.choice(plain.get_legal_moves(plain.current_player_num))
+            self.assertEqual(plain.make_move(r, c, plain.current_player_id),
+                             profiled.make_move(r, c, profiled.current_player_id))
+        self.assertEqual(plain.board, profiled.board)
+
+        self.assertEqual(profile.moves, len(plain.history))
+        self.assertEqual(profile.flips, sum(len(d.flips) for d in plain.history))
+        # Cascade on: the placed piece and every capture are queued
+        self.assertEqual(profile.queue_pushes, profile.moves + profile.flips)
+        single = GameEngine(size=6, players=["a", "b"])
+        single.cascade_enabled = False
+        single_profile = single.enable_profile()
+        while not single.winner:
+            r, c = rng.choice(single.get_legal_moves(single.current_player_num))
+            single.make_move(r, c, single.current_player_id)
+        self.assertEqual(single_profile.queue_pushes, single_profile.moves)  # only the placed piece
+        self.assertGreaterEqual(profile.capture_checks, profile.flips)
+        self.assertEqual(profile.legal_scans, len(plain.history))  # one per move validation
+
+        # Copies (bot searches) and pickles don't carry the profile
+        self.assertIsNone(profiled.copy().profile)
+        self.assertNotIn("apply", profiled.copy().__dict__)
+        self.assertIs(profiled.disable_profile(), profile)
+        self.assertNotIn("apply", profiled.__dict__)
+        self.assertNotIn("_should_capture", profiled.__dict__)
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,65 @@
+import random
+import unittest
+
+import numpy as np
+
+from server.game_batch import GameBatch, DRAW
+from server.game_engine import GameEngine
+
+
+class TestGameBatch(unittest.TestCase):
+    def _check_parity(self, size, n_players, cascade, batch=40, seed=0):
+        rng = random.Random(seed)
+        players = [f"p{i}" for i in range(n_players)]
+        engines = [GameEngine(size=size, players=players) for _ in range(batch)]
+        for e in engines:
+            e.cascade_enabled = cascade
+        gb = GameBatch(size, n_players, batch, cascade_enabled=cascade)
+
+        while not all(e.winner for e in engines):
+            legal = gb.legal_mask()
+            moves = np.full(batch, -1)
+            expected_flips = np.zeros(batch, dtype=np.int64)
+            for b, e in enumerate(engines):
+                if e.winner:
+                    self.assertFalse(legal[b].any())
+                    continue
+                cells = e.get_legal_moves(e.current_player_num)
+                self.assertEqual(sorted(zip(*legal[b].nonzero())), cells)
+                r, c = rng.choice(cells)
+                expected_flips[b] = len(e.make_move(r, c, e.current_player_id)["flips"])
+                moves[b] = r * size + c
+
+            ok, flips = gb.step(moves)
+            self.assertTrue((ok == (moves >= 0)).all())
+            self.assertTrue((flips == expected_flips).all())
+            for b, e in enumerate(engines):
+                self.assertEqual(gb.boards[b].tolist(), e.board)
+                self.assertEqual(gb.turn_idx[b], e.turn_idx)
+
+        for b, e in enumerate(engines):
+            w = gb.winner[b]
+            self.assertEqual("draw" if w == DRAW else players[w - 1], e.winner)
+
+    def test_parity_with_engine_cascade(self):
+        self._check_parity(6, 2, True)
+        self._check_parity(10, 5, True, seed=1)
+
+    def test_parity_with_engine_no_cascade(self):
+        self._check_parity(8, 3, False, seed=2)
+
+    def test_invalid_moves_are_rejected(self):
+        gb = GameBatch(6, 2, 2)
+        gb.step(np.array([0, 0]))
+        ok, _ = gb.step(np.array([0, 99]))
+        self.assertFalse(ok.any())
+        self.assertEqual(gb.turn_idx.tolist(), [1, 1])
+
+    def test_play_random_finishes_every_game(self):
+        gb = GameBatch(8, 2, 64)
+        winners = gb.play_random(np.random.default_rng(3))
+        self.assertTrue((winners != 0).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
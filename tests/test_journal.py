@@ -0,0 +1,103 @@
+import os
+import random
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "server"))
+
+from journal import Journal
+from lobby_store import LobbyStore
+
+
+def _play(store, lobby, n, rng):
+    for _ in range(n):
+        game = lobby.game
+        if game.winner:
+            return
+        r, c = rng.choice(game.get_legal_moves(game.current_player_num))
+        assert store.make_move(lobby.code, game.current_player_id, r, c)["ok"]
+
+
+def _summary(store):
+    res = {}
+    for lobby in store._all_lobbies():
+        res[lobby.code] = (
+            lobby.game_format,
+            sorted((p.player_id, p.nick, p.is_host, p.is_bot) for p in lobby.players.values()),
+            lobby.started,
+            lobby.game.board if lobby.game else None,
+            lobby.game.current_player_id if lobby.game else None,
+        )
+    return res
+
+
+class TestJournal(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.dir = self._tmp.name
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def _reopen(self, store):
+        store.journal.close()
+        return LobbyStore(journal=Journal(self.dir))
+
+    def test_replay_rebuilds_lobbies_and_games(self):
+        rng = random.Random(1)
+        store = LobbyStore(journal=Journal(self.dir))
+        a, host_a = store.create_lobby("alice", "8x8")
+        bob = store.join_lobby(a.code, "bob")["player_id"]
+        store.join_lobby(a.code, "carol")
+        store.start_lobby(a.code, host_a.player_id)
+        _play(store, a, 12, rng)
+
+        b, host_b = store.create_lobby("dave", "6x6")
+        store.join_lobby(b.code, "erin")
+        store.leave_lobby(b.code, host_b.player_id)  # erin becomes host
+        c, host_c = store.create_lobby("frank", "6x6")
+        store.leave_lobby(c.code, host_c.player_id)  # lobby removed
+
+        before = _summary(store)
+        restored = self._reopen(store)
+        self.assertEqual(_summary(restored), before)
+        self.assertIn(bob, restored.get_lobby(a.code).players)
+
+        # The restored store keeps journaling from where it left off
+        _play(restored, restored.get_lobby(a.code), 5, rng)
+        before = _summary(restored)
+        self.assertEqual(_summary(self._reopen(restored)), before)
+
+    def test_snapshot_truncates_and_replays_the_tail(self):
+        rng = random.Random(2)
+        store = LobbyStore(journal=Journal(self.dir, snapshot_every=10))
+        lobby, host = store.create_lobby("alice", "10x10")
+        store.join_lobby(lobby.code, "bob")
+        store.start_lobby(lobby.code, host.player_id)
+        _play(store, lobby, 10, rng)
+
+        self.assertTrue(store.maybe_snapshot())
+        _play(store, lobby, 6, rng)
+        store.journal.flush()
+        segments = [f for f in os.listdir(self.dir) if f.startswith("journal-")]
+        self.assertEqual(len(segments), 1)
+
+        before = _summary(store)
+        self.assertEqual(_summary(self._reopen(store)), before)
+
+    def test_torn_last_line_is_ignored(self):
+        store = LobbyStore(journal=Journal(self.dir))
+        lobby, _ = store.create_lobby("alice", "6x6")
+        store.journal.close()
+        (segment,) = [f for f in os.listdir(self.dir) if f.startswith("journal-")]
+        with open(os.path.join(self.dir, segment), "a") as f:
+            f.write('["j",2,"' + lobby.code)
+
+        restored = LobbyStore(journal=Journal(self.dir))
+        self.assertEqual(len(restored.get_lobby(lobby.code).players), 1)
+        restored.journal.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,158 @@
+import json
+import os
+import random
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "server"))
+
+from game_engine import GameEngine
+from lobby_store import LobbyStore
+
+
+def _started_lobby(store, fmt="6x6", players=2):
+    lobby, host = store.create_lobby("host", fmt)
+    ids = [host.player_id]
+    for i in range(1, players):
+        ids.append(store.join_lobby(lobby.code, f"p{i}")["player_id"])
+    store.start_lobby(lobby.code, host.player_id)
+    return lobby
+
+
+class TestLobbyLocking(unittest.TestCase):
+    def test_busy_lobby_does_not_block_others(self):
+        store = LobbyStore()
+        busy, other = _started_lobby(store), _started_lobby(store)
+        done = threading.Event()
+
+        def work():
+            game = other.game
+            r, c = game.get_legal_moves(game.current_player_num)[0]
+            store.make_move(other.code, game.current_player_id, r, c)
+            store.get_game_state(other.code)
+            store.list_public()
+            store.cleanup()
+            done.set()
+
+        # Stand-in for a long cascade: hold one lobby's lock the whole time
+        with busy.lock:
+            threading.Thread(target=work, daemon=True).start()
+            self.assertTrue(done.wait(2))
+        self.assertEqual(other.game.version, 1)
+
+    def test_concurrent_moves_stress(self):
+        store = LobbyStore(player_timeout_seconds=3600)
+        lobbies = [_started_lobby(store, players=3) for _ in range(6)]
+        errors = []
+
+        def player(lobby, pid, seed):
+            rng = random.Random(seed)
+            try:
+                while not lobby.game.winner:
+                    state = store.get_game_state(lobby.code)
+                    if state["current_player_id"] != pid:
+                        time.sleep(0)
+                        continue
+                    moves = lobby.game.get_legal_moves(lobby.game.current_player_num)
+                    if moves:
+                        r, c = rng.choice(moves)
+                        store.make_move(lobby.code, pid, r, c)
+            except Exception as e:  # pragma: no cover - reported below
+                errors.append(e)
+
+        def churn(stop):
+            while not stop.is_set():
+                store.list_public()
+                store.cleanup()
+
+        stop = threading.Event()
+        threads = [threading.Thread(target=churn, args=(stop,))]
+        for i, lobby in enumerate(lobbies):
+            for j, pid in enumerate(lobby.game.players):
+                threads.append(threading.Thread(target=player, args=(lobby, pid, i * 10 + j)))
+        for t in threads:
+            t.start()
+        for t in threads[1:]:
+            t.join(60)
+        stop.set()
+        threads[0].join(5)
+
+        self.assertEqual(errors, [])
+        for lobby in lobbies:
+            game = lobby.game
+            self.assertIsNotNone(game.winner)
+            self.assertEqual(game.version, len(game.history))
+            # Replaying the recorded moves from scratch gives the same board
+            replay = GameEngine(size=game.size, players=game.players)
+            for d in game.history:
+                r, c = divmod(d.cell, game.size)
+                self.assertTrue(replay.make_move(r, c, d.player)["ok"])
+            self.assertEqual(replay.board, game.board)
+
+
+class TestPlayerExpiry(unittest.TestCase):
+    def test_expired_players_leave_and_host_moves(self):
+        store = LobbyStore(player_timeout_seconds=30)
+        lobby, host = store.create_lobby("host", "6x6")
+        guest = store.join_lobby(lobby.code, "guest")["player_id"]
+        t0 = time.time()
+
+        # Nothing is due yet
+        store.cleanup(now=t0 + 10)
+        self.assertEqual(len(lobby.players), 2)
+
+        # The guest keeps polling, the host went away
+        lobby.players[guest].last_seen = t0 + 20
+        store.cleanup(now=t0 + 40)
+        self.assertEqual(list(lobby.players), [guest])
+        self.assertTrue(lobby.players[guest].is_host)
+        # Only the guest's rescheduled entry is left
+        self.assertEqual(len(store._expiry), 1)
+
+        store.cleanup(now=t0 + 60)
+        self.assertIsNone(store.get_lobby(lobby.code))
+        self.assertEqual(store._expiry, [])
+
+    def test_cleanup_skips_entries_that_are_not_due(self):
+        store = LobbyStore(player_timeout_seconds=30)
+        for i in range(200):
+            store.create_lobby(f"host{i}", "6x6")
+        store.cleanup(now=time.time() + 5)
+        self.assertEqual(len(store._expiry), 200)
+        self.assertEqual(len(store.list_public()), 200)
+
+
+class TestOpenLobbyListing(unittest.TestCase):
+    def test_filter_paginate_and_cache(self):
+        store = LobbyStore()
+        codes = []
+        for i in range(5):
+            lobby, host = store.create_lobby(f"h{i}", "8x8" if i % 2 else "6x6")
+            codes.append(lobby.code)
+        started = _started_lobby(store)
+
+        # Newest first; started lobbies are not listed
+        self.assertEqual([l["code"] for l in store.list_public()], codes[::-1])
+        self.assertEqual([l["code"] for l in store.list_public("8x8")], [codes[3], codes[1]])
+
+        seen, cursor = [], None
+        while True:
+            body, cursor = store.list_public_json(limit=2, cursor=cursor)
+            seen += [l["code"] for l in json.loads(body)]
+            if cursor is None:
+                break
+        self.assertEqual(seen, codes[::-1])
+
+        # Unchanged index: the same encoded page is served again
+        self.assertIs(store.list_public_json()[0], store.list_public_json()[0])
+
+        store.join_lobby(codes[0], "guest")
+        self.assertEqual(store.list_public()[-1]["players"], 2)
+        store.leave_lobby(started.code, started.game.players[0])
+        self.assertNotIn(started.code, [l["code"] for l in store.list_public()])
+
+
+if __name__ == '__main__':
+    unittest.main()
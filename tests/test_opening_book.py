@@ -0,0 +1,88 @@
+import os
+import random
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "server"))
+
+import opening_book as ob
+from bots import AlphaBetaBot, MCTSBot
+from game_engine import GameEngine
+
+
+def _play(size, players, moves):
+    game = GameEngine(size, [str(i) for i in range(players)])
+    for r, c in moves:
+        assert game.make_move(r, c, game.current_player_id)["ok"]
+    return game
+
+
+class TestOpeningBook(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.entries = ob.build(6, 2, plies=3, depth=1, workers=0)
+        ob.OpeningBook.write(os.path.join(cls.tmp.name, ob.book_name(6, 2)), 6, 2, 3, cls.entries)
+        cls.shelf = ob.BookShelf(cls.tmp.name)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.shelf.book(6, 2).close()
+        cls.tmp.cleanup()
+
+    def test_canonical_under_symmetry_and_relabeling(self):
+        moves = [(0, 1), (4, 4), (1, 1)]
+        keys = set()
+        for k, fwd in enumerate(ob._symmetries(6)[0]):
+            game = _play(6, 2, [divmod(fwd[r * 6 + c], 6) for r, c in moves])
+            items, _ = ob.canonical(6, 2, ob._pieces(game), game.current_player_num)
+            keys.add(ob.position_key(items))
+        self.assertEqual(len(keys), 1)
+
+        # Same pieces with the colors swapped and the other player to move
+        a = GameEngine.from_cells(6, ["x", "y"], bytes([1, 2] + [0] * 34), 0, None, 0)
+        b = GameEngine.from_cells(6, ["x", "y"], bytes([2, 1] + [0] * 34), 1, None, 0)
+        self.assertEqual(ob.canonical(6, 2, ob._pieces(a), 1)[0], ob.canonical(6, 2, ob._pieces(b), 2)[0])
+
+    def test_lookup_follows_orientation(self):
+        book = self.shelf.book(6, 2)
+        self.assertEqual(len(book), len(self.entries))
+        rng = random.Random(3)
+        for _ in range(20):
+            moves = []
+            game = _play(6, 2, moves)
+            while len(moves) < 2:
+                moves.append(rng.choice(game.get_legal_moves(game.current_player_num)))
+                game = _play(6, 2, moves)
+            base = book.lookup(game)
+            self.assertIsNotNone(base)
+            # The book move maps along with the board (early-game restriction included)
+            for fwd in ob._symmetries(6)[0]:
+                turned = _play(6, 2, [divmod(fwd[r * 6 + c], 6) for r, c in moves])
+                r, c = book.lookup(turned)
+                self.assertTrue(turned.is_valid_move(r, c, turned.current_player_id))
+                # ...to the same position up to symmetry
+                after = _play(6, 2, [divmod(fwd[x * 6 + y], 6) for x, y in moves] + [(r, c)])
+                self.assertEqual(ob.canonical(6, 2, ob._pieces(after), 1)[0],
+                                 ob.canonical(6, 2, ob._pieces(_play(6, 2, moves + [base])), 1)[0])
+            self.assertIsNone(book.lookup(_play(6, 2, moves + [base])))  # past the book depth
+
+        self.assertIsNone(self.shelf.lookup(GameEngine(8, ["a", "b"])))  # no book for 8x8
+        self.assertIsNone(self.shelf.lookup(GameEngine(6, ["a", "b", "c"])))
+
+    def test_bots_play_book_moves(self):
+        game = _play(6, 2, [(2, 2)])
+        expected = self.shelf.lookup(game)
+        self.assertEqual(AlphaBetaBot(time_budget=0.01, book=self.shelf).choose_move(game), expected)
+        self.assertEqual(MCTSBot(time_budget=0.01, book=self.shelf).choose_move(game), expected)
+
+    def test_unreadable_book_is_ignored(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            with open(os.path.join(tmp, ob.book_name(6, 2)), "wb") as f:
+                f.write(b"not a book")
+            self.assertIsNone(ob.BookShelf(tmp).lookup(GameEngine(6, ["a", "b"])))
+
+
+if __name__ == "__main__":
+    unittest.main()
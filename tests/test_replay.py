@@ -0,0 +1,58 @@
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "server"))
+
+from game_engine import GameEngine
+from lobby_store import LobbyStore
+from replay import Replay
+
+
+def _play_out(game, rng):
+    boards = [game.board]
+    while not game.winner:
+        r, c = rng.choice(game.get_legal_moves(game.current_player_num))
+        game.make_move(r, c, game.current_player_id)
+        boards.append(game.board)
+    return boards
+
+
+class TestReplay(unittest.TestCase):
+    def test_seek_matches_recorded_positions(self):
+        rng = random.Random(6)
+        game = GameEngine(size=8, players=["a", "b", "c"])
+        boards = _play_out(game, rng)
+        replay = Replay(game, every=5)
+
+        order = list(range(len(boards)))
+        rng.shuffle(order)
+        for i in order + list(range(len(boards))) + list(reversed(range(len(boards)))):
+            pos = replay.position(i)
+            self.assertEqual(pos["board"], boards[i])
+            self.assertEqual(pos["move_index"], i)
+        self.assertEqual(replay.position(len(replay))["winner"], game.winner)
+
+    def test_store_serves_finished_games_only(self):
+        store = LobbyStore()
+        lobby, host = store.create_lobby("alice", "6x6")
+        store.join_lobby(lobby.code, "bob")
+        store.start_lobby(lobby.code, host.player_id)
+        self.assertFalse(store.get_replay_position(lobby.code, 0)["ok"])
+
+        rng = random.Random(7)
+        while not lobby.game.winner:
+            game = lobby.game
+            r, c = rng.choice(game.get_legal_moves(game.current_player_num))
+            store.make_move(lobby.code, game.current_player_id, r, c)
+
+        n = len(lobby.game.history)
+        pos = store.get_replay_position(lobby.code, n)
+        self.assertEqual(pos["board"], lobby.game.board)
+        self.assertEqual(pos["last_move"], lobby.game.delta_to_dict(lobby.game.history[-1]))
+        self.assertFalse(store.get_replay_position(lobby.code, n + 1)["ok"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,195 @@
+import base64
+import os
+import pickle
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "server"))
+
+from game_engine import GameEngine
+from lobby_store import LobbyStore
+from sparse_engine import SparseGameEngine, engine_class
+
+
+def _random_game(cls, size, players, seed, cascade=True, moves=None):
+    rng = random.Random(seed)
+    game = cls(size, [f"p{i}" for i in range(players)])
+    game.cascade_enabled = cascade
+    while not game.winner and (moves is None or len(game.history) < moves):
+        r, c = rng.choice(game.get_legal_moves(game.current_player_num))
+        game.make_move(r, c, game.current_player_id)
+    return game
+
+
+class TestSparseEngine(unittest.TestCase):
+    def test_plays_like_game_engine(self):
+        rng = random.Random(17)
+        for size, players, cascade in [(6, 2, True), (9, 3, False), (13, 5, True), (17, 4, True)]:
+            ids = [f"p{i}" for i in range(players)]
+            dense, sparse = GameEngine(size, ids), SparseGameEngine(size, ids)
+            dense.cascade_enabled = sparse.cascade_enabled = cascade
+            sparse.debug = True
+            while not dense.winner:
+                legal = dense.get_legal_moves(dense.current_player_num)
+                self.assertEqual(sparse.get_legal_moves(sparse.current_player_num), legal)
+                r, c = rng.choice(legal)
+                self.assertEqual(sparse.make_move(r, c, sparse.current_player_id),
+                                 dense.make_move(r, c, dense.current_player_id))
+            self.assertEqual(sparse.get_state(), dense.get_state())
+            self.assertEqual(sparse.encode_board("packed"), dense.encode_board("packed"))
+
+            while dense.history:
+                dense.unmake_move()
+                sparse.unmake_move()
+                self.assertEqual(sparse.board_bytes(), dense.board_bytes())
+            self.assertEqual(sparse.get_state(), dense.get_state())
+
+    def test_threats_match_game_engine(self):
+        rng = random.Random(23)
+        for size, players in [(7, 2), (11, 4), (14, 6)]:
+            ids = [f"p{i}" for i in range(players)]
+            dense, sparse = GameEngine(size, ids), SparseGameEngine(size, ids)
+            seen = 0
+            while not dense.winner:
+                r, c = rng.choice(dense.get_legal_moves(dense.current_player_num))
+                dense.make_move(r, c, dense.current_player_id)
+                sparse.make_move(r, c, sparse.current_player_id)
+                self.assertEqual(sparse.threats(), dense.threats())
+                seen += sum(map(len, dense.threats().values()))
+                if rng.random() < 0.25:
+                    dense.unmake_move()
+                    sparse.unmake_move()
+                    self.assertEqual(sparse.threats(), dense.threats())
+            self.assertGreater(seen, 0)
+
+    def test_rebuild_copy_and_pickle(self):
+        game = _random_game(SparseGameEngine, 70, 6, seed=2, moves=400)
+        rebuilt = SparseGameEngine.from_cells(game.size, game.players, game.board_bytes(),
+                                              game.turn_idx, game.winner, game.version)
+        rebuilt._check_consistency()
+        self.assertEqual(rebuilt.board_bytes(), game.board_bytes())
+        self.assertEqual(rebuilt.get_state()["scores"], game.get_state()["scores"])
+
+        for other in (game.copy(), pickle.loads(pickle.dumps(game))):
+            r, c = other.get_legal_moves(other.current_player_num)[0]
+            other.make_move(r, c, other.current_player_id)
+            self.assertNotEqual(other.board_bytes(), game.board_bytes())
+        game._check_consistency()
+
+    def test_profile_matches_game_engine(self):
+        profiles = []
+        for cls in (GameEngine, SparseGameEngine):
+            game = cls(9, ["a", "b", "c"])
+            profiles.append(game.enable_profile())
+            rng = random.Random(8)
+            while not game.winner:
+                r, c = rng.choice(game.get_legal_moves(game.current_player_num))
+                game.make_move(r, c, game.current_player_id)
+        dense, sparse = profiles
+        for name in ("moves", "cascade_waves", "queue_pushes", "capture_checks", "neighbor_reads", "flips"):
+            self.assertEqual(getattr(sparse, name), getattr(dense, name), name)
+
+    def test_random_legal_move(self):
+        rng = random.Random(6)
+        # Mostly empty arena board: sampled without listing 65536 cells
+        game = SparseGameEngine(256, ["a", "b"])
+        game.make_move(0, 0, "a")
+        for _ in range(200):
+            r, c = game.random_legal_move(rng)
+            self.assertTrue(game.is_valid_move(r, c, "b"))  # never next to (0, 0) early on
+
+        # Nearly full board: falls back to the legal move list
+        game = _random_game(SparseGameEngine, 5, 2, seed=3, cascade=False, moves=23)
+        if not game.winner:
+            legal = game.get_legal_moves(game.current_player_num)
+            for _ in range(20):
+                self.assertIn(game.random_legal_move(rng), legal)
+
+    def test_shares_game_engine_state(self):
+        ids = ["a", "b"]
+        dense, sparse = vars(GameEngine(8, ids)), vars(SparseGameEngine(8, ids))
+        # Only the dense cell tables are missing; everything else comes from _init_common
+        self.assertEqual(set(dense) - set(sparse), {"_cells", "_masks", "_nbr_counts", "_nbr_lists", "_nbr_masks"})
+
+    def test_engine_class(self):
+        self.assertIs(engine_class(16), GameEngine)
+        self.assertIs(engine_class(64), SparseGameEngine)
+
+
+class TestGameView(unittest.TestCase):
+    def test_view_chunks_match_board(self):
+        for cls in (GameEngine, SparseGameEngine):
+            game = _random_game(cls, 40, 3, seed=4, moves=300)
+            board = game.board
+            view = game.get_view(10, 20, 15, 100)
+            self.assertEqual(view["view"], {"r": 10, "c": 20, "rows": 15, "cols": 20})
+            # Rows 10..24 and cols 20..39 overlap blocks (0..1, 1..2) of 16 cells
+            self.assertEqual([(ch["r"], ch["c"]) for ch in view["chunks"]],
+                             [(0, 16), (0, 32), (16, 16), (16, 32)])
+            for ch in view["chunks"]:
+                self.assertEqual(ch["board"], [row[ch["c"]:ch["c"] + ch["cols"]]
+                                               for row in board[ch["r"]:ch["r"] + ch["rows"]]])
+            self.assertEqual(view["chunks"][-1]["cols"], 8)  # clipped at the edge
+            self.assertNotIn("board", view)
+            self.assertEqual(game.get_view(50, 50, 10, 10)["chunks"], [])
+
+    def test_view_since_sends_changed_chunks_only(self):
+        game = _random_game(SparseGameEngine, 64, 4, seed=9, moves=50)
+        version = game.version
+        self.assertEqual(game.get_view(0, 0, 64, 64, since=version)["chunks"], [])
+
+        old = game.board
+        game.make_move(60, 3, game.current_player_id)
+        delta = game.history[-1]
+        view = game.get_view(0, 0, 64, 64, since=version, board_format="bytes")
+        self.assertEqual(view["since"], version)
+        touched = {(cell // 64 // 16 * 16, cell % 64 // 16 * 16) for cell in (delta.cell, *delta.flips)}
+        self.assertEqual({(ch["r"], ch["c"]) for ch in view["chunks"]}, touched)
+        # Unknown versions get every chunk of the view
+        full = game.get_view(0, 0, 32, 32, since=version + 5)
+        self.assertNotIn("since", full)
+        self.assertEqual(len(full["chunks"]), 4)
+        self.assertNotEqual(old, game.board)
+
+
+class TestArenaLobby(unittest.TestCase):
+    def test_arena_lobby(self):
+        store = LobbyStore(arena_max_players=12)
+        lobby, host = store.create_lobby("host", "128x128")
+        self.assertEqual(lobby.max_players, 12)
+        self.assertFalse(store.add_bot(lobby.code, host.player_id)["ok"])
+        for i in range(1, 8):
+            self.assertTrue(store.join_lobby(lobby.code, f"p{i}")["ok"])
+        store.start_lobby(lobby.code, host.player_id)
+        self.assertIsInstance(lobby.game, SparseGameEngine)
+
+        game = lobby.game
+        self.assertTrue(store.make_move(lobby.code, game.current_player_id, 100, 100)["ok"])
+        view = store.get_game_view(lobby.code, r=96, c=96, rows=20, cols=20, since=0, board_format="packed")
+        self.assertEqual(len(view["chunks"]), 1)
+        self.assertEqual(len(view["players_info"]), 8)
+
+    def test_arena_with_many_players_is_sent_as_bytes(self):
+        store = LobbyStore()
+        lobby, host = store.create_lobby("host", "64x64")
+        for i in range(1, 10):
+            self.assertTrue(store.join_lobby(lobby.code, f"p{i}")["ok"])
+        store.start_lobby(lobby.code, host.player_id)
+        game = lobby.game
+        # Players 1..7 in the top-left chunk, 8..10 in the bottom-right one
+        for k in range(10):
+            r, c = (2, 2 * k) if k < 7 else (60, 2 * k + 40)
+            self.assertTrue(store.make_move(lobby.code, game.current_player_id, r, c)["ok"])
+
+        view = store.get_game_view(lobby.code, board_format="packed")
+        self.assertEqual(view["board_format"], "bytes")
+        self.assertEqual(len(view["chunks"]), 16)
+        for ch in view["chunks"]:
+            self.assertEqual(base64.b64decode(ch["board"]),
+                             game.region_bytes(ch["r"], ch["c"], ch["rows"], ch["cols"]))
+        self.assertEqual(store.get_game_state(lobby.code, board_format="packed")["board_format"], "bytes")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,157 @@
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "server"))
+
+from lobby_store import LobbyStore
+import storage
+from storage import SQLiteBackend
+
+
+class _FailingConnection:
+    """Connection wrapper that fails the first statement starting with `prefix`."""
+
+    def __init__(self, conn, prefix):
+        self._conn = conn
+        self.prefix = prefix
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def execute(self, sql, *args):
+        if self.prefix and sql.startswith(self.prefix):
+            self.prefix = None
+            raise sqlite3.OperationalError("disk I/O error")
+        return self._conn.execute(sql, *args)
+
+
+class TestSQLiteBackend(unittest.TestCase):
+    """Two stores on one database stand in for two worker processes."""
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        path = os.path.join(self._tmp.name, "lobbies.db")
+        self.backends = [SQLiteBackend(path), SQLiteBackend(path)]
+        self.a, self.b = (LobbyStore(backend=be) for be in self.backends)
+
+    def tearDown(self):
+        for be in self.backends:
+            be.close()
+        self._tmp.cleanup()
+
+    def test_workers_share_lobbies_and_games(self):
+        lobby, host = self.a.create_lobby("alice", "8x8")
+        self.assertEqual([l["code"] for l in self.b.list_public()], [lobby.code])
+
+        bob = self.b.join_lobby(lobby.code, "bob")["player_id"]
+        self.assertEqual(self.a.get_public_state(lobby.code)["players_count"], 2)
+        self.assertTrue(self.a.start_lobby(lobby.code, host.player_id)["ok"])
+        self.assertEqual(self.b.list_public(), [])
+
+        # Players' requests land on either worker
+        rng = random.Random(4)
+        stores = [self.a, self.b]
+        for i in range(20):
+            store = stores[rng.randrange(2)]
+            state = store.get_game_state(lobby.code)
+            game = store.get_lobby(lobby.code).game
+            r, c = rng.choice(game.get_legal_moves(game.current_player_num))
+            self.assertTrue(store.make_move(lobby.code, state["current_player_id"], r, c)["ok"])
+
+        sa, sb = self.a.get_game_state(lobby.code), self.b.get_game_state(lobby.code)
+        self.assertEqual(sa["board"], sb["board"])
+        self.assertEqual(sa["version"], 20)
+        self.assertEqual(sa["etag"], sb["etag"])
+
+        self.b.leave_lobby(lobby.code, bob)
+        self.a.leave_lobby(lobby.code, host.player_id)
+        self.assertIsNone(self.b.get_game_state(lobby.code))
+
+    def test_moves_log_changed_cells_between_board_snapshots(self):
+        lobby, host = self.a.create_lobby("alice", "8x8")
+        self.b.join_lobby(lobby.code, "bob")
+        self.a.start_lobby(lobby.code, host.player_id)
+        conn = self.backends[0]._conn
+        stored_board = lambda: conn.execute("SELECT board FROM lobbies WHERE code = ?", (lobby.code,)).fetchone()[0]
+        logged = lambda: conn.execute("SELECT COUNT(*) FROM board_log WHERE code = ?", (lobby.code,)).fetchone()[0]
+        start = stored_board()
+
+        rng = random.Random(8)
+        stores = [self.a, self.b]
+        with mock.patch.object(storage, "SNAPSHOT_EVERY", 5):
+            for i in range(12):
+                k = rng.randrange(2)
+                state = stores[k].get_game_state(lobby.code)
+                game = stores[k].get_lobby(lobby.code).game
+                r, c = rng.choice(game.get_legal_moves(game.current_player_num))
+                self.assertTrue(stores[k].make_move(lobby.code, state["current_player_id"], r, c)["ok"])
+                # The board is written whole at the start and then after every 5 logged saves
+                self.assertEqual(logged(), (i + 1) % 6)
+                self.assertEqual(stored_board() == start, i < 5)
+                self.assertEqual(self.backends[1 - k].load(lobby.code)["board"], game.board_bytes())
+
+    def test_stale_worker_loses_compare_and_swap(self):
+        lobby, host = self.a.create_lobby("alice", "6x6")
+        self.b.join_lobby(lobby.code, "bob")
+        self.a.start_lobby(lobby.code, host.player_id)
+        la, lb = self.a.get_lobby(lobby.code), self.b.get_lobby(lobby.code)
+        self.a.get_game_state(lobby.code)
+        self.b.get_game_state(lobby.code)
+
+        # a moves; b's copy is now one version behind
+        pid = la.game.current_player_id
+        r, c = la.game.get_legal_moves(la.game.current_player_num)[0]
+        self.assertTrue(self.a.make_move(lobby.code, pid, r, c)["ok"])
+        self.assertFalse(self.backends[1].save(lb, lb.rev))
+
+        # b re-reads before acting, so the same move is now rejected as occupied
+        self.assertFalse(self.b.make_move(lobby.code, pid, r, c)["ok"])
+        self.assertEqual(self.b.get_game_state(lobby.code)["version"], 1)
+
+    def test_expired_players_are_dropped_by_any_worker(self):
+        lobby, host = self.a.create_lobby("alice", "6x6")
+        bob = self.b.join_lobby(lobby.code, "bob")["player_id"]
+        self.b.ping(lobby.code, bob)
+        self.backends[0].touch(lobby.code, host.player_id, 0.0)
+
+        self.b.cleanup()
+        state = self.a.get_public_state(lobby.code)
+        self.assertEqual([p["player_id"] for p in state["players"]], [bob])
+        self.assertTrue(state["players"][0]["is_host"])
+
+    def test_failed_write_rolls_back(self):
+        be = self.backends[0]
+        conn = be._conn
+        lobby, host = self.a.create_lobby("alice", "6x6")
+        for prefix, write in [("UPDATE lobbies", lambda: be.save(lobby, lobby.rev)),
+                              ("DELETE FROM presence", lambda: be.save(lobby, lobby.rev)),
+                              ("COMMIT", lambda: be.save(lobby, lobby.rev)),
+                              ("DELETE FROM presence", lambda: be.delete(lobby.code))]:
+            be._conn = _FailingConnection(conn, prefix)
+            with self.assertRaises(sqlite3.OperationalError):
+                write()
+            be._conn = conn
+            self.assertFalse(conn.in_transaction, prefix)
+            self.assertEqual(be.version(lobby.code), lobby.rev)
+
+        be.delete(lobby.code)
+        be._conn = _FailingConnection(conn, "INSERT INTO lobbies")
+        with self.assertRaises(sqlite3.OperationalError):
+            be.insert(lobby)
+        be._conn = conn
+        self.assertFalse(conn.in_transaction)
+        self.assertIsNone(self.backends[1].version(lobby.code))
+
+        # The connection still takes writes
+        self.assertTrue(be.insert(lobby))
+        self.assertTrue(be.save(lobby, lobby.rev))
+        self.assertEqual(self.backends[1].version(lobby.code), lobby.rev + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()